@@ -0,0 +1,236 @@
+"""Headless command line interface for AnnoQ.
+
+Runs dataset checks without a display: nothing here imports tkinter,
+PIL.ImageTk or ultralytics. Every command writes one JSON object per line
+to stdout so the output can be piped into other tools::
+
+    python annoq.py stats --yaml data.yaml
+    python annoq.py validate --yaml data.yaml --split val
+    python annoq.py export --yaml data.yaml --split train --out /tmp/subset --stop 1000
+    python annoq.py duplicates --yaml data.yaml --report duplicates.csv
+
+``--trace PATH`` (or ``$ANNOQ_TRACE``) records timing spans of the run and
+writes them to ``PATH`` as a Chrome trace.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+
+def emit(record):
+    sys.stdout.write(json.dumps(record) + "\n")
+    sys.stdout.flush()
+
+
+def open_datasets(yaml_path, split=None):
+    """Return the class names and a ``{split: YoloDataset}`` mapping."""
+    from yaml_dataset_loader import YamlDatasetLoader
+    from yolo_dataset import YoloDataset
+
+    loader = YamlDatasetLoader(yaml_path, verbose=False)
+    splits = loader.get_dataset_splits()
+    if split is not None:
+        if split not in splits:
+            raise SystemExit(f"Split '{split}' not found in {yaml_path}")
+        splits = [split]
+    class_names = loader.get_class_names()
+    datasets = {}
+    for name in splits:
+        paths = loader.get_paths(name)
+        datasets[name] = YoloDataset(paths["images"], paths["labels"], class_names)
+    return class_names, datasets
+
+
+def cmd_stats(args):
+    from stats import StatsEngine
+
+    _, datasets = open_datasets(args.yaml, args.split)
+    for split, ds in datasets.items():
+        engine = StatsEngine(ds, workers=args.workers)
+        stats = None
+        for done, total, stats in engine.iter_compute():
+            if args.progress and total:
+                emit({"event": "progress", "split": split, "done": done, "total": total})
+        emit(dict({"event": "stats", "split": split}, **stats))
+    return 0
+
+
+def cmd_pack(args):
+    import time
+
+    _, datasets = open_datasets(args.yaml, args.split)
+    for split, ds in datasets.items():
+        started = time.perf_counter()
+        pack = ds.label_pack(workers=args.workers)
+        emit({
+            "event": "pack",
+            "split": split,
+            "path": pack.path,
+            "images": len(pack),
+            "boxes": pack.box_count,
+            "seconds": time.perf_counter() - started,
+        })
+    return 0
+
+
+def cmd_validate(args):
+    from validation import validate_split
+
+    _, datasets = open_datasets(args.yaml, args.split)
+    errors = 0
+    for split, ds in datasets.items():
+        counts = {}
+        for finding in validate_split(ds, workers=args.workers):
+            counts[finding["kind"]] = counts.get(finding["kind"], 0) + 1
+            errors += finding["severity"] == "error"
+            emit(dict({"event": "finding", "split": split}, **finding))
+        emit({"event": "summary", "split": split, "counts": counts})
+    return 1 if errors else 0
+
+
+def cmd_export(args):
+    import export
+
+    class_names, datasets = open_datasets(args.yaml, args.split)
+    ds = datasets[args.split]
+    classes = None
+    if args.classes:
+        lookup = {name: i for i, name in enumerate(class_names)}
+        classes = []
+        for c in args.classes.split(","):
+            try:
+                classes.append(lookup[c] if c in lookup else int(c))
+            except ValueError:
+                # Exits with status 2 and the usage, like argparse's own errors
+                args.error(f"argument --classes: unknown class {c!r}, expected names from {class_names} or ids")
+    indices = export.select_indices(ds, args.start, args.stop, labeled=args.labeled, classes=classes)
+
+    def progress(done, total):
+        emit({"event": "progress", "split": args.split, "done": done, "total": total})
+
+    result = export.export_dataset(
+        ds,
+        args.out,
+        class_names,
+        indices=indices,
+        workers=args.workers or export.DEFAULT_WORKERS,
+        mode=args.mode,
+        progress=progress if args.progress else None,
+    )
+    emit(dict({"event": "exported", "split": args.split, "out": os.path.abspath(args.out)}, **result))
+    return 0
+
+
+def cmd_duplicates(args):
+    import duplicates
+
+    _, datasets = open_datasets(args.yaml, args.split)
+
+    def progress(split, done, total):
+        if args.progress and total:
+            emit({"event": "progress", "split": split, "done": done, "total": total})
+
+    groups = duplicates.find_duplicates(
+        datasets, distance=args.distance, workers=args.workers, progress=progress
+    )
+    for group in groups:
+        emit(dict({"event": "duplicates"}, **group))
+    if args.report:
+        duplicates.write_report(groups, args.report)
+    emit({
+        "event": "summary",
+        "groups": len(groups),
+        "leaking_groups": sum(g["leak"] for g in groups),
+        "images": sum(len(g["members"]) for g in groups),
+    })
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="annoq", description="AnnoQ headless dataset tools")
+    parser.add_argument(
+        "--trace", default=None, metavar="PATH", help="Write a Chrome trace of the run to PATH"
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_common(p, split_required=False):
+        p.add_argument("--yaml", required=True, help="Path to YAML dataset config file")
+        p.add_argument(
+            "--split",
+            required=split_required,
+            default=None,
+            help="Dataset split" + ("" if split_required else " (default: all splits)"),
+        )
+        p.add_argument(
+            "--workers", type=int, default=None, help="Worker processes (default: all cores)"
+        )
+
+    p = sub.add_parser("stats", help="Class counts and background images per split")
+    add_common(p)
+    p.add_argument("--progress", action="store_true", help="Also emit progress records")
+    p.set_defaults(func=cmd_stats)
+
+    p = sub.add_parser("pack", help="Build or update the binary label pack of each split")
+    add_common(p)
+    p.set_defaults(func=cmd_pack)
+
+    p = sub.add_parser("validate", help="Check label files; exits 1 if errors were found")
+    add_common(p)
+    p.set_defaults(func=cmd_validate)
+
+    p = sub.add_parser("export", help="Copy a range of a split to a new dataset")
+    add_common(p, split_required=True)
+    p.add_argument("--out", required=True, help="Directory to create for the export")
+    p.add_argument("--start", type=int, default=0, help="First image index")
+    p.add_argument("--stop", type=int, default=None, help="Stop before this image index")
+    p.add_argument(
+        "--mode",
+        choices=["copy", "reflink", "hardlink"],
+        default="copy",
+        help="How to place images; link modes fall back to copying (default: copy)",
+    )
+    p.add_argument(
+        "--classes", default=None, help="Only images with these classes (comma-separated names or ids)"
+    )
+    labeled = p.add_mutually_exclusive_group()
+    labeled.add_argument(
+        "--labeled", dest="labeled", action="store_true", default=None, help="Only labeled images"
+    )
+    labeled.add_argument(
+        "--unlabeled", dest="labeled", action="store_false", help="Only images without labels"
+    )
+    p.add_argument("--progress", action="store_true", help="Also emit progress records")
+    p.set_defaults(func=cmd_export, error=p.error)
+
+    p = sub.add_parser("duplicates", help="Find duplicate images within and across splits")
+    add_common(p)
+    p.add_argument(
+        "--distance",
+        type=int,
+        default=4,
+        help="Largest perceptual hash distance (in bits) of near duplicates (default: 4)",
+    )
+    p.add_argument("--report", default=None, help="Also write the groups to PATH (.csv or .json)")
+    p.add_argument("--progress", action="store_true", help="Also emit progress records")
+    p.set_defaults(func=cmd_duplicates)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    import tracing
+
+    if not tracing.enable_from_env(args.trace):
+        return args.func(args)
+    try:
+        return args.func(args)
+    finally:
+        tracing.TRACER.save()
+        tracing.TRACER.disable()
+        tracing.TRACER.clear()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
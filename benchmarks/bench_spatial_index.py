@@ -0,0 +1,56 @@
+"""Compare BoxIndex hit-testing with the linear smallest_box_containing_point.
+
+Run from the repository root::
+
+    python benchmarks/bench_spatial_index.py
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bounding_box import BoundingBox, smallest_box_containing_point
+from spatial_index import BoxIndex
+
+IMG_W, IMG_H = 4000, 3000
+
+
+def make_boxes(n, rng):
+    # Typical dense-scene boxes: a few percent of the image on each side
+    return [
+        BoundingBox(0, rng.random(), rng.random(), rng.uniform(0.002, 0.05), rng.uniform(0.002, 0.05))
+        for _ in range(n)
+    ]
+
+
+def time_queries(fn, points):
+    start = time.perf_counter()
+    for x, y in points:
+        fn(x, y)
+    return (time.perf_counter() - start) / len(points)
+
+
+def main():
+    rng = random.Random(0)
+    print(f"{'boxes':>8} {'build ms':>10} {'linear us':>12} {'index us':>10} {'speedup':>8}")
+    for n in (10, 1000, 50000):
+        boxes = make_boxes(n, rng)
+        points = [(rng.uniform(0, IMG_W), rng.uniform(0, IMG_H)) for _ in range(200)]
+        start = time.perf_counter()
+        index = BoxIndex(boxes, IMG_W, IMG_H)
+        build = time.perf_counter() - start
+        linear = time_queries(
+            lambda x, y: smallest_box_containing_point(boxes, x, y, IMG_W, IMG_H), points
+        )
+        indexed = time_queries(index.smallest_containing, points)
+        print(
+            f"{n:>8} {build * 1e3:>10.2f} {linear * 1e6:>12.1f} {indexed * 1e6:>10.1f} "
+            f"{linear / indexed:>7.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
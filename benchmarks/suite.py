@@ -0,0 +1,405 @@
+"""Benchmark suite for the dataset, labelling and rendering hot paths.
+
+Builds a synthetic YOLO dataset, times each path and writes the results as
+JSON; ``compare`` checks a result file against a saved baseline and exits
+with status 1 if anything got slower than the threshold. Nothing here needs
+a display. Run from the repository root::
+
+    python benchmarks/suite.py run --images 2000 --boxes 20 --out baseline.json
+    python benchmarks/suite.py run --images 2000 --boxes 20 --out current.json
+    python benchmarks/suite.py compare baseline.json current.json
+
+Per-dataset caches are kept in a temporary directory, so the real cache
+under ``~/.cache/annoq`` is never touched.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import cache
+from bounding_box import smallest_box_containing_point
+from coords import canvas_to_image_coords, image_to_canvas_coords
+from render_cache import QUALITY_FILTER, ViewportRenderer
+from spatial_index import BoxIndex
+from stats import StatsEngine
+from yolo_dataset import YoloDataset
+
+DEFAULT_IMAGES = 1000
+DEFAULT_BOXES = 20
+DEFAULT_SIZE = (1280, 960)
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.25
+# Differences below this are treated as noise by compare
+NOISE_FLOOR_SECONDS = 0.001
+# Upper bound on images touched by the per-image benchmarks
+SAMPLE = 200
+
+
+def make_dataset(root, images=DEFAULT_IMAGES, boxes=DEFAULT_BOXES, size=DEFAULT_SIZE,
+                 classes=5, background=0.1, seed=0):
+    """Write a synthetic dataset under ``root`` and return its class names.
+
+    Every image shares one encoded JPEG of ``size`` so generation stays fast;
+    each label file gets ``boxes`` random boxes, except for a ``background``
+    fraction of images whose label file is empty.
+    """
+    rng = random.Random(seed)
+    img_dir = os.path.join(root, "images")
+    lbl_dir = os.path.join(root, "labels")
+    os.makedirs(img_dir)
+    os.makedirs(lbl_dir)
+    w, h = size
+    x = np.linspace(0, 255, w, dtype=np.float32)
+    y = np.linspace(0, 255, h, dtype=np.float32)
+    pixels = np.stack(np.broadcast_arrays(x[None, :], y[:, None], (x[None, :] + y[:, None]) / 2), axis=-1)
+    noise = np.random.default_rng(seed).integers(0, 32, pixels.shape)
+    ok, encoded = cv2.imencode(".jpg", (pixels + noise).clip(0, 255).astype(np.uint8))
+    if not ok:
+        raise RuntimeError("Could not encode the synthetic image")
+    data = encoded.tobytes()
+    for i in range(images):
+        name = f"img_{i:07d}"
+        with open(os.path.join(img_dir, name + ".jpg"), "wb") as f:
+            f.write(data)
+        lines = []
+        if rng.random() >= background:
+            for _ in range(boxes):
+                bw, bh = rng.uniform(0.01, 0.3), rng.uniform(0.01, 0.3)
+                lines.append(
+                    f"{rng.randrange(classes)} {rng.uniform(bw / 2, 1 - bw / 2):.6f} "
+                    f"{rng.uniform(bh / 2, 1 - bh / 2):.6f} {bw:.6f} {bh:.6f}\n"
+                )
+        with open(os.path.join(lbl_dir, name + ".txt"), "w") as f:
+            f.writelines(lines)
+    return [f"class_{c}" for c in range(classes)]
+
+
+def measure(fn, repeat, setup=None, ops=1):
+    """Time ``fn()`` ``repeat`` times, calling ``setup()`` untimed before
+    each run. ``ops`` is the number of operations one call performs."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    median = statistics.median(times)
+    return {
+        "min": min(times),
+        "median": median,
+        "mean": statistics.fmean(times),
+        "repeat": repeat,
+        "ops": ops,
+        "per_op_us": median / ops * 1e6,
+    }
+
+
+class Context:
+    """State shared by the benchmarks of one run."""
+
+    def __init__(self, root, class_names, repeat, workers, size):
+        self.root = root
+        self.image_dir = os.path.join(root, "images")
+        self.label_dir = os.path.join(root, "labels")
+        self.class_names = class_names
+        self.repeat = repeat
+        self.workers = workers
+        self.size = size
+        self.rng = random.Random(1)
+
+    def dataset(self):
+        return YoloDataset(self.image_dir, self.label_dir, self.class_names)
+
+    def clear_caches(self):
+        shutil.rmtree(cache.CACHE_ROOT, ignore_errors=True)
+
+    def sample(self, total):
+        return list(range(0, total, max(1, total // SAMPLE)))[:SAMPLE]
+
+
+def bench_dataset_scan(ctx):
+    return {
+        "dataset_scan_cold": measure(ctx.dataset, ctx.repeat, setup=ctx.clear_caches),
+        "dataset_scan_warm": measure(ctx.dataset, ctx.repeat),
+    }
+
+
+def bench_labels(ctx):
+    ds = ctx.dataset()
+    indices = ctx.sample(ds.total_images())
+    loaded = {idx: ds.load_labels(idx) for idx in indices}
+
+    def load():
+        for idx in indices:
+            ds.load_labels(idx)
+
+    def save():
+        for idx in indices:
+            ds.save_labels(loaded[idx], idx)
+
+    return {
+        "load_labels": measure(load, ctx.repeat, ops=len(indices)),
+        "save_labels": measure(save, ctx.repeat, ops=len(indices)),
+    }
+
+
+def bench_compute_stats(ctx):
+    ds = ctx.dataset()
+
+    def compute():
+        StatsEngine(ds, workers=ctx.workers).compute()
+
+    def drop_stats_cache():
+        os.remove(StatsEngine(ds).cache_path)
+
+    compute()
+    return {
+        "compute_stats_cold": measure(compute, ctx.repeat, setup=drop_stats_cache),
+        "compute_stats_warm": measure(compute, ctx.repeat),
+    }
+
+
+def bench_hit_testing(ctx):
+    ds = ctx.dataset()
+    # The image with the most boxes
+    boxes = max((ds.load_labels(idx) for idx in ctx.sample(ds.total_images())), key=len)
+    w, h = ctx.size
+    points = [(ctx.rng.uniform(0, w), ctx.rng.uniform(0, h)) for _ in range(1000)]
+
+    def linear():
+        for x, y in points:
+            smallest_box_containing_point(boxes, x, y, w, h)
+
+    index = BoxIndex(boxes, w, h)
+
+    def indexed():
+        for x, y in points:
+            index.smallest_containing(x, y)
+
+    return {
+        "smallest_box_containing_point": measure(linear, ctx.repeat, ops=len(points)),
+        "box_index_smallest_containing": measure(indexed, ctx.repeat, ops=len(points)),
+    }
+
+
+def bench_coords(ctx):
+    points = [(ctx.rng.uniform(0, 1000), ctx.rng.uniform(0, 1000)) for _ in range(10000)]
+    xs = np.array([p[0] for p in points])
+    ys = np.array([p[1] for p in points])
+    args = (2.5, -120.0, -80.0, 48.0, 32.0)
+
+    def scalar():
+        for x, y in points:
+            canvas_to_image_coords(*image_to_canvas_coords(x, y, *args), *args)
+
+    def vectorised():
+        canvas_to_image_coords(*image_to_canvas_coords(xs, ys, *args), *args)
+
+    return {
+        "coords_scalar": measure(scalar, ctx.repeat, ops=len(points)),
+        "coords_vectorised": measure(vectorised, ctx.repeat, ops=len(points)),
+    }
+
+
+def bench_render(ctx):
+    image = Image.open(os.path.join(ctx.image_dir, sorted(os.listdir(ctx.image_dir))[0]))
+    image = image.convert("RGB")
+    view_w, view_h = 1600, 900
+    zoom = 2.0
+    ox, oy = image.width // 4, image.height // 4
+    box = (ox / zoom, oy / zoom, (ox + view_w) / zoom, (oy + view_h) / zoom)
+    state = {}
+
+    def crop_resize():
+        # What redraw_image did per event before tiles: crop, then resize
+        image.crop(tuple(int(v) for v in box)).resize((view_w, view_h), QUALITY_FILTER)
+
+    def new_renderer():
+        state["renderer"] = ViewportRenderer(image)
+
+    def render(fast):
+        return lambda: state["renderer"].render(ox, oy, view_w, view_h, zoom, fast)
+
+    results = {
+        "render_crop_resize": measure(crop_resize, ctx.repeat),
+        "render_tiles_fast_cold": measure(render(True), ctx.repeat, setup=new_renderer),
+        "render_tiles_quality_cold": measure(render(False), ctx.repeat, setup=new_renderer),
+    }
+    new_renderer()
+    render(False)()
+    results["render_tiles_warm"] = measure(render(False), ctx.repeat)
+    return results
+
+
+def bench_export(ctx):
+    import export
+
+    ds = ctx.dataset()
+    out = os.path.join(ctx.root, "export")
+
+    def run():
+        export.export_dataset(ds, out, ctx.class_names, workers=ctx.workers or export.DEFAULT_WORKERS)
+
+    def clean():
+        shutil.rmtree(out, ignore_errors=True)
+
+    results = {"export_copy": measure(run, ctx.repeat, setup=clean, ops=ds.total_images())}
+    clean()
+    return results
+
+
+BENCHMARKS = {
+    "dataset_scan": bench_dataset_scan,
+    "labels": bench_labels,
+    "compute_stats": bench_compute_stats,
+    "hit_testing": bench_hit_testing,
+    "coords": bench_coords,
+    "render": bench_render,
+    "export": bench_export,
+}
+
+
+def run_suite(images=DEFAULT_IMAGES, boxes=DEFAULT_BOXES, size=DEFAULT_SIZE,
+              repeat=DEFAULT_REPEAT, workers=None, only=None, seed=0, progress=None):
+    """Run the benchmark groups in ``only`` (all by default) on a fresh
+    synthetic dataset and return the result document."""
+    groups = list(BENCHMARKS) if not only else list(only)
+    unknown = [g for g in groups if g not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmark(s) {unknown}, expected some of {list(BENCHMARKS)}")
+    results = {}
+    saved_root = cache.CACHE_ROOT
+    with tempfile.TemporaryDirectory(prefix="annoq-bench-") as tmp:
+        cache.CACHE_ROOT = os.path.join(tmp, "cache")
+        try:
+            root = os.path.join(tmp, "dataset")
+            class_names = make_dataset(root, images, boxes, size, seed=seed)
+            ctx = Context(root, class_names, repeat, workers, size)
+            for group in groups:
+                if progress:
+                    progress(group)
+                results.update(BENCHMARKS[group](ctx))
+        finally:
+            cache.CACHE_ROOT = saved_root
+    return {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "images": images,
+            "boxes": boxes,
+            "size": list(size),
+            "repeat": repeat,
+            "workers": workers,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD, noise_floor=NOISE_FLOOR_SECONDS):
+    """Compare the best times of two result documents.
+
+    Returns one row per benchmark present in both, as ``(name, baseline
+    seconds, current seconds, ratio, regressed)``. A benchmark regressed if
+    it is more than ``threshold`` slower and by more than ``noise_floor``.
+    """
+    rows = []
+    for name, base in baseline["results"].items():
+        cur = current["results"].get(name)
+        if cur is None:
+            continue
+        before, after = base["min"], cur["min"]
+        ratio = after / before if before else float("inf")
+        regressed = ratio > 1 + threshold and after - before > noise_floor
+        rows.append((name, before, after, ratio, regressed))
+    return rows
+
+
+def cmd_run(args):
+    size = tuple(int(v) for v in args.size.lower().split("x"))
+    doc = run_suite(
+        images=args.images,
+        boxes=args.boxes,
+        size=size,
+        repeat=args.repeat,
+        workers=args.workers,
+        only=args.only.split(",") if args.only else None,
+        seed=args.seed,
+        progress=lambda group: print(f"running {group}...", file=sys.stderr),
+    )
+    text = json.dumps(doc, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+def cmd_compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows = compare(baseline, current, args.threshold)
+    print(f"{'benchmark':<32} {'baseline ms':>12} {'current ms':>12} {'ratio':>7}")
+    for name, before, after, ratio, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<32} {before * 1e3:>12.3f} {after * 1e3:>12.3f} {ratio:>7.2f}{flag}")
+    missing = sorted(set(baseline["results"]) - set(current["results"]))
+    if missing:
+        print(f"not in current results: {', '.join(missing)}")
+    return 1 if any(row[4] for row in rows) else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AnnoQ benchmark suite")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="Run the benchmarks on a synthetic dataset")
+    p.add_argument("--images", type=int, default=DEFAULT_IMAGES, help="Number of images")
+    p.add_argument("--boxes", type=int, default=DEFAULT_BOXES, help="Boxes per labelled image")
+    p.add_argument(
+        "--size", default="x".join(map(str, DEFAULT_SIZE)), help="Image size as WIDTHxHEIGHT"
+    )
+    p.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Timed runs per benchmark")
+    p.add_argument("--workers", type=int, default=None, help="Worker processes/threads")
+    p.add_argument("--only", default=None, help=f"Comma-separated groups from {', '.join(BENCHMARKS)}")
+    p.add_argument("--seed", type=int, default=0, help="Seed for the synthetic labels")
+    p.add_argument("--out", default=None, help="Write JSON here instead of stdout")
+    p.set_defaults(func=cmd_run)
+
+    p = sub.add_parser("compare", help="Flag regressions against a baseline; exits 1 if any")
+    p.add_argument("baseline", help="Baseline result JSON")
+    p.add_argument("current", help="Result JSON to check")
+    p.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help=f"Allowed slowdown as a fraction (default: {DEFAULT_THRESHOLD})",
+    )
+    p.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,19 @@
 # bounding_box.py
 
+import functools
 import random
 
+
+@functools.lru_cache(maxsize=None)
+def class_color(class_id):
+    """Return the display colour of ``class_id``.
+
+    Uses a private ``random.Random`` so the colour matches what seeding the
+    global generator used to produce, without reseeding it for every box.
+    """
+    return "#{:06x}".format(random.Random(class_id).randint(0x111111, 0xFFFFFF))
+
+
 class BoundingBox:
     def __init__(self, class_id, x_center, y_center, width, height, class_name=""):
         self.class_id = class_id
@@ -13,8 +25,7 @@ class BoundingBox:
         self.color = self._generate_color(class_id)
 
     def _generate_color(self, seed):
-        random.seed(seed)
-        return "#{:06x}".format(random.randint(0x111111, 0xFFFFFF))
+        return class_color(seed)
 
     def to_yolo_format(self):
         return f"{self.class_id} {self.x_center:.6f} {self.y_center:.6f} {self.width:.6f} {self.height:.6f}"
@@ -0,0 +1,194 @@
+"""Columnar storage for the boxes of one image.
+
+``BoxArray`` keeps class ids and normalised ``xc/yc/w/h`` in parallel
+NumPy arrays so rendering, hit testing and label I/O can work on a whole
+image at once instead of looping over :class:`BoundingBox` objects.
+"""
+
+import numpy as np
+
+import storage
+from bounding_box import BoundingBox, class_color
+
+
+def _empty(dtype):
+    return np.empty(0, dtype=dtype)
+
+
+class BoxArray:
+    """Boxes of one image as parallel arrays.
+
+    Coordinates are ``float32`` by default, which is enough to round-trip
+    the six decimals of the YOLO text format; :meth:`to_boxes` restores
+    them to the values parsing the text gives. Label text of one image is
+    parsed as ``float64``, and ``dtype=np.float64`` should also be used when
+    the values come from edited :class:`BoundingBox` objects and must
+    produce exactly the same pixel rects.
+    """
+
+    def __init__(self, class_ids=None, xc=None, yc=None, w=None, h=None, dtype=np.float32):
+        self.class_ids = np.asarray(class_ids if class_ids is not None else _empty(np.int32), dtype=np.int32)
+        self.xc = np.asarray(xc if xc is not None else _empty(dtype), dtype=dtype)
+        self.yc = np.asarray(yc if yc is not None else _empty(dtype), dtype=dtype)
+        self.w = np.asarray(w if w is not None else _empty(dtype), dtype=dtype)
+        self.h = np.asarray(h if h is not None else _empty(dtype), dtype=dtype)
+        n = len(self.class_ids)
+        if not all(len(a) == n for a in (self.xc, self.yc, self.w, self.h)):
+            raise ValueError("BoxArray columns must have the same length")
+
+    def __len__(self):
+        return len(self.class_ids)
+
+    def __getitem__(self, key):
+        """Return a new ``BoxArray`` selected by a slice, mask or index array."""
+        if isinstance(key, (int, np.integer)):
+            key = slice(key, key + 1 or None)
+        return BoxArray(
+            self.class_ids[key], self.xc[key], self.yc[key], self.w[key], self.h[key], self.xc.dtype
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, BoxArray):
+            return NotImplemented
+        return all(
+            np.array_equal(a, b)
+            for a, b in zip(
+                (self.class_ids, self.xc, self.yc, self.w, self.h),
+                (other.class_ids, other.xc, other.yc, other.w, other.h),
+            )
+        )
+
+    # --- conversion -----------------------------------------------------
+
+    @classmethod
+    def from_yolo_text(cls, text, dtype=np.float64):
+        """Parse YOLO label text. Lines that do not have exactly five fields
+        or fail to parse are skipped."""
+        lines = [line for line in text.splitlines() if line.strip()]
+        if all(len(line.split()) == 5 for line in lines):
+            # Fast path: every non-empty line has five fields
+            cols = np.array(text.split(), dtype=str).reshape(-1, 5)
+            try:
+                return cls(
+                    cols[:, 0].astype(np.int32),
+                    *(cols[:, i].astype(np.float64) for i in range(1, 5)),
+                    dtype,
+                )
+            except (ValueError, OverflowError):
+                pass
+        limits = np.iinfo(np.int32)
+        rows = []
+        for line in lines:
+            parts = line.split()
+            if len(parts) != 5:
+                continue
+            try:
+                row = (int(parts[0]), *map(float, parts[1:]))
+            except ValueError:
+                continue
+            # Class ids are stored as int32
+            if limits.min <= row[0] <= limits.max:
+                rows.append(row)
+        if not rows:
+            return cls(dtype=dtype)
+        class_ids, xc, yc, w, h = zip(*rows)
+        return cls(class_ids, xc, yc, w, h, dtype)
+
+    @classmethod
+    def from_file(cls, path, dtype=np.float64):
+        with storage.open_file(path) as f:
+            return cls.from_yolo_text(f.read(), dtype)
+
+    def to_yolo_text(self):
+        """Serialise to YOLO text, one ``\\n``-terminated line per box, in the
+        same format as :meth:`BoundingBox.to_yolo_format`."""
+        return "".join(
+            f"{c} {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n"
+            for c, x, y, w, h in zip(
+                self.class_ids.tolist(),
+                self.xc.tolist(),
+                self.yc.tolist(),
+                self.w.tolist(),
+                self.h.tolist(),
+            )
+        )
+
+    @classmethod
+    def from_boxes(cls, boxes, dtype=np.float32):
+        boxes = list(boxes)
+        if not boxes:
+            return cls(dtype=dtype)
+        return cls(
+            [b.class_id for b in boxes],
+            [b.x_center for b in boxes],
+            [b.y_center for b in boxes],
+            [b.width for b in boxes],
+            [b.height for b in boxes],
+            dtype,
+        )
+
+    def to_boxes(self, class_names=()):
+        """Materialise editable :class:`BoundingBox` objects.
+
+        ``float32`` columns are rounded back to the six decimals of the
+        label text, so the boxes equal those parsed from the file.
+        """
+        n_names = len(class_names)
+        columns = (self.xc, self.yc, self.w, self.h)
+        if self.xc.dtype == np.float32:
+            columns = (np.rint(c.astype(np.float64) * 1e6) / 1e6 for c in columns)
+        return [
+            BoundingBox(c, x, y, w, h, class_names[c] if c < n_names else str(c))
+            for c, x, y, w, h in zip(self.class_ids.tolist(), *(c.tolist() for c in columns))
+        ]
+
+    # --- geometry -------------------------------------------------------
+
+    def to_pixel_rects(self, img_w, img_h):
+        """Return an ``(n, 4)`` int array of ``x1, y1, x2, y2`` pixel rects,
+        truncated like :meth:`BoundingBox.to_pixel_rect`."""
+        xc = self.xc.astype(np.float64)
+        yc = self.yc.astype(np.float64)
+        hw = self.w.astype(np.float64) / 2
+        hh = self.h.astype(np.float64) / 2
+        rects = np.stack(
+            ((xc - hw) * img_w, (yc - hh) * img_h, (xc + hw) * img_w, (yc + hh) * img_h),
+            axis=1,
+        )
+        return np.trunc(rects).astype(np.int64)
+
+    def contains_point(self, x, y, img_w, img_h):
+        """Boolean mask of the boxes whose pixel rect contains ``(x, y)``."""
+        r = self.to_pixel_rects(img_w, img_h)
+        return (r[:, 0] <= x) & (x <= r[:, 2]) & (r[:, 1] <= y) & (y <= r[:, 3])
+
+    def areas(self):
+        """Normalised box areas (``w * h``)."""
+        return self.w * self.h
+
+    def smallest_containing(self, x, y, img_w, img_h):
+        """Index of the smallest box containing ``(x, y)``, or ``None``.
+
+        Ties go to the earliest box, as with
+        :func:`bounding_box.smallest_box_containing_point`.
+        """
+        mask = self.contains_point(x, y, img_w, img_h)
+        if not mask.any():
+            return None
+        candidates = np.flatnonzero(mask)
+        return int(candidates[np.argmin(self.areas()[candidates])])
+
+    def clip(self):
+        """Return a copy with every box clipped to the image bounds."""
+        x1 = np.clip(self.xc - self.w / 2, 0, 1)
+        y1 = np.clip(self.yc - self.h / 2, 0, 1)
+        x2 = np.clip(self.xc + self.w / 2, 0, 1)
+        y2 = np.clip(self.yc + self.h / 2, 0, 1)
+        return BoxArray(
+            self.class_ids.copy(), (x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1, self.xc.dtype
+        )
+
+    def colors(self):
+        """Display colour of every box, from a per-class lookup table."""
+        table = {c: class_color(c) for c in np.unique(self.class_ids).tolist()}
+        return [table[c] for c in self.class_ids.tolist()]
@@ -0,0 +1,90 @@
+"""Retained-mode drawing of bounding boxes on a Tk canvas."""
+
+BOX_TAG = "box"
+OUTLINE_WIDTH = 4
+
+
+class _BoxItems:
+    __slots__ = ("box", "rect_id", "text_id", "rect", "style")
+
+    def __init__(self, box, rect_id, text_id, rect, style):
+        self.box = box
+        self.rect_id = rect_id
+        self.text_id = text_id
+        self.rect = rect
+        self.style = style
+
+
+class BoxLayer:
+    """Keep one rectangle and one label item per box on ``canvas``.
+
+    Items are created the first time a box is shown and afterwards only
+    moved with ``coords`` or restyled with ``itemconfig`` when the box's
+    canvas rectangle, colour or class name actually changed. Boxes are
+    tracked by identity, so the caller must pass the same objects it edits.
+    """
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self._items = {}
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, box):
+        return id(box) in self._items
+
+    def sync(self, boxes, rects):
+        """Show exactly ``boxes``, placing each at the matching canvas
+        rectangle ``(x1, y1, x2, y2)`` from ``rects``."""
+        shown = set()
+        for box, rect in zip(boxes, rects):
+            shown.add(id(box))
+            self.update(box, rect)
+        for key in [k for k in self._items if k not in shown]:
+            self._delete(key)
+
+    def update(self, box, rect):
+        """Create or update the items of a single ``box``."""
+        style = (box.color, box.class_name)
+        items = self._items.get(id(box))
+        if items is None:
+            self._create(box, rect, style)
+            return
+        if items.rect != rect:
+            x1, y1, x2, y2 = rect
+            self.canvas.coords(items.rect_id, x1, y1, x2, y2)
+            self.canvas.coords(items.text_id, x1 + 5, y1 + 10)
+            items.rect = rect
+        if items.style != style:
+            self.canvas.itemconfig(items.rect_id, outline=box.color)
+            self.canvas.itemconfig(items.text_id, text=box.class_name, fill=box.color)
+            items.style = style
+
+    def move(self, dx, dy):
+        """Translate every box by ``(dx, dy)`` canvas pixels with a single
+        ``move`` call, e.g. while panning."""
+        if not (dx or dy):
+            return
+        self.canvas.move(BOX_TAG, dx, dy)
+        for items in self._items.values():
+            x1, y1, x2, y2 = items.rect
+            items.rect = (x1 + dx, y1 + dy, x2 + dx, y2 + dy)
+
+    def clear(self):
+        for key in list(self._items):
+            self._delete(key)
+
+    def _create(self, box, rect, style):
+        x1, y1, x2, y2 = rect
+        rect_id = self.canvas.create_rectangle(
+            x1, y1, x2, y2, outline=box.color, width=OUTLINE_WIDTH, tag=BOX_TAG
+        )
+        text_id = self.canvas.create_text(
+            x1 + 5, y1 + 10, text=box.class_name, fill=box.color, anchor="nw", tag=BOX_TAG
+        )
+        self._items[id(box)] = _BoxItems(box, rect_id, text_id, rect, style)
+
+    def _delete(self, key):
+        items = self._items.pop(key)
+        self.canvas.delete(items.rect_id, items.text_id)
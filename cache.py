@@ -1,3 +1,4 @@
+import hashlib
 import json
 import os
 
@@ -5,6 +6,22 @@ import os
 CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".annoq_cache.json")
 MAX_ENTRIES = 10
 
+# Per-dataset caches (stats, manifests, ...) live under this directory,
+# one sub-directory per dataset directory. Override with $ANNOQ_CACHE_DIR.
+CACHE_ROOT = os.environ.get(
+    "ANNOQ_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "annoq")
+)
+
+
+def dataset_cache_dir(path):
+    """Return (and create) the cache directory for the dataset at ``path``."""
+    path = os.path.abspath(path)
+    digest = hashlib.sha1(path.encode("utf-8")).hexdigest()[:16]
+    name = f"{os.path.basename(path) or 'root'}-{digest}"
+    cache_dir = os.path.join(CACHE_ROOT, name)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
 
 def _read_cache():
     if os.path.exists(CACHE_PATH):
@@ -0,0 +1,294 @@
+"""Inverted index from class id to the images containing it.
+
+For every class the index holds the sorted indices of the images with at
+least one box of that class and the number of such boxes per image; for
+every image it holds the total box count. Filters such as "images with
+class X", "background images" or "images with more than K boxes" are then
+array lookups rather than a pass over the label files.
+
+The index is derived from a split's :class:`~label_pack.LabelPack` and
+saved next to it (``class_index.npz``) together with a fingerprint of the
+label file stats the pack was built from, so it is only rebuilt when the
+pack changed. Saved labels are applied with :meth:`ClassIndex.update`,
+images added to or removed from the split with :meth:`ClassIndex.reindex`,
+and both are written back by :meth:`ClassIndex.save`.
+"""
+
+import bisect
+import hashlib
+import os
+import threading
+from collections import Counter
+
+import numpy as np
+
+INDEX_NAME = "class_index.npz"
+INDEX_VERSION = 1
+
+
+def fingerprint(pack):
+    """Digest of the image names and label file stats ``pack`` was built
+    from; the pack must have been saved."""
+    digest = hashlib.sha1()
+    digest.update(f"{INDEX_VERSION}:{len(pack)}".encode())
+    digest.update("\0".join(pack.names).encode("utf-8"))
+    digest.update(np.ascontiguousarray(pack.label_sizes).tobytes())
+    digest.update(np.ascontiguousarray(pack.label_mtimes).tobytes())
+    return digest.hexdigest()
+
+
+class ClassIndex:
+    """See the module docstring. Open with :meth:`open`."""
+
+    def __init__(self, box_counts, classes, fingerprint=None, path=None):
+        self.box_counts = np.array(box_counts, dtype=np.int32)
+        # class id -> (sorted image indices, box counts of that class)
+        self._classes = dict(classes)
+        self._overrides = {}
+        # Rows moved since the index was saved
+        self._reindexed = False
+        self._lock = threading.RLock()
+        self.fingerprint = fingerprint
+        self.path = path
+
+    def __len__(self):
+        return len(self.box_counts)
+
+    @property
+    def dirty(self):
+        return bool(self._overrides or self._reindexed)
+
+    # --- building -------------------------------------------------------
+
+    @classmethod
+    def build(cls, pack):
+        """Build the index from the saved columns of ``pack``."""
+        if pack.dirty:
+            pack.save()
+        n = len(pack)
+        box_counts = np.diff(np.asarray(pack.offsets)).astype(np.int32)
+        # One key per (class, image) pair, sorted by class then image
+        keys = np.asarray(pack.class_ids, dtype=np.int64) * n + np.asarray(pack.image_idx)
+        keys, counts = np.unique(keys, return_counts=True)
+        class_of = keys // n if n else keys
+        classes = {}
+        bounds = np.flatnonzero(np.diff(class_of)) + 1
+        for start, stop in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(keys)]))):
+            if start == stop:
+                continue
+            classes[int(class_of[start])] = (
+                (keys[start:stop] % n).astype(np.int32),
+                counts[start:stop].astype(np.int32),
+            )
+        return cls(box_counts, classes, fingerprint(pack))
+
+    @classmethod
+    def open(cls, pack, path=None):
+        """Load the index saved for ``pack``, or build and save it if there
+        is none or the pack changed since."""
+        if pack.dirty:
+            pack.save()
+        path = path or os.path.join(os.path.dirname(pack.path), INDEX_NAME)
+        expected = fingerprint(pack)
+        index = cls.load(path)
+        if index is None or index.fingerprint != expected or len(index) != len(pack):
+            index = cls.build(pack)
+            index.path = path
+            index.save()
+        return index
+
+    @classmethod
+    def load(cls, path):
+        """Read an index file; ``None`` if it is missing or unreadable."""
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if int(data["version"]) != INDEX_VERSION:
+                    return None
+                class_ids = data["class_ids"]
+                offsets = data["class_offsets"]
+                images = data["images"]
+                counts = data["counts"]
+                classes = {
+                    int(c): (images[offsets[k]:offsets[k + 1]], counts[offsets[k]:offsets[k + 1]])
+                    for k, c in enumerate(class_ids)
+                }
+                return cls(data["box_counts"], classes, str(data["fingerprint"]), path)
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def save(self, fingerprint=None):
+        """Merge pending updates and write the index atomically.
+
+        ``fingerprint`` is that of the pack state the index now matches.
+        """
+        with self._lock:
+            self._merge()
+            self._reindexed = False
+            if fingerprint is not None:
+                self.fingerprint = fingerprint
+            if self.path is None:
+                return
+            class_ids = sorted(self._classes)
+            lengths = [len(self._classes[c][0]) for c in class_ids]
+            arrays = {
+                "version": np.array(INDEX_VERSION),
+                "fingerprint": np.array(self.fingerprint or ""),
+                "box_counts": self.box_counts,
+                "class_ids": np.array(class_ids, dtype=np.int32),
+                "class_offsets": np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+                "images": np.concatenate([self._classes[c][0] for c in class_ids] or [np.empty(0, np.int32)]),
+                "counts": np.concatenate([self._classes[c][1] for c in class_ids] or [np.empty(0, np.int32)]),
+            }
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, self.path)
+
+    # --- updates --------------------------------------------------------
+
+    def update(self, idx, class_ids):
+        """Replace the boxes of image ``idx`` by boxes of ``class_ids``."""
+        counts = Counter(int(c) for c in np.asarray(class_ids).tolist())
+        with self._lock:
+            self._overrides[idx] = counts
+            self.box_counts[idx] = sum(counts.values())
+
+    def reindex(self, rows):
+        """Follow images added to or removed from the split; ``rows`` holds
+        the old index of every image, -1 for the added ones, as returned by
+        :meth:`LabelPack.reindex`. Added images have no boxes until
+        :meth:`update`-d."""
+        rows = np.asarray(rows, dtype=np.int64)
+        kept = np.flatnonzero(rows >= 0)
+        with self._lock:
+            self._merge()
+            # New index of every old image, -1 for the removed ones
+            moved = np.full(len(self.box_counts), -1, dtype=np.int64)
+            moved[rows[kept]] = kept
+            classes = {}
+            for class_id, (images, counts) in self._classes.items():
+                images = moved[images]
+                keep = images >= 0
+                if keep.any():
+                    classes[class_id] = (images[keep].astype(np.int32), counts[keep])
+            self._classes = classes
+            box_counts = np.zeros(len(rows), dtype=np.int32)
+            box_counts[kept] = self.box_counts[rows[kept]]
+            self.box_counts = box_counts
+            self._reindexed = True
+
+    def _merge(self):
+        # Called with the lock held
+        if not self._overrides:
+            return
+        merged = {}
+        for c in set(self._classes) | {c for counts in self._overrides.values() for c in counts}:
+            merged[c] = self._class_entries(c)
+        self._classes = {c: v for c, v in merged.items() if len(v[0])}
+        self._overrides.clear()
+
+    def _class_entries(self, class_id):
+        # Base arrays of ``class_id`` with pending updates applied
+        images, counts = self._classes.get(class_id, (np.empty(0, np.int32), np.empty(0, np.int32)))
+        if not self._overrides:
+            return images, counts
+        changed = np.array(sorted(self._overrides), dtype=np.int32)
+        keep = ~np.isin(images, changed)
+        added = [(i, o[class_id]) for i, o in sorted(self._overrides.items()) if o.get(class_id)]
+        images = np.concatenate((images[keep], np.array([i for i, _ in added], dtype=np.int32)))
+        counts = np.concatenate((counts[keep], np.array([k for _, k in added], dtype=np.int32)))
+        order = np.argsort(images, kind="stable")
+        return images[order], counts[order]
+
+    # --- queries --------------------------------------------------------
+
+    def class_ids(self):
+        """Sorted ids of the classes with at least one box."""
+        with self._lock:
+            candidates = set(self._classes) | {c for o in self._overrides.values() for c in o}
+            return sorted(c for c in candidates if len(self._class_entries(c)[0]))
+
+    def images_with_class(self, class_id):
+        """Sorted indices of the images with a box of ``class_id``."""
+        with self._lock:
+            return self._class_entries(class_id)[0]
+
+    def class_box_counts(self, class_id):
+        """Return ``(images, counts)``: the images with ``class_id`` and how
+        many boxes of it each has."""
+        with self._lock:
+            return self._class_entries(class_id)
+
+    def backgrounds(self):
+        """Indices of the images without any box."""
+        with self._lock:
+            return np.flatnonzero(self.box_counts == 0)
+
+    def images_with_more_boxes(self, k):
+        """Indices of the images with more than ``k`` boxes."""
+        with self._lock:
+            return np.flatnonzero(self.box_counts > k)
+
+
+class FilteredView:
+    """A sorted subset of a split's image indices to navigate through.
+
+    The view remembers where in the subset the last step landed, so moving
+    to the next or previous match from there is O(1); from any other image
+    it is a binary search. The subset is a snapshot: images that start or
+    stop matching afterwards are picked up when the filter is applied again.
+    """
+
+    def __init__(self, name, indices):
+        self.name = name
+        self.indices = [int(i) for i in indices]
+        self._pos = None
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __contains__(self, idx):
+        return self.position(idx) is not None
+
+    def position(self, idx):
+        """Position of image ``idx`` in the view, or ``None``."""
+        pos = self._pos
+        if pos is not None and pos < len(self.indices) and self.indices[pos] == idx:
+            return pos
+        pos = bisect.bisect_left(self.indices, idx)
+        if pos < len(self.indices) and self.indices[pos] == idx:
+            self._pos = pos
+            return pos
+        return None
+
+    def reindex(self, rows):
+        """Follow images added to or removed from the split, with ``rows`` as
+        for :meth:`ClassIndex.reindex`. Removed images leave the view; added
+        ones only join it when the filter is applied again."""
+        rows = np.asarray(rows, dtype=np.int64)
+        kept = np.flatnonzero(rows >= 0)
+        old = rows[kept]
+        indices = np.asarray(self.indices, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(old, indices), max(len(old) - 1, 0))
+        found = old[pos] == indices if len(old) else np.zeros(len(indices), dtype=bool)
+        self.indices = kept[pos[found]].tolist()
+        self._pos = None
+
+    def _step(self, pos):
+        if 0 <= pos < len(self.indices):
+            self._pos = pos
+            return self.indices[pos]
+        return None
+
+    def next(self, idx):
+        """First image of the view after ``idx``, or ``None``."""
+        pos = self.position(idx)
+        return self._step(pos + 1 if pos is not None else bisect.bisect_right(self.indices, idx))
+
+    def prev(self, idx):
+        """Last image of the view before ``idx``, or ``None``."""
+        pos = self.position(idx)
+        return self._step(pos - 1 if pos is not None else bisect.bisect_left(self.indices, idx) - 1)
+
+    def first(self):
+        return self._step(0)
@@ -0,0 +1,339 @@
+"""Duplicate and near-duplicate images within and across dataset splits.
+
+Every image gets three 64-bit perceptual hashes (average, difference and
+DCT hash) computed from a reduced-resolution grayscale decode on a process
+pool. Hashes are cached per split in a SQLite database keyed by file name,
+size and ``mtime_ns`` from the manifest, so later runs only hash new or
+changed images.
+
+Near duplicates are images whose DCT hashes differ in at most ``distance``
+bits. They are found with multi-index hashing rather than by comparing all
+pairs: the 64 bits are cut into ``distance + 1`` bands and, since two
+hashes within ``distance`` bits must agree exactly on at least one band,
+only hashes sharing a band value are compared. Linked images are merged
+into groups; a group with images from several splits is a leak between
+them.
+"""
+
+import csv
+import json
+import multiprocessing
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+import storage
+from cache import dataset_cache_dir
+from prefetch import reduction_factor
+
+CACHE_NAME = "image_hashes.sqlite"
+HASHES = ("ahash", "dhash", "phash")
+DEFAULT_DISTANCE = 4
+CHUNK_SIZE = 256
+# Below this many images a process pool costs more than it saves
+SERIAL_THRESHOLD = 512
+# Images are decoded so that their shorter side is still about this large
+HASH_DECODE_SIZE = (128, 128)
+# Distances computed at once when comparing the hashes of a bucket
+BLOCK_CELLS = 1 << 22
+
+GRAYSCALE_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def _pack(bits):
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def image_hashes(path, factor=1):
+    """Return the ``(ahash, dhash, phash)`` of ``path`` as unsigned ints,
+    decoding it at ``1/factor`` scale."""
+    img = storage.imread(path, GRAYSCALE_FLAGS[factor])
+    if img is None:
+        raise IOError(f"Could not read image: {path}")
+    small = cv2.resize(img, (8, 8), interpolation=cv2.INTER_AREA).astype(np.float32)
+    ahash = _pack(small > small.mean())
+    wide = cv2.resize(img, (9, 8), interpolation=cv2.INTER_AREA).astype(np.float32)
+    dhash = _pack(wide[:, 1:] > wide[:, :-1])
+    dct = cv2.dct(cv2.resize(img, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32))[:8, :8]
+    # The DC term only reflects overall brightness
+    phash = _pack(dct > np.median(dct.ravel()[1:]))
+    return ahash, dhash, phash
+
+
+def _to_signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def _hash_chunk(image_dir, items):
+    results = []
+    for name, size, mtime_ns, factor in items:
+        try:
+            hashes = image_hashes(os.path.join(image_dir, name), factor)
+        except Exception:
+            hashes = None
+        results.append((name, size, mtime_ns, hashes))
+    return results
+
+
+def hamming(a, b):
+    """Bitwise Hamming distance of ``uint64`` arrays (broadcasting)."""
+    x = np.bitwise_xor(a, b)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    return np.unpackbits(x.view(np.uint8).reshape(x.shape + (8,)), axis=-1).sum(axis=-1)
+
+
+class ImageHashes:
+    """Cached perceptual hashes of one dataset split.
+
+    :meth:`iter_compute` brings the cache up to date; afterwards
+    :meth:`hashes` returns an ``(n, 3)`` ``uint64`` array aligned with the
+    dataset's image paths and a mask of the images that could be read.
+    """
+
+    def __init__(self, dataset, cache_path=None, workers=None):
+        self.dataset = dataset
+        self.cache_path = cache_path or os.path.join(
+            dataset_cache_dir(dataset.image_dir), CACHE_NAME
+        )
+        self.workers = workers or os.cpu_count() or 1
+        # name -> (size, mtime_ns, (ahash, dhash, phash) or None)
+        self._files = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.cache_path)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            "name TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+            "ahash INTEGER, dhash INTEGER, phash INTEGER)"
+        )
+        return conn
+
+    def _load(self):
+        if self._files is not None:
+            return
+        self._files = {}
+        conn = self._connect()
+        try:
+            for name, size, mtime_ns, a, d, p in conn.execute(
+                "SELECT name, size, mtime_ns, ahash, dhash, phash FROM hashes"
+            ):
+                hashes = None if a is None else (_to_unsigned(a), _to_unsigned(d), _to_unsigned(p))
+                self._files[name] = (size, mtime_ns, hashes)
+        finally:
+            conn.close()
+
+    def _persist(self, results):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (name, size, mtime_ns) + (
+                            tuple(_to_signed(h) for h in hashes) if hashes else (None, None, None)
+                        )
+                        for name, size, mtime_ns, hashes in results
+                    ],
+                )
+        finally:
+            conn.close()
+
+    def _apply(self, results):
+        for name, size, mtime_ns, hashes in results:
+            self._files[name] = (size, mtime_ns, hashes)
+        self._persist(results)
+        return len(results)
+
+    def iter_compute(self, chunk_size=CHUNK_SIZE):
+        """Hash new and changed images, yielding ``(done, total)``; the
+        first item is yielded before any image is decoded."""
+        self._load()
+        manifest = self.dataset.manifest
+        stale = []
+        for i, name in enumerate(manifest.names):
+            key = (manifest.sizes[i], manifest.mtimes[i])
+            if self._files.get(name, (None, None))[:2] != key:
+                factor = reduction_factor(manifest.widths[i], manifest.heights[i], HASH_DECODE_SIZE)
+                stale.append((name, key[0], key[1], factor))
+        total = len(stale)
+        done = 0
+        yield done, total
+        chunks = [stale[i:i + chunk_size] for i in range(0, total, chunk_size)]
+        image_dir = self.dataset.image_dir
+        if total <= SERIAL_THRESHOLD or self.workers == 1:
+            for chunk in chunks:
+                done += self._apply(_hash_chunk(image_dir, chunk))
+                yield done, total
+            return
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx) as pool:
+            futures = [pool.submit(_hash_chunk, image_dir, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                done += self._apply(future.result())
+                yield done, total
+
+    def hashes(self):
+        """Return ``(hashes, readable)`` for the dataset's images."""
+        if self._files is None:
+            for _ in self.iter_compute():
+                pass
+        names = self.dataset.manifest.names
+        out = np.zeros((len(names), len(HASHES)), dtype=np.uint64)
+        readable = np.zeros(len(names), dtype=bool)
+        for i, name in enumerate(names):
+            entry = self._files.get(name)
+            if entry is not None and entry[2] is not None:
+                out[i] = entry[2]
+                readable[i] = True
+        return out, readable
+
+
+def _bands(distance):
+    # ``distance + 1`` disjoint bit ranges covering all 64 bits
+    count = min(distance + 1, 64)
+    edges = np.linspace(0, 64, count + 1).astype(int)
+    return [(int(lo), int(hi - lo)) for lo, hi in zip(edges[:-1], edges[1:])]
+
+
+def near_pairs(hashes, distance=DEFAULT_DISTANCE, block_cells=BLOCK_CELLS):
+    """Return an ``(m, 2)`` array of index pairs ``i < j`` of distinct
+    values in the ``uint64`` array ``hashes`` within ``distance`` bits."""
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    found = []
+    for shift, bits in _bands(distance):
+        keys = (hashes >> np.uint64(shift)) & np.uint64((1 << bits) - 1)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        shared = ends - starts > 1
+        for start, end in zip(starts[shared], ends[shared]):
+            members = order[start:end]
+            values = hashes[members]
+            block_rows = max(1, block_cells // len(members))
+            for row in range(0, len(members), block_rows):
+                rows = members[row:row + block_rows]
+                close = hamming(hashes[rows][:, None], values[None, :]) <= distance
+                i, j = np.nonzero(close)
+                a, b = rows[i], members[j]
+                keep = a < b
+                if keep.any():
+                    found.append(np.stack((a[keep], b[keep]), axis=1))
+    if not found:
+        return np.empty((0, 2), dtype=np.int64)
+    pairs = np.concatenate(found).astype(np.int64)
+    # A pair agreeing on several bands is found once per band
+    return np.unique(pairs, axis=0)
+
+
+def connected_components(count, pairs):
+    """Label ``count`` nodes linked by ``pairs`` with the smallest node of
+    their component."""
+    labels = np.arange(count)
+    if not len(pairs):
+        return labels
+    a, b = pairs[:, 0], pairs[:, 1]
+    while True:
+        low = np.minimum(labels[a], labels[b])
+        before = labels.copy()
+        np.minimum.at(labels, a, low)
+        np.minimum.at(labels, b, low)
+        labels = labels[labels]  # pointer jumping
+        if np.array_equal(labels, before):
+            return labels
+
+
+def duplicate_groups(phashes, distance=DEFAULT_DISTANCE):
+    """Group positions of ``phashes`` within ``distance`` bits of another
+    member; returns a list of sorted index arrays with two or more items."""
+    values, inverse = np.unique(np.asarray(phashes, dtype=np.uint64), return_inverse=True)
+    labels = connected_components(len(values), near_pairs(values, distance))[inverse.ravel()]
+    order = np.argsort(labels, kind="stable")
+    sorted_labels = labels[order]
+    starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+    ends = np.r_[starts[1:], len(order)]
+    return [order[s:e] for s, e in zip(starts, ends) if e - s > 1]
+
+
+def find_duplicates(datasets, distance=DEFAULT_DISTANCE, workers=None, progress=None):
+    """Return the duplicate groups of ``datasets`` (a ``{split: YoloDataset}``
+    mapping), largest first.
+
+    Each group is a dict::
+
+        {"group": 0, "kind": "identical" | "near", "splits": ["train", "val"],
+         "leak": True, "members": [{"split": "train", "index": 12,
+         "image": ".../a.jpg", "distance": 0}, ...]}
+
+    ``distance`` of a member is the DCT hash distance to the first member.
+    ``progress(split, done, total)`` is called while hashing.
+    """
+    splits, indices, blocks = [], [], []
+    for split, ds in datasets.items():
+        engine = ImageHashes(ds, workers=workers)
+        for done, total in engine.iter_compute():
+            if progress is not None:
+                progress(split, done, total)
+        hashes, readable = engine.hashes()
+        positions = np.flatnonzero(readable)
+        splits.extend([split] * len(positions))
+        indices.extend(positions.tolist())
+        blocks.append(hashes[positions])
+    if not blocks:
+        return []
+    hashes = np.concatenate(blocks)
+    groups = []
+    for members in duplicate_groups(hashes[:, HASHES.index("phash")], distance):
+        first = hashes[members[0]]
+        distances = hamming(hashes[members, HASHES.index("phash")], first[HASHES.index("phash")])
+        member_splits = sorted({splits[m] for m in members}, key=list(datasets).index)
+        groups.append({
+            "kind": "identical" if (hashes[members] == first).all() else "near",
+            "splits": member_splits,
+            "leak": len(member_splits) > 1,
+            "members": [
+                {
+                    "split": splits[m],
+                    "index": indices[m],
+                    "image": datasets[splits[m]].image_paths[indices[m]],
+                    "distance": int(d),
+                }
+                for m, d in zip(members.tolist(), distances.tolist())
+            ],
+        })
+    groups.sort(key=lambda g: (not g["leak"], -len(g["members"])))
+    for n, group in enumerate(groups):
+        group["group"] = n
+    return groups
+
+
+def write_report(groups, path):
+    """Write ``groups`` as CSV (one row per image) if ``path`` ends in
+    ``.csv``, as JSON otherwise."""
+    if path.lower().endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["group", "kind", "leak", "split", "index", "image", "distance"])
+            for group in groups:
+                for m in group["members"]:
+                    writer.writerow([
+                        group["group"], group["kind"], int(group["leak"]),
+                        m["split"], m["index"], m["image"], m["distance"],
+                    ])
+    else:
+        with open(path, "w") as f:
+            json.dump(groups, f, indent=1)
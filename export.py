@@ -0,0 +1,203 @@
+"""Export a subset of a dataset split as a standalone YOLO dataset.
+
+Files are copied by a thread pool into a staging directory next to the
+target, which is renamed into place once everything has been written, so a
+failed or cancelled export never leaves a partial dataset behind.
+
+Images can be linked instead of copied when source and target share a
+filesystem: ``"reflink"`` makes a copy-on-write clone (btrfs, XFS, APFS...)
+and ``"hardlink"`` a second name for the same file. Both fall back to a
+plain copy per file where the filesystem can't do it. Label files are
+always copied because the viewer rewrites them in place, which would edit
+the exported dataset through a hard link.
+"""
+
+import errno
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import yaml
+
+import storage
+
+# Copying is I/O bound, so use more threads than cores
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+# Images handed to a worker at a time; progress is reported per chunk
+CHUNK_SIZE = 64
+MODES = ("copy", "reflink", "hardlink")
+
+# ioctl request number of FICLONE on Linux
+_FICLONE = 0x40049409
+_LINK_ERRORS = {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EMLINK}
+
+
+def _reflink(src, dst):
+    if sys.platform != "linux":
+        raise OSError(errno.EOPNOTSUPP, "reflink is only supported on Linux")
+    import fcntl
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+    shutil.copystat(src, dst)
+
+
+def place_file(src, dst, mode="copy"):
+    """Put ``src`` at ``dst`` using ``mode``; return ``True`` if the file was
+    linked rather than copied. Files inside archives are always copied."""
+    if storage.is_archive_path(src):
+        storage.copy_file(src, dst)
+        return False
+    if mode != "copy":
+        try:
+            if mode == "hardlink":
+                os.link(src, dst)
+            else:
+                _reflink(src, dst)
+            return True
+        except OSError as e:
+            if e.errno not in _LINK_ERRORS:
+                raise
+            if os.path.lexists(dst):
+                os.remove(dst)
+    shutil.copy2(src, dst)
+    return False
+
+
+def _export_chunk(dataset, indices, images_dir, labels_dir, mode, cancel):
+    counts = {"images": 0, "labels": 0, "linked": 0}
+    for idx in indices:
+        if cancel is not None and cancel.is_set():
+            break
+        src = dataset.image_paths[idx]
+        counts["linked"] += place_file(src, os.path.join(images_dir, os.path.basename(src)), mode)
+        counts["images"] += 1
+        label_src = dataset.label_path(idx)
+        if storage.exists(label_src):
+            storage.copy_file(label_src, os.path.join(labels_dir, os.path.basename(label_src)))
+            counts["labels"] += 1
+    return counts
+
+
+def select_indices(dataset, start=0, stop=None, labeled=None, classes=None):
+    """Return the image indices in ``[start, stop)`` that pass the filters.
+
+    ``labeled=True`` keeps images with a non-empty label file and
+    ``labeled=False`` those without one. ``classes`` keeps images with at
+    least one box of any of the given class ids.
+    """
+    from stats import read_label_counts
+
+    total = dataset.total_images()
+    stop = total if stop is None else min(stop, total)
+    classes = None if classes is None else set(classes)
+    selected = []
+    for idx in range(max(0, start), stop):
+        if labeled is None and classes is None:
+            selected.append(idx)
+            continue
+        try:
+            counts, nonempty = read_label_counts(dataset.label_path(idx))
+        except OSError:
+            counts, nonempty = {}, False
+        if labeled is not None and nonempty != labeled:
+            continue
+        if classes is not None and classes.isdisjoint(counts):
+            continue
+        selected.append(idx)
+    return selected
+
+
+def parse_ranges(text, total):
+    """Parse ``"0-99, 150, 200-"`` into a sorted list of indices below
+    ``total``. Ranges are inclusive; an open end runs to the last image."""
+    selected = set()
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, sep, last = part.partition("-")
+        try:
+            lo = int(first) if first.strip() else 0
+            hi = (int(last) if last.strip() else total - 1) if sep else lo
+        except ValueError:
+            raise ValueError(f"Invalid range '{part}'") from None
+        if lo > hi:
+            raise ValueError(f"Invalid range '{part}'")
+        selected.update(range(max(0, lo), min(hi, total - 1) + 1))
+    return sorted(selected)
+
+
+def export_dataset(
+    dataset,
+    export_dir,
+    class_names,
+    indices=None,
+    workers=DEFAULT_WORKERS,
+    mode="copy",
+    progress=None,
+    cancel=None,
+):
+    """Export the images ``indices`` (all by default) of ``dataset`` and their
+    labels to ``export_dir`` and write a ``data.yaml`` for it.
+
+    ``progress(done, total)`` is called from the calling thread as chunks
+    finish. Setting the ``cancel`` event stops the export and removes
+    everything written so far. Raises ``FileExistsError`` if ``export_dir``
+    already exists, or the error of a queued label save that failed.
+    Returns a summary with the number of images, labels and
+    linked images, ``finished`` and ``seconds``.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown export mode '{mode}', expected one of {MODES}")
+    export_dir = os.path.abspath(export_dir)
+    if os.path.exists(export_dir):
+        raise FileExistsError(f"Directory '{export_dir}' already exists.")
+    indices = list(range(dataset.total_images()) if indices is None else indices)
+    started = time.perf_counter()
+    # Labels saved in the background must be on disk before they are copied
+    failed = dataset.flush_labels()
+    if failed:
+        raise failed[0][1]
+
+    # Stage next to the target so the final rename stays on one filesystem
+    parent = os.path.dirname(export_dir)
+    os.makedirs(parent, exist_ok=True)
+    staging = os.path.join(parent, f".{os.path.basename(export_dir)}.partial-{os.getpid()}")
+    shutil.rmtree(staging, ignore_errors=True)
+    images_dir = os.path.join(staging, "images")
+    labels_dir = os.path.join(staging, "labels")
+    os.makedirs(images_dir)
+    os.makedirs(labels_dir)
+
+    totals = {"images": 0, "labels": 0, "linked": 0}
+    try:
+        chunks = [indices[i:i + CHUNK_SIZE] for i in range(0, len(indices), CHUNK_SIZE)]
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = [
+                pool.submit(_export_chunk, dataset, chunk, images_dir, labels_dir, mode, cancel)
+                for chunk in chunks
+            ]
+            try:
+                for future in as_completed(futures):
+                    for key, value in future.result().items():
+                        totals[key] += value
+                    if progress:
+                        progress(totals["images"], len(indices))
+            finally:
+                for future in futures:
+                    future.cancel()
+        finished = cancel is None or not cancel.is_set()
+        if finished:
+            data = {"names": list(class_names), "train": "images"}
+            with open(os.path.join(staging, "data.yaml"), "w") as f:
+                yaml.safe_dump(data, f)
+            os.rename(staging, export_dir)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    if not finished:
+        shutil.rmtree(staging, ignore_errors=True)
+    return dict(totals, finished=finished, seconds=time.perf_counter() - started)
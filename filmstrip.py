@@ -0,0 +1,209 @@
+"""Scrollable grid of thumbnails next to the viewer.
+
+The grid is virtualised: the canvas scroll region spans every image of the
+split, but canvas items and ``PhotoImage`` objects only exist for the rows
+in view (plus a small margin), so scrolling through 100k+ images costs the
+same as scrolling through a hundred. Thumbnails are produced by a
+:class:`~thumbnails.ThumbnailLoader` and filled in as they become ready.
+"""
+
+import platform
+import tkinter as tk
+
+from PIL import ImageTk
+
+from thumbnails import THUMB_SIZE, ThumbnailLoader
+
+CELL_PAD = 8
+# Extra rows populated above and below the visible ones
+MARGIN_ROWS = 2
+# How often finished thumbnails are collected while some are pending, and
+# how often thumbnails of relabelled images are looked for otherwise
+POLL_MS = 40
+IDLE_POLL_MS = 250
+CURRENT_OUTLINE = "#ffcc00"
+CELL_OUTLINE = "#505050"
+
+
+def visible_cells(top, height, cell, columns, total, margin_rows=MARGIN_ROWS):
+    """Return the ``range`` of image indices whose cells intersect the
+    ``height`` pixels starting at ``top``, widened by ``margin_rows``."""
+    if total <= 0 or height <= 0:
+        return range(0)
+    rows = -(-total // columns)
+    first = max(0, int(top // cell) - margin_rows)
+    last = min(rows - 1, int((top + height - 1) // cell) + margin_rows)
+    return range(first * columns, min(total, (last + 1) * columns))
+
+
+class Filmstrip(tk.Frame):
+    """Thumbnail grid of ``dataset``; ``on_select(idx)`` is called when a
+    thumbnail is clicked. Call :meth:`set_current` when the viewer moves."""
+
+    def __init__(self, root, dataset, cache, on_select=None, columns=2, size=THUMB_SIZE):
+        super().__init__(root)
+        self.dataset = dataset
+        self.on_select = on_select
+        self.columns = columns
+        self.cell = size + CELL_PAD
+        self.loader = ThumbnailLoader(dataset, cache, size=size)
+        self.current = None
+        # idx -> [frame item, image item, PhotoImage or None]
+        self._cells = {}
+        self._update_job = None
+        self._poll_job = None
+
+        self.canvas = tk.Canvas(
+            self,
+            width=self.columns * self.cell,
+            highlightthickness=0,
+            background="#202020",
+            yscrollincrement=self.cell // 4,
+        )
+        self.scrollbar = tk.Scrollbar(self, command=self.canvas.yview)
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="y", expand=True)
+        self.canvas.config(yscrollcommand=self._on_yscroll)
+        self._set_scrollregion()
+
+        self.canvas.bind("<Configure>", self.on_configure)
+        self.canvas.bind("<Button-1>", self.on_click)
+        if platform.system() == "Linux":
+            self.canvas.bind("<Button-4>", lambda e: self.canvas.yview_scroll(-2, "units"))
+            self.canvas.bind("<Button-5>", lambda e: self.canvas.yview_scroll(2, "units"))
+        else:
+            self.canvas.bind("<MouseWheel>", self.mouseWheelHandler)
+
+    def destroy(self):
+        for job in (self._update_job, self._poll_job):
+            if job is not None:
+                self.after_cancel(job)
+        self._update_job = self._poll_job = None
+        self.loader.shutdown()
+        super().destroy()
+
+    def set_current(self, idx):
+        """Highlight image ``idx`` and scroll it into view."""
+        previous, self.current = self.current, idx
+        if previous is not None:
+            self._outline(previous)
+        self._outline(idx)
+        self._scroll_to(idx)
+        self._schedule_update()
+
+    def reload(self):
+        """Redraw every cell after images were added to or removed from the
+        split."""
+        self.loader.clear()
+        for idx in list(self._cells):
+            self._drop_cell(idx)
+        self._set_scrollregion()
+        self._schedule_update()
+
+    def on_configure(self, event=None):
+        if self.current is not None:
+            self._scroll_to(self.current)
+        self._schedule_update()
+
+    def on_click(self, event):
+        x = self.canvas.canvasx(event.x)
+        y = self.canvas.canvasy(event.y)
+        col = int(x // self.cell)
+        idx = int(y // self.cell) * self.columns + col
+        if 0 <= col < self.columns and 0 <= idx < self.dataset.total_images() and self.on_select:
+            self.on_select(idx)
+
+    def mouseWheelHandler(self, event):
+        self.canvas.yview_scroll(-2 if event.delta > 0 else 2, "units")
+
+    def _rows(self):
+        return -(-self.dataset.total_images() // self.columns)
+
+    def _set_scrollregion(self):
+        self.canvas.config(scrollregion=(0, 0, self.columns * self.cell, self._rows() * self.cell))
+
+    def _scroll_to(self, idx):
+        total_h = self._rows() * self.cell
+        if total_h <= 0:
+            return
+        top = self.canvas.canvasy(0)
+        height = self.canvas.winfo_height()
+        y = (idx // self.columns) * self.cell
+        if y < top or y + self.cell > top + height:
+            self.canvas.yview_moveto(max(0, y - (height - self.cell) / 2) / total_h)
+
+    def _on_yscroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self._schedule_update()
+
+    def _schedule_update(self):
+        if self._update_job is None:
+            self._update_job = self.after_idle(self._update)
+
+    def _update(self):
+        self._update_job = None
+        wanted = visible_cells(
+            self.canvas.canvasy(0),
+            self.canvas.winfo_height(),
+            self.cell,
+            self.columns,
+            self.dataset.total_images(),
+        )
+        for idx in [i for i in self._cells if i not in wanted]:
+            self._drop_cell(idx)
+        for idx in wanted:
+            if idx not in self._cells:
+                self._create_cell(idx)
+        # Rows in view first, then the margin
+        top = self.canvas.canvasy(0)
+        order = sorted(wanted, key=lambda i: abs((i // self.columns) * self.cell - top))
+        self.loader.request([i for i in order if self._cells[i][2] is None])
+        if self._poll_job is not None:
+            self.after_cancel(self._poll_job)
+        self._poll()
+
+    def _create_cell(self, idx):
+        x = (idx % self.columns) * self.cell
+        y = (idx // self.columns) * self.cell
+        frame = self.canvas.create_rectangle(
+            x + 2, y + 2, x + self.cell - 2, y + self.cell - 2, outline=CELL_OUTLINE
+        )
+        image = self.canvas.create_image(x + self.cell / 2, y + self.cell / 2, anchor="center")
+        self._cells[idx] = [frame, image, None]
+        self._outline(idx)
+        self._fill(idx)
+
+    def _drop_cell(self, idx):
+        cell = self._cells.pop(idx, None)
+        if cell is not None:
+            self.canvas.delete(cell[0], cell[1])
+
+    def _fill(self, idx):
+        cell = self._cells.get(idx)
+        thumb = self.loader.get(idx)
+        if cell is None or thumb is None:
+            return
+        cell[2] = ImageTk.PhotoImage(thumb)
+        self.canvas.itemconfig(cell[1], image=cell[2])
+
+    def _outline(self, idx):
+        cell = self._cells.get(idx)
+        if cell is None:
+            return
+        if idx == self.current:
+            self.canvas.itemconfig(cell[0], outline=CURRENT_OUTLINE, width=3)
+        else:
+            self.canvas.itemconfig(cell[0], outline=CELL_OUTLINE, width=1)
+
+    def _poll(self):
+        self._poll_job = None
+        for idx in self.loader.take_ready():
+            self._fill(idx)
+        # Labels saved in the background are only in place once written
+        changed = [idx for idx in self.loader.take_changed() if idx in self._cells]
+        for idx in changed:
+            self._drop_cell(idx)
+        if changed:
+            self._update()
+            return
+        self._poll_job = self.after(POLL_MS if self.loader.busy else IDLE_POLL_MS, self._poll)
@@ -0,0 +1,106 @@
+"""Coalescing of redraw requests into display frames.
+
+Input handlers only update state and mark the layers that need redrawing
+as dirty. The dirty layers are drawn together at most once per frame, so
+when events arrive faster than frames can be drawn (e.g. from a high
+polling rate mouse) the extra requests are merged into the pending frame
+instead of each causing a redraw.
+"""
+
+import math
+import time
+
+# ~60 frames per second
+FRAME_MS = 16
+
+
+class FrameScheduler:
+    """Call ``render(layers, fast)`` at most once per ``frame_ms``.
+
+    ``widget`` provides Tk's ``after``, ``after_idle`` and ``after_cancel``.
+    A frame is drawn as soon as the event queue is idle if the previous one
+    started at least ``frame_ms`` ago, otherwise when that time is up.
+    ``fast`` is only passed if every request merged into the frame was fast.
+    """
+
+    def __init__(self, widget, render, frame_ms=FRAME_MS, clock=time.perf_counter):
+        self.widget = widget
+        self.render = render
+        self.frame_ms = frame_ms
+        self.clock = clock
+        self._dirty = set()
+        self._fast = True
+        self._job = None
+        self._last_start = None
+        self.frames = 0
+        self.requests = 0
+        # Requests merged into a frame that was already pending
+        self.dropped = 0
+        self.last_frame_ms = 0.0
+        self.max_frame_ms = 0.0
+        self._total_frame_ms = 0.0
+
+    @property
+    def pending(self):
+        return frozenset(self._dirty)
+
+    def request(self, *layers, fast=False):
+        """Mark ``layers`` dirty and make sure a frame is scheduled."""
+        self.requests += 1
+        if self._job is not None:
+            self.dropped += 1
+        self._dirty.update(layers)
+        self._fast = self._fast and fast
+        if self._job is not None:
+            return
+        delay = 0.0
+        if self._last_start is not None:
+            delay = self.frame_ms - (self.clock() - self._last_start) * 1000
+        if delay <= 0:
+            self._job = self.widget.after_idle(self._run)
+        else:
+            self._job = self.widget.after(int(math.ceil(delay)), self._run)
+
+    def flush(self, *layers, fast=False):
+        """Draw ``layers`` and anything pending now."""
+        self._dirty.update(layers)
+        self._fast = self._fast and fast
+        self._cancel_job()
+        if self._dirty:
+            self._run()
+
+    def cancel(self):
+        """Drop the pending frame."""
+        self._cancel_job()
+        self._dirty.clear()
+        self._fast = True
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "requests": self.requests,
+            "dropped": self.dropped,
+            "last_frame_ms": self.last_frame_ms,
+            "max_frame_ms": self.max_frame_ms,
+            "mean_frame_ms": self._total_frame_ms / self.frames if self.frames else 0.0,
+        }
+
+    def _cancel_job(self):
+        if self._job is not None:
+            self.widget.after_cancel(self._job)
+            self._job = None
+
+    def _run(self):
+        self._job = None
+        layers, fast = frozenset(self._dirty), self._fast
+        self._dirty.clear()
+        self._fast = True
+        start = self._last_start = self.clock()
+        try:
+            self.render(layers, fast)
+        finally:
+            elapsed = (self.clock() - start) * 1000
+            self.frames += 1
+            self.last_frame_ms = elapsed
+            self.max_frame_ms = max(self.max_frame_ms, elapsed)
+            self._total_frame_ms += elapsed
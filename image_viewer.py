@@ -1,27 +1,70 @@
 import platform
 import tkinter as tk
-from tkinter import ttk
+from tkinter import messagebox, ttk
 from PIL import Image, ImageTk
-import cv2
+import numpy as np
 import os
-from bounding_box import BoundingBox, smallest_box_containing_point
+from box_array import BoxArray
+from box_layer import BoxLayer
+from bounding_box import BoundingBox
 from coords import image_to_canvas_coords, canvas_to_image_coords
+from frame_scheduler import FrameScheduler
+from prefetch import ImagePrefetcher, fit_zoom
+from render_cache import ViewportRenderer
+from spatial_index import BoxIndex
+from tracing import TRACER, traced
+
+# Delay after the last zoom/pan/drag event before the view is re-rendered
+# with the high quality filter.
+SETTLE_DELAY_MS = 150
+# When zoomed in, the image is rendered this many pixels beyond each edge
+# of the viewport so that panning can move the canvas items instead of
+# re-rendering. The buffer is refilled once the view gets within
+# OVERSCAN_REFILL_PX of its edge.
+OVERSCAN_PX = 512
+OVERSCAN_REFILL_PX = 128
+# Images are shown whole on first load if they fit in this fraction of the
+# screen, otherwise scaled down to fit it (and decoded at reduced size).
+DISPLAY_FRACTION = 0.8
+# How often a pending full resolution decode is checked for
+FULL_DECODE_POLL_MS = 30
+
+# How often the tracing HUD is updated
+HUD_INTERVAL_MS = 500
+
+# Canvas layers redrawn by the frame scheduler
+IMAGE_LAYER = "image"
+BOXES_LAYER = "boxes"
+OVERLAY_LAYER = "overlay"
+CROSSHAIR_LAYER = "crosshair"
+ALL_LAYERS = (IMAGE_LAYER, BOXES_LAYER, OVERLAY_LAYER, CROSSHAIR_LAYER)
 
 
 class ImageViewer(tk.Frame):
-    def __init__(self, root, dataset, index_callback=None):
+    def __init__(self, root, dataset, index_callback=None, class_callback=None):
         super().__init__(root)
         self.dataset = dataset
         self.index_callback = index_callback
+        self.class_callback = class_callback
 
         self.boxes = []
+        self.box_index = None
+        # Optional FilteredView that Prev/Next step through
+        self.view = None
         self.selected_box = None
         self.last_selected_class_id = 0
         self.dragging = False
         self.start_draw = None
+        self._draw_end = None
+        # Last pointer position on the canvas, None when outside
+        self._pointer = None
+        self._crosshair = None
+        self._crosshair_hidden = False
         self.show_boxes = tk.BooleanVar(value=True)
 
         self.zoom = 1.0
+        self.min_zoom = 1.0
+        self.img_w = self.img_h = 0
         self.pan_x = 0
         self.pan_y = 0
         self.crop_x = 0
@@ -30,6 +73,35 @@ class ImageViewer(tk.Frame):
         self.panning = False
         self.pan_start = None
 
+        self.prefetcher = ImagePrefetcher(
+            dataset,
+            display_size=(
+                int(self.winfo_screenwidth() * DISPLAY_FRACTION),
+                int(self.winfo_screenheight() * DISPLAY_FRACTION),
+            ),
+        )
+        self.renderer = None
+        self._index_item = None
+        self._base_tk = None
+        self._view = None
+        self._view_fast = False
+        # Zoomed-space position shown at the canvas origin, while zoomed in
+        self._origin = None
+        self._settle_job = None
+        self._full_decode = None
+        # Input handlers mark layers dirty; they are drawn once per frame
+        self.scheduler = FrameScheduler(self, self._render)
+        self._hud_item = None
+        self._hud_job = None
+        # Label text of the current image as last loaded or saved
+        self._clean_text = None
+        # Stamp of the label file when it was loaded, and whether another
+        # program changed it while there were unsaved edits
+        self._label_stamp = None
+        self._label_conflict = False
+        # Image shown, to notice it being removed from the split
+        self._image_path = None
+
         self.main_frame = tk.Frame(self)
         self.main_frame.pack(fill="both", expand=True)
 
@@ -55,6 +127,7 @@ class ImageViewer(tk.Frame):
 
         self.canvas = tk.Canvas(self.main_frame)
         self.canvas.pack(side="left", fill="both", expand=True)
+        self.box_layer = BoxLayer(self.canvas)
         self.canvas.focus_set()
 
         ctrl_frame = tk.Frame(self)
@@ -96,17 +169,46 @@ class ImageViewer(tk.Frame):
         self.canvas.bind("<ButtonRelease-2>", self.on_pan_end)
 
         self.load_image()
-
+        if TRACER.enabled:
+            self._hud_job = self.after(HUD_INTERVAL_MS, self.update_hud)
+
+    def destroy(self):
+        if self._settle_job is not None:
+            self.after_cancel(self._settle_job)
+            self._settle_job = None
+        self._full_decode = None
+        if self._hud_job is not None:
+            self.after_cancel(self._hud_job)
+            self._hud_job = None
+        self.scheduler.cancel()
+        self.prefetcher.shutdown()
+        self.report_write_errors(self.dataset.sync())
+        super().destroy()
+
+    @traced("load_image")
     def load_image(self):
-        path = self.dataset.current_image_path()
-        self.img_cv = cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB)
-        self.img_pil = Image.fromarray(self.img_cv)
-        self.image_tk = ImageTk.PhotoImage(self.img_pil)
-        self.canvas.config(width=self.img_pil.width, height=self.img_pil.height)
-        self.canvas.create_image(0, 0, anchor="nw", image=self.image_tk)
-        self.boxes = self.dataset.load_labels()
+        # Decoding happens on the prefetcher's workers; only the PhotoImage
+        # handoff in redraw_image has to run on the Tk thread.
+        # img_pil may be a reduced decode; box and image coordinates are
+        # always in full resolution pixels (img_w x img_h).
+        idx = self.dataset.current_index()
+        self.img_pil, (self.img_w, self.img_h), self.boxes = self.prefetcher.get(idx)
+        self._clean_text = self.dataset.format_labels(self.boxes)
+        self._label_stamp = self.dataset.label_stamp(idx)
+        self._label_conflict = False
+        self._image_path = self.dataset.current_image_path()
+        self.box_index = BoxIndex(self.boxes, self.img_w, self.img_h)
+        self.prefetcher.schedule(idx, self.view)
+        self.renderer = ViewportRenderer(self.img_pil, size=(self.img_w, self.img_h))
+        self._full_decode = None
+        self._base_tk = None
+        self._view = None
+        self._origin = None
+        self.box_layer.clear()
+        self.min_zoom = fit_zoom(self.img_w, self.img_h, self.prefetcher.display_size)
+        self.canvas.config(width=int(self.img_w * self.min_zoom), height=int(self.img_h * self.min_zoom))
         self.selected_box = None
-        self.zoom = 1.0
+        self.zoom = self.min_zoom
         self.pan_x = 0
         self.pan_y = 0
         self.crop_x = 0
@@ -116,29 +218,56 @@ class ImageViewer(tk.Frame):
         self.refresh()
         if self.index_callback:
             self.index_callback(self.dataset.current_index())
-        self.update_info_area()
+        self.report_write_errors(self.dataset.label_write_errors())
+
+    def is_dirty(self):
+        """Whether the boxes differ from the label file's saved content."""
+        return self.dataset.format_labels(self.boxes) != self._clean_text
 
     def update_info_area(self):
+        # Rendered from the boxes in memory; the label file is not re-read.
         image_name = os.path.basename(self.dataset.current_image_path())
-        label_path = self.dataset.current_label_path()
-        label_name = os.path.basename(label_path)
-        if os.path.exists(label_path):
-            with open(label_path) as f:
-                content = f.read()
-        else:
-            content = ""
+        label_name = os.path.basename(self.dataset.current_label_path())
+        content = self.dataset.format_labels(self.boxes)
+        unsaved = " (unsaved)" if content != self._clean_text else ""
+        if self._label_conflict:
+            unsaved += " (changed on disk)"
         self.info_text.config(state=tk.NORMAL)
         self.info_text.delete("1.0", tk.END)
         self.info_text.insert(tk.END, f"Image: {image_name}\n")
-        self.info_text.insert(tk.END, f"Labels: {label_name}\n\n")
+        self.info_text.insert(tk.END, f"Labels: {label_name}{unsaved}\n\n")
         self.info_text.insert(tk.END, content)
         self.info_text.config(state=tk.DISABLED)
 
-    def refresh(self):
-        self.canvas.delete("box")
-        # Redraw image at new zoom/pan (draw image first)
-        self.redraw_image()
-
+    @traced("refresh")
+    def refresh(self, fast=False):
+        """Redraw every layer now, along with any pending frame."""
+        self.scheduler.flush(*ALL_LAYERS, fast=fast)
+
+    @traced("frame")
+    def _render(self, layers, fast):
+        # Called by the scheduler with the layers marked dirty since the
+        # last frame.
+        if IMAGE_LAYER in layers:
+            moved = self.redraw_image(fast)
+            if moved is None:
+                # Re-rendered: everything drawn over the image may be stale
+                layers = ALL_LAYERS
+            elif BOXES_LAYER not in layers:
+                self.box_layer.move(*moved)
+        if BOXES_LAYER in layers:
+            self.draw_boxes()
+            if not fast:
+                self.update_info_area()
+        if OVERLAY_LAYER in layers:
+            self.draw_overlay()
+        if CROSSHAIR_LAYER in layers:
+            self.draw_crosshair()
+        if BOXES_LAYER in layers or OVERLAY_LAYER in layers:
+            self.canvas.tag_raise("overlay")
+            self.canvas.tag_raise("crosshair")
+
+    def draw_boxes(self):
         if self.show_boxes.get():
             boxes_to_draw = self.boxes
             # Clear flags for boxes created while boxes were hidden
@@ -150,123 +279,276 @@ class ImageViewer(tk.Frame):
             boxes_to_draw = [
                 box for box in self.boxes if getattr(box, "created_while_hidden", False)
             ]
+        self.box_layer.sync(boxes_to_draw, self.box_canvas_rects(boxes_to_draw))
 
-        for box in boxes_to_draw:
-            x1, y1, x2, y2 = box.to_pixel_rect(self.img_pil.width, self.img_pil.height)
-            # Apply zoom, pan and crop
-            x1, y1 = image_to_canvas_coords(
-                x1, y1, self.zoom, self.pan_x, self.pan_y, self.crop_x, self.crop_y
-            )
-            x2, y2 = image_to_canvas_coords(
-                x2, y2, self.zoom, self.pan_x, self.pan_y, self.crop_x, self.crop_y
-            )
-            color = box.color
-            self.canvas.create_rectangle(x1, y1, x2, y2, outline=color, width=4, tag="box")
-            self.canvas.create_text(
-                x1 + 5, y1 + 10, text=box.class_name, fill=color, anchor="nw", tag="box"
+        # Dashed preview of the box being drawn
+        preview = self.canvas.find_withtag("preview")
+        if self.start_draw is None or self._draw_end is None:
+            if preview:
+                self.canvas.delete("preview")
+            return
+        x0c, y0c = image_to_canvas_coords(
+            *self.start_draw, self.zoom, self.pan_x, self.pan_y, self.crop_x, self.crop_y
+        )
+        x1c, y1c = image_to_canvas_coords(
+            *self._draw_end, self.zoom, self.pan_x, self.pan_y, self.crop_x, self.crop_y
+        )
+        if preview:
+            self.canvas.coords(preview[0], x0c, y0c, x1c, y1c)
+        else:
+            self.canvas.create_rectangle(
+                x0c, y0c, x1c, y1c, outline="white", dash=(4, 2), tag="preview"
             )
 
+    def draw_overlay(self):
         # Draw current image index / total images at top right
         idx = self.dataset.current_index() + 1
         total = self.dataset.total_images()
         text = f"{idx}/{total}"
-        if self.zoom == 1.0:
-            tx = self.img_pil.width * self.zoom + self.pan_x - 10
+        if self.view is not None:
+            pos = self.view.position(idx - 1)
+            if pos is not None:
+                text += f"  [{self.view.name} {pos + 1}/{len(self.view)}]"
+        if self.zoom == self.min_zoom:
+            tx = self.img_w * self.zoom + self.pan_x - 10
             ty = 10 + self.pan_y
         else:
             tx = self.canvas.winfo_width() - 10
             ty = 10
-        self.canvas.create_text(
-            tx,
-            ty,
-            text=text,
-            fill="white",
-            anchor="ne",
-            font=("Arial", 16, "bold"),
-            tag="box"
+        if self._index_item is None:
+            self._index_item = self.canvas.create_text(
+                tx,
+                ty,
+                text=text,
+                fill="white",
+                anchor="ne",
+                font=("Arial", 16, "bold"),
+                tag="overlay"
+            )
+        else:
+            self.canvas.coords(self._index_item, tx, ty)
+            self.canvas.itemconfig(self._index_item, text=text)
+
+    def box_canvas_rect(self, box):
+        """Return the canvas rectangle of ``box`` at the current zoom/pan."""
+        x1, y1, x2, y2 = box.to_pixel_rect(self.img_w, self.img_h)
+        x1, y1 = image_to_canvas_coords(
+            x1, y1, self.zoom, self.pan_x, self.pan_y, self.crop_x, self.crop_y
+        )
+        x2, y2 = image_to_canvas_coords(
+            x2, y2, self.zoom, self.pan_x, self.pan_y, self.crop_x, self.crop_y
         )
-        self.canvas.tag_raise("crosshair")
+        return x1, y1, x2, y2
 
-    def redraw_image(self):
-        # Remove previous image
-        self.canvas.delete("img")
-        # Limit rendering to 16384x16384 pixels (increased from 4096)
-        max_dim = 16384
-        w = min(int(self.img_pil.width * self.zoom), max_dim)
-        h = min(int(self.img_pil.height * self.zoom), max_dim)
-        w = max(1, w)
-        h = max(1, h)
-
-        if self.zoom == 1.0:
-            # Show the original image, centered if needed
-            img_to_show = self.img_pil
-            display_w, display_h = self.img_pil.width, self.img_pil.height
-            pan_x, pan_y = self.pan_x, self.pan_y
-            self.crop_x, self.crop_y = 0, 0
+    def box_canvas_rects(self, boxes):
+        """Vectorised :meth:`box_canvas_rect` for a list of boxes."""
+        r = BoxArray.from_boxes(boxes, np.float64).to_pixel_rects(
+            self.img_w, self.img_h
+        )
+        x1, y1 = image_to_canvas_coords(
+            r[:, 0], r[:, 1], self.zoom, self.pan_x, self.pan_y, self.crop_x, self.crop_y
+        )
+        x2, y2 = image_to_canvas_coords(
+            r[:, 2], r[:, 3], self.zoom, self.pan_x, self.pan_y, self.crop_x, self.crop_y
+        )
+        return zip(x1.tolist(), y1.tolist(), x2.tolist(), y2.tolist())
+
+    def update_hud(self):
+        """Show frame time, per-stage latency percentiles and memory use
+        over the canvas while tracing is enabled."""
+        stats = self.scheduler.stats()
+        lines = [
+            f"frame {stats['last_frame_ms']:5.1f} ms  mean {stats['mean_frame_ms']:5.1f}"
+            f"  max {stats['max_frame_ms']:5.1f}  dropped {stats['dropped']}"
+        ]
+        for name, s in TRACER.summary().items():
+            lines.append(
+                f"{name:<14} p50 {s['p50_ms']:6.1f}  p95 {s['p95_ms']:6.1f}  p99 {s['p99_ms']:6.1f} ms"
+            )
+        memory = TRACER.sample_memory()
+        if memory is not None:
+            lines.append(f"memory {memory[0] / 2**20:.0f} MB  peak {memory[1] / 2**20:.0f} MB")
+        text = "\n".join(lines)
+        if self._hud_item is None:
+            self._hud_item = self.canvas.create_text(
+                10, 10, text=text, fill="yellow", anchor="nw", font="TkFixedFont", tag=("overlay", "hud")
+            )
+            self.canvas.tag_raise("overlay")
+        else:
+            self.canvas.itemconfig(self._hud_item, text=text)
+        self._hud_job = self.after(HUD_INTERVAL_MS, self.update_hud)
+
+    def update_crop(self):
+        """Derive ``crop_x``/``crop_y`` from zoom and pan.
+
+        Called as soon as either changes, so that hit testing matches the
+        new view before the next frame has been drawn.
+        """
+        if self.zoom == self.min_zoom:
+            self.crop_x, self.crop_y = -self.pan_x / self.zoom, -self.pan_y / self.zoom
+        else:
+            ox, oy = self._view_origin(self.canvas.winfo_width(), self.canvas.winfo_height())
+            self.crop_x, self.crop_y = ox / self.zoom, oy / self.zoom
+
+    @traced("redraw_image")
+    def redraw_image(self, fast=False):
+        """Bring the image item up to date with zoom and pan.
+
+        Returns the ``(dx, dy)`` the image item was moved by if the view
+        could be shown by translating it, or ``None`` if it was redrawn.
+        """
+        self.update_crop()
+        if self.zoom == self.min_zoom:
+            # Show the whole image, centered if needed. Its PhotoImage only
+            # depends on the image buffer, so it is built once per buffer.
+            self._origin = None
+            view = (self.zoom, self.pan_x, self.pan_y)
+            if view == self._view:
+                return 0, 0
+            if self._base_tk is None:
+                size = self.renderer.zoomed_size(self.zoom)
+                if self.img_pil.size == size:
+                    base = self.img_pil
+                else:
+                    base = self.renderer.render(0, 0, size[0], size[1], self.zoom)
+                self._base_tk = ImageTk.PhotoImage(base)
+            self.image_tk = self._base_tk
+            pos = (self.pan_x, self.pan_y)
+            fast = False
         else:
-            # Calculate crop box in original image coordinates
-            # The region of the image to show is (canvas_w, canvas_h) in display, but at 1/zoom scale in the image
             canvas_w = self.canvas.winfo_width()
             canvas_h = self.canvas.winfo_height()
-            # Center of the view in image coordinates
-            center_x = (-self.pan_x + canvas_w / 2) / self.zoom
-            center_y = (-self.pan_y + canvas_h / 2) / self.zoom
-            # Size of the crop box in image coordinates
-            crop_w = canvas_w / self.zoom
-            crop_h = canvas_h / self.zoom
-            # Crop box
-            left = max(0, int(center_x - crop_w / 2))
-            upper = max(0, int(center_y - crop_h / 2))
-            right = min(self.img_pil.width, int(center_x + crop_w / 2))
-            lower = min(self.img_pil.height, int(center_y + crop_h / 2))
-            img_cropped = self.img_pil.crop((left, upper, right, lower))
-            # Resize cropped region to fit canvas
-            img_to_show = img_cropped.resize((canvas_w, canvas_h), Image.LANCZOS)
-            display_w, display_h = canvas_w, canvas_h
-            pan_x, pan_y = 0, 0
-            self.crop_x, self.crop_y = left, upper
-
-        self.image_tk = ImageTk.PhotoImage(img_to_show)
-        self.canvas.create_image(pan_x, pan_y, anchor="nw", image=self.image_tk, tag="img")
+            ox, oy = self._view_origin(canvas_w, canvas_h)
+            if self._buffer_covers(ox, oy, canvas_w, canvas_h) and (fast or not self._view_fast):
+                if self._settle_job is not None:
+                    # Keep the high quality pass from landing mid-pan
+                    self.after_cancel(self._settle_job)
+                    self._settle_job = self.after(SETTLE_DELAY_MS, self._settle)
+                return self._move_image(ox, oy)
+            # Render the viewport plus an overscan margin. Fast zoom steps
+            # skip the margin: the next step replaces the buffer anyway.
+            zooming = self._view is None or self._view[0] != self.zoom
+            margin = 0 if fast and zooming else OVERSCAN_PX
+            zoomed_w, zoomed_h = self.renderer.zoomed_size(self.zoom)
+            bx, by = max(0, ox - margin), max(0, oy - margin)
+            bw = min(zoomed_w, ox + canvas_w + margin) - bx
+            bh = min(zoomed_h, oy + canvas_h + margin) - by
+            img_to_show = self.renderer.render(bx, by, bw, bh, self.zoom, fast)
+            self.image_tk = ImageTk.PhotoImage(img_to_show)
+            view = (self.zoom, bx, by, bw, bh)
+            self._origin = (ox, oy)
+            pos = (bx - ox, by - oy)
+
+        self._view, self._view_fast = view, fast
+        if self._settle_job is not None:
+            self.after_cancel(self._settle_job)
+            self._settle_job = None
+        if fast:
+            # Re-render with the high quality filter once the view settles
+            self._settle_job = self.after(SETTLE_DELAY_MS, self._settle)
+        self.canvas.delete("img")
+        self.canvas.create_image(*pos, anchor="nw", image=self.image_tk, tag="img")
+        self.canvas.tag_lower("img")
+        return None
+
+    def _view_origin(self, canvas_w, canvas_h):
+        # The visible region starts at -pan in zoomed space; snap it to
+        # whole pixels so that cached tiles line up between redraws.
+        zoomed_w, zoomed_h = self.renderer.zoomed_size(self.zoom)
+        ox = min(max(0, int(round(-self.pan_x))), max(0, zoomed_w - canvas_w))
+        oy = min(max(0, int(round(-self.pan_y))), max(0, zoomed_h - canvas_h))
+        return ox, oy
+
+    def _buffer_covers(self, ox, oy, canvas_w, canvas_h):
+        """Whether the rendered buffer still covers the viewport at
+        ``(ox, oy)`` with at least ``OVERSCAN_REFILL_PX`` to spare, except
+        where the viewport touches the image edge."""
+        if self._origin is None or self._view is None or self._view[0] != self.zoom:
+            return False
+        _, bx, by, bw, bh = self._view
+        zoomed_w, zoomed_h = self.renderer.zoomed_size(self.zoom)
+        edge = OVERSCAN_REFILL_PX
+        return (
+            max(0, ox - edge) >= bx
+            and max(0, oy - edge) >= by
+            and min(zoomed_w, ox + canvas_w + edge) <= bx + bw
+            and min(zoomed_h, oy + canvas_h + edge) <= by + bh
+        )
+
+    def _move_image(self, ox, oy):
+        """Translate the image item so that ``(ox, oy)`` is at the canvas
+        origin; returns the canvas offset applied."""
+        dx, dy = self._origin[0] - ox, self._origin[1] - oy
+        self._origin = (ox, oy)
+        if dx or dy:
+            self.canvas.move("img", dx, dy)
+        return dx, dy
+
+    def ensure_resolution(self):
+        """Start a full resolution decode once zoom exceeds the buffer's."""
+        if self._full_decode is not None or self.img_pil.width >= self.img_w:
+            return
+        if self.zoom <= self.img_pil.width / self.img_w:
+            return
+        idx = self.dataset.current_index()
+        self._full_decode = (idx, self.prefetcher.decode_full(idx))
+        self.after(FULL_DECODE_POLL_MS, self._poll_full_decode)
+
+    def _poll_full_decode(self):
+        if self._full_decode is None:
+            return
+        idx, future = self._full_decode
+        if idx != self.dataset.current_index():
+            return  # moved on; load_image reset the buffer
+        if not future.done():
+            self.after(FULL_DECODE_POLL_MS, self._poll_full_decode)
+            return
+        try:
+            image, _ = future.result()
+        except Exception:
+            return  # keep showing the reduced buffer
+        # Swap in the full buffer; the reduced one stays in the prefetch cache
+        self.img_pil = image
+        self.renderer = ViewportRenderer(image, size=(self.img_w, self.img_h))
+        self._base_tk = None
+        self._view = None
+        self._origin = None
+        self.refresh()
+
+    def _settle(self):
+        self._settle_job = None
+        self.scheduler.request(IMAGE_LAYER)
 
     def on_click(self, event):
         # Adjust event coordinates for zoom and pan
         zx, zy = canvas_to_image_coords(
             event.x, event.y, self.zoom, self.pan_x, self.pan_y, self.crop_x, self.crop_y
         )
-        box = smallest_box_containing_point(
-            self.boxes, zx, zy, self.img_pil.width, self.img_pil.height
-        )
+        box = self.box_index.smallest_containing(zx, zy)
         if box is not None:
             self.selected_box = box
             self.dragging = True
             return
         self.selected_box = None
         self.start_draw = (zx, zy)
+        self._draw_end = None
 
     def on_drag(self, event):
         zx, zy = canvas_to_image_coords(
             event.x, event.y, self.zoom, self.pan_x, self.pan_y, self.crop_x, self.crop_y
         )
+        layers = [CROSSHAIR_LAYER]
         if self.dragging and self.selected_box:
-            w, h = self.img_pil.width, self.img_pil.height
+            w, h = self.img_w, self.img_h
             self.selected_box.x_center = zx / w
             self.selected_box.y_center = zy / h
-            self.refresh()
+            self.box_index.update(self.selected_box)
+            layers.append(BOXES_LAYER)
         elif self.start_draw:
-            self.refresh()
-            x0, y0 = self.start_draw
-            # Transform back to canvas coordinates for drawing
-            x0c, y0c = image_to_canvas_coords(
-                x0, y0, self.zoom, self.pan_x, self.pan_y, self.crop_x, self.crop_y
-            )
-            x1c, y1c = image_to_canvas_coords(
-                zx, zy, self.zoom, self.pan_x, self.pan_y, self.crop_x, self.crop_y
-            )
-            self.canvas.create_rectangle(
-                x0c, y0c, x1c, y1c, outline="white", dash=(4, 2), tag="box"
-            )
-        self.draw_crosshair(event.x, event.y)
+            self._draw_end = (zx, zy)
+            layers.append(BOXES_LAYER)
+        self._pointer = (event.x, event.y)
+        self.scheduler.request(*layers, fast=True)
 
     def on_release(self, event):
         if self.dragging:
@@ -276,7 +558,7 @@ class ImageViewer(tk.Frame):
             x1, y1 = canvas_to_image_coords(
                 event.x, event.y, self.zoom, self.pan_x, self.pan_y, self.crop_x, self.crop_y
             )
-            w, h = self.img_pil.width, self.img_pil.height
+            w, h = self.img_w, self.img_h
             box = BoundingBox.from_pixel_coords(
                 self.last_selected_class_id, x0, y0, x1, y1, w, h, self.dataset.class_names[self.last_selected_class_id]
             )
@@ -284,16 +566,17 @@ class ImageViewer(tk.Frame):
                 # Track if the box was created while boxes are hidden
                 box.created_while_hidden = not self.show_boxes.get()
                 self.boxes.append(box)
+                self.box_index.insert(box)
             self.start_draw = None
-            self.refresh()
-        self.draw_crosshair(event.x, event.y)
+            self._draw_end = None
+        self._pointer = (event.x, event.y)
+        self.refresh()
+
     def on_right_click(self, event):
         zx, zy = canvas_to_image_coords(
             event.x, event.y, self.zoom, self.pan_x, self.pan_y, self.crop_x, self.crop_y
         )
-        box = smallest_box_containing_point(
-            self.boxes, zx, zy, self.img_pil.width, self.img_pil.height
-        )
+        box = self.box_index.smallest_containing(zx, zy)
         if box is not None:
             self.selected_box = box
             menu = tk.Menu(self, tearoff=0)
@@ -311,25 +594,28 @@ class ImageViewer(tk.Frame):
             delta = event.delta
         if self.dragging and self.selected_box:
             scale_factor = 1.1 if delta > 0 else 0.9
-            w, h = self.img_pil.width, self.img_pil.height
+            w, h = self.img_w, self.img_h
             new_w = self.selected_box.width * scale_factor
             new_h = self.selected_box.height * scale_factor
             min_w = 10 / w
             min_h = 10 / h
             self.selected_box.width = max(new_w, min_w)
             self.selected_box.height = max(new_h, min_h)
-            self.refresh()
+            self.box_index.update(self.selected_box)
+            self._pointer = (event.x, event.y)
+            self.scheduler.request(BOXES_LAYER, CROSSHAIR_LAYER, fast=True)
         else:
             # Zoom image at mouse pointer
             if platform.system() == "Linux":
                 zoom_factor = 1.1 if delta > 0 else 0.9
             else:
                 zoom_factor = 1.0 + (0.1 if delta > 0 else -0.1)
-            # Compute min and max zoom so that image does not go below original size or exceed 4096x4096
-            min_zoom = 1.0
+            # Compute min and max zoom so that image does not go below its
+            # fitted size or exceed 16384x16384
+            min_zoom = self.min_zoom
             max_dim = 16384  # Increased from 4096
-            max_zoom_w = max_dim / self.img_pil.width
-            max_zoom_h = max_dim / self.img_pil.height
+            max_zoom_w = max(1.0, max_dim / self.img_w)
+            max_zoom_h = max(1.0, max_dim / self.img_h)
             max_zoom = min(max_zoom_w, max_zoom_h)
             new_zoom = max(min_zoom, min(max_zoom, self.zoom * zoom_factor))
             if new_zoom == self.zoom:
@@ -339,48 +625,50 @@ class ImageViewer(tk.Frame):
                 mouse_x, mouse_y, self.zoom, self.pan_x, self.pan_y, self.crop_x, self.crop_y
             )
             self.zoom = new_zoom
-            if self.zoom == 1.0:
+            if self.zoom == self.min_zoom:
                 # Center image on canvas
                 canvas_w = self.canvas.winfo_width()
                 canvas_h = self.canvas.winfo_height()
-                self.pan_x = (canvas_w - self.img_pil.width) // 2
-                self.pan_y = (canvas_h - self.img_pil.height) // 2
+                zoomed_w, zoomed_h = self.renderer.zoomed_size(self.zoom)
+                self.pan_x = (canvas_w - zoomed_w) // 2
+                self.pan_y = (canvas_h - zoomed_h) // 2
             else:
                 self.pan_x = mouse_x - rel_x * self.zoom
                 self.pan_y = mouse_y - rel_y * self.zoom
-            self.refresh()
-        self.draw_crosshair(event.x, event.y)
+            self.update_crop()
+            self.ensure_resolution()
+            self._pointer = (event.x, event.y)
+            self.scheduler.request(*ALL_LAYERS, fast=True)
 
     def on_pan_start(self, event):
-        if self.zoom > 1.0:
+        if self.zoom > self.min_zoom:
             self.panning = True
             self.pan_start = (event.x, event.y, self.pan_x, self.pan_y)
 
     def on_pan_move(self, event):
-        if self.panning and self.zoom > 1.0 and self.pan_start:
+        if self.panning and self.zoom > self.min_zoom and self.pan_start:
             x0, y0, pan_x0, pan_y0 = self.pan_start
             dx = event.x - x0
             dy = event.y - y0
             new_pan_x = pan_x0 + dx
             new_pan_y = pan_y0 + dy
 
-            # Calculate canvas and crop region
             canvas_w = self.canvas.winfo_width()
             canvas_h = self.canvas.winfo_height()
-            crop_w = canvas_w / self.zoom
-            crop_h = canvas_h / self.zoom
 
             # Compute allowed pan range so crop stays within image
-            min_pan_x = int(canvas_w - self.img_pil.width * self.zoom)
+            min_pan_x = int(canvas_w - self.img_w * self.zoom)
             max_pan_x = 0
-            min_pan_y = int(canvas_h - self.img_pil.height * self.zoom)
+            min_pan_y = int(canvas_h - self.img_h * self.zoom)
             max_pan_y = 0
 
             # Clamp pan so that the image does not move out of bounds
             self.pan_x = min(max(new_pan_x, min_pan_x), max_pan_x)
             self.pan_y = min(max(new_pan_y, min_pan_y), max_pan_y)
-            self.refresh()
-            self.draw_crosshair(event.x, event.y)
+            self.update_crop()
+            # Panning within the overscan buffer only moves canvas items
+            self._pointer = (event.x, event.y)
+            self.scheduler.request(IMAGE_LAYER, CROSSHAIR_LAYER, fast=True)
 
     def on_pan_end(self, event):
         self.panning = False
@@ -400,6 +688,7 @@ class ImageViewer(tk.Frame):
     def delete_selected(self, event=None):
         if self.selected_box:
             self.boxes.remove(self.selected_box)
+            self.box_index.remove(self.selected_box)
             self.selected_box = None
             self.refresh()
 
@@ -412,41 +701,165 @@ class ImageViewer(tk.Frame):
             else:
                 self.selected_box.class_name = str(class_id)
             self.selected_box.color = self.selected_box._generate_color(class_id)
+            if self.class_callback:
+                self.class_callback(class_id)
             self.refresh()
 
-    def save_labels(self):
-        self.dataset.save_labels(self.boxes)
+    def save_labels(self, force=False):
+        # Unchanged labels are not rewritten, but saving an image without a
+        # label file still creates an empty one to mark it as background.
+        text = self.dataset.format_labels(self.boxes)
+        if force or text != self._clean_text or not self.dataset.has_label(self.dataset.current_index()):
+            if self.labels_changed_on_disk() and not self.confirm_overwrite():
+                self.reload_labels()
+                return
+            self.dataset.save_labels(text, background=True)
+            self._clean_text = text
+            self._label_conflict = False
+        self.report_write_errors(self.dataset.label_write_errors())
         self.update_info_area()
 
+    def labels_changed_on_disk(self):
+        """Whether another program changed the current label file since it
+        was loaded or last saved here."""
+        stamp = self.dataset.label_stamp()
+        if stamp == self._label_stamp:
+            return False
+        if self.dataset.pending_labels() is not None:
+            return False  # our own save has not landed yet
+        if stamp is not None and stamp == self.dataset.written_stamp(self.dataset.current_label_path()):
+            self._label_stamp = stamp
+            return False
+        return True
+
+    def confirm_overwrite(self):
+        name = os.path.basename(self.dataset.current_label_path())
+        return messagebox.askyesno(
+            "Labels changed on disk",
+            f"{name} was changed by another program since it was opened.\n\n"
+            "Overwrite it with your edits? Choose No to load the version on disk instead.",
+        )
+
+    def reload_labels(self):
+        """Replace the boxes by the current content of the label file."""
+        idx = self.dataset.current_index()
+        self.boxes = self.dataset.reload_box_array(idx).to_boxes(self.dataset.class_names)
+        self._clean_text = self.dataset.format_labels(self.boxes)
+        self._label_stamp = self.dataset.label_stamp(idx)
+        self._label_conflict = False
+        self.box_index = BoxIndex(self.boxes, self.img_w, self.img_h)
+        self.selected_box = None
+        self.box_layer.clear()
+        self.refresh()
+
+    def check_labels_on_disk(self):
+        """Pick up changes other programs made to the current label file:
+        reload it if there are no unsaved edits, otherwise mark the labels
+        as changed on disk (saving then asks before overwriting)."""
+        if self._label_conflict or not self.labels_changed_on_disk():
+            return
+        if self.is_dirty():
+            self._label_conflict = True
+            self.update_info_area()
+        else:
+            self.reload_labels()
+
+    def images_changed(self, rows):
+        """Follow images added to or removed from the split; ``rows`` as
+        returned by :meth:`YoloDataset.apply_changes`. The dataset keeps its
+        current index on the same image while it exists."""
+        if self.view is not None:
+            self.view.reindex(rows)
+        if self.dataset.total_images() == 0:
+            return
+        if self.dataset.current_image_path() != self._image_path:
+            self.load_image()
+            return
+        self.index_var.set(str(self.dataset.current_index() + 1))
+        self.total_label.config(text=f"/{self.dataset.total_images()}")
+        self.scheduler.request(OVERLAY_LAYER)
+
+    def report_write_errors(self, errors):
+        if not errors:
+            return
+        if any(path == self.dataset.current_label_path() for path, _ in errors):
+            self._clean_text = None
+        details = "\n".join(f"{os.path.basename(path)}: {e}" for path, e in errors)
+        messagebox.showerror("Error", f"Failed to save labels:\n{details}")
+
     def clear_label_file(self):
         self.boxes = []
+        self.box_index = BoxIndex(self.boxes, self.img_w, self.img_h)
         self.selected_box = None
-        self.dataset.save_labels(self.boxes)
+        self.save_labels(force=True)
         self.refresh()
-        self.update_info_area()
+
+    def set_view(self, view):
+        """Restrict Prev/Next to the images of ``view`` (``None`` for all),
+        moving to its first image after the current one if needed."""
+        self.view = view
+        if view is None or self.dataset.current_index() in view:
+            self.scheduler.request(OVERLAY_LAYER)
+            return
+        idx = view.next(self.dataset.current_index())
+        if idx is None:
+            idx = view.first()
+        if idx is not None:
+            self.dataset.set_index(idx)
+            self.load_image()
 
     def next_image(self):
-        self.dataset.next()
+        if self.view is None:
+            self.dataset.next()
+        else:
+            idx = self.view.next(self.dataset.current_index())
+            if idx is None:
+                return
+            self.dataset.set_index(idx)
         self.load_image()
 
     def prev_image(self):
-        self.dataset.prev()
+        if self.view is None:
+            self.dataset.prev()
+        else:
+            idx = self.view.prev(self.dataset.current_index())
+            if idx is None:
+                return
+            self.dataset.set_index(idx)
         self.load_image()
 
-    def draw_crosshair(self, x, y):
-        self.canvas.delete("crosshair")
+    def draw_crosshair(self):
+        # Two long-lived lines, moved in place with coords
+        if self._pointer is None:
+            if self._crosshair is not None and not self._crosshair_hidden:
+                self.canvas.itemconfig("crosshair", state="hidden")
+                self._crosshair_hidden = True
+            return
+        x, y = self._pointer
         w = self.canvas.winfo_width()
         h = self.canvas.winfo_height()
-        self.canvas.create_line(x, 0, x, h, fill="white", width=1, tag="crosshair")
-        self.canvas.create_line(0, y, w, y, fill="white", width=1, tag="crosshair")
-        self.canvas.tag_raise("crosshair")
+        if self._crosshair is None:
+            self._crosshair = (
+                self.canvas.create_line(x, 0, x, h, fill="white", width=1, tag="crosshair"),
+                self.canvas.create_line(0, y, w, y, fill="white", width=1, tag="crosshair"),
+            )
+            self.canvas.tag_raise("crosshair")
+            return
+        vertical, horizontal = self._crosshair
+        self.canvas.coords(vertical, x, 0, x, h)
+        self.canvas.coords(horizontal, 0, y, w, y)
+        if self._crosshair_hidden:
+            self.canvas.itemconfig("crosshair", state="normal")
+            self._crosshair_hidden = False
 
     def on_canvas_enter(self, event):
-        self.draw_crosshair(event.x, event.y)
+        self._pointer = (event.x, event.y)
+        self.scheduler.request(CROSSHAIR_LAYER)
 
     def on_canvas_leave(self, event):
-        self.canvas.delete("crosshair")
+        self._pointer = None
+        self.scheduler.request(CROSSHAIR_LAYER)
 
     def on_canvas_move(self, event):
-        self.draw_crosshair(event.x, event.y)
-
+        self._pointer = (event.x, event.y)
+        self.scheduler.request(CROSSHAIR_LAYER)
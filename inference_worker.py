@@ -0,0 +1,155 @@
+"""Run YOLO inference in a separate process.
+
+The Tk thread only submits image paths and polls for results. The worker
+drains its request queue before each run, so requests for images the user
+has already navigated past are coalesced into the most recent one. The
+plotted RGB frame is handed back through a ``SharedMemory`` block that the
+worker creates and the main process copies out of and unlinks.
+"""
+
+import multiprocessing
+import queue
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+
+def load_yolo(model_path):
+    from ultralytics import YOLO
+
+    return YOLO(model_path)
+
+
+def _plot_frame(model, image_path):
+    import cv2
+
+    results = model(image_path, verbose=False)
+    if not results:
+        return None
+    return cv2.cvtColor(results[0].plot(), cv2.COLOR_BGR2RGB)
+
+
+def _share(frame):
+    shm = SharedMemory(create=True, size=max(1, frame.nbytes))
+    np.ndarray(frame.shape, frame.dtype, buffer=shm.buf)[...] = frame
+    name = shm.name
+    # The receiving process unlinks the block; stop this process's resource
+    # tracker from "cleaning up" (and warning about) it on exit.
+    resource_tracker.unregister(shm._name, "shared_memory")
+    shm.close()
+    return name, frame.shape, frame.dtype.str
+
+
+def _worker_main(model_path, loader, plot, requests, results):
+    try:
+        model = loader(model_path)
+    except Exception as e:
+        results.put(("error", None, f"Failed to load model:\n{e}"))
+        return
+    results.put(("ready", None, None))
+    while True:
+        request = requests.get()
+        # Coalesce: only the most recent request is worth running
+        while request is not None:
+            try:
+                request = requests.get_nowait()
+            except queue.Empty:
+                break
+        if request is None:
+            return
+        request_id, image_path = request
+        try:
+            frame = plot(model, image_path)
+            if frame is None:
+                results.put(("empty", request_id, None))
+            else:
+                results.put(("frame", request_id, _share(frame)))
+        except Exception as e:
+            results.put(("error", request_id, f"Inference failed:\n{e}"))
+
+
+def _take_frame(payload, copy=True):
+    name, shape, dtype = payload
+    shm = SharedMemory(name=name)
+    try:
+        if copy:
+            view = np.ndarray(shape, np.dtype(dtype), buffer=shm.buf)
+            frame = view.copy()
+            del view
+            return frame
+        return None
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+class InferenceWorker:
+    """Handle to a model running in a spawned process.
+
+    :meth:`submit` never blocks. :meth:`poll` returns ``None`` while nothing
+    new is available, otherwise ``("frame", request_id, ndarray)``,
+    ``("empty", request_id, None)`` or ``("error", request_id, message)`` for
+    the latest request only; results of superseded requests are dropped.
+    ``request_id`` is ``None`` for errors raised while loading the model.
+    """
+
+    def __init__(self, model_path, loader=load_yolo, plot=_plot_frame):
+        # Spawn rather than fork: the parent runs Tk and torch threads.
+        ctx = multiprocessing.get_context("spawn")
+        self.model_path = model_path
+        self.ready = False
+        self._requests = ctx.Queue()
+        self._results = ctx.Queue()
+        self._latest = 0
+        self._process = ctx.Process(
+            target=_worker_main,
+            args=(model_path, loader, plot, self._requests, self._results),
+            name="annoq-inference",
+            daemon=True,
+        )
+        self._process.start()
+
+    def is_alive(self):
+        return self._process.is_alive()
+
+    def submit(self, image_path):
+        self._latest += 1
+        self._requests.put((self._latest, image_path))
+        return self._latest
+
+    def poll(self, timeout=0):
+        """Return the newest relevant result, waiting up to ``timeout`` seconds
+        for the first message."""
+        latest = None
+        block = timeout > 0
+        while True:
+            try:
+                kind, request_id, payload = self._results.get(block, timeout if block else None)
+            except queue.Empty:
+                return latest
+            block = False
+            if kind == "ready":
+                self.ready = True
+                continue
+            current = request_id is None or request_id == self._latest
+            if kind == "frame":
+                payload = _take_frame(payload, copy=current)
+            if current:
+                latest = (kind, request_id, payload)
+
+    def close(self, timeout=2.0):
+        if self._process.is_alive():
+            self._requests.put(None)
+            self._process.join(timeout)
+            if self._process.is_alive():
+                self._process.terminate()
+                self._process.join()
+        # Release any frames that were produced but never polled
+        while True:
+            try:
+                kind, _, payload = self._results.get_nowait()
+            except (queue.Empty, OSError, ValueError):
+                break
+            if kind == "frame":
+                _take_frame(payload, copy=False)
@@ -0,0 +1,396 @@
+"""Split-wide label table stored as one memory-mappable file.
+
+All boxes of a split live in contiguous columns (``image_idx``,
+``class_ids``, ``xc``, ``yc``, ``w``, ``h``) ordered by image, with an
+``offsets`` array so the boxes of image ``i`` are rows
+``offsets[i]:offsets[i + 1]``. Reading one image's boxes is a slice of the
+memory map, and dataset-wide questions become NumPy expressions instead of
+a pass over every label file.
+
+File layout: an 8 byte magic, the length of a JSON header as a little
+endian ``uint64``, the header, then each array 64-byte aligned. The header
+lists the image names and the offset (relative to the end of the header
+padding), dtype and shape of every array, so any array can be opened with
+``numpy.memmap``.
+
+Each image row also records the size and ``mtime_ns`` of its label file
+(-1 when there is none). On open only files whose stat changed are parsed
+again, in parallel for large batches.
+"""
+
+import bisect
+import json
+import multiprocessing
+import os
+import struct
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import storage
+from box_array import BoxArray
+from cache import dataset_cache_dir
+from manifest import label_indices, label_name
+from stats import CHUNK_SIZE, SERIAL_THRESHOLD, scan_label_dir
+
+PACK_NAME = "labels.pack"
+PACK_VERSION = 1
+MAGIC = b"ANNOQLP1"
+ALIGN = 64
+MISSING = -1
+
+BOX_COLUMNS = (
+    ("image_idx", np.int32),
+    ("class_ids", np.int32),
+    ("xc", np.float32),
+    ("yc", np.float32),
+    ("w", np.float32),
+    ("h", np.float32),
+)
+IMAGE_COLUMNS = (
+    ("offsets", np.int64),
+    ("label_sizes", np.int64),
+    ("label_mtimes", np.int64),
+)
+
+
+def moved_rows(names, added, removed):
+    """Old index of every image of the sorted ``names`` after ``added``
+    names were inserted into the split and ``removed`` ones deleted; -1 for
+    the added images."""
+    added, removed = sorted(added), sorted(removed)
+    new = [bisect.bisect_left(names, name) for name in added]
+    # Images before a removed one in the old order: those still there minus
+    # the added ones, plus the removed ones
+    gone = [bisect.bisect_left(names, name) - bisect.bisect_left(added, name) + k for k, name in enumerate(removed)]
+    rows = np.full(len(names), -1, dtype=np.int64)
+    rows[np.delete(np.arange(len(names)), new)] = np.delete(np.arange(len(names) - len(added) + len(removed)), gone)
+    return rows
+
+
+def _read_boxes(path):
+    try:
+        return BoxArray.from_file(path)
+    except (OSError, ValueError):
+        return BoxArray()
+
+
+def _parse_chunk(label_dir, names):
+    """Parse label files into ``(lengths, class_ids, xc, yc, w, h)``."""
+    parsed = [_read_boxes(os.path.join(label_dir, name)) for name in names]
+    lengths = np.array([len(b) for b in parsed], dtype=np.int64)
+    columns = [
+        np.concatenate([getattr(b, col) for b in parsed] or [np.empty(0, dtype)]).astype(dtype)
+        for col, dtype in BOX_COLUMNS[1:]
+    ]
+    return (lengths, *columns)
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def read_pack(path):
+    """Return ``(names, arrays)`` of the pack at ``path`` (arrays memory
+    mapped read-only), or ``None`` if it is missing or unreadable."""
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            (size,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(size))
+    except (OSError, ValueError, struct.error):
+        return None
+    if header.get("version") != PACK_VERSION:
+        return None
+    data_start = _align(len(MAGIC) + 8 + size)
+    arrays = {}
+    try:
+        for name, (offset, dtype, shape) in header["arrays"].items():
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.empty(shape, dtype)
+            else:
+                arrays[name] = np.memmap(
+                    path, dtype=dtype, mode="r", offset=data_start + offset, shape=tuple(shape)
+                )
+    except (KeyError, ValueError, OSError):
+        return None
+    return header["names"], arrays
+
+
+def write_pack(path, names, arrays):
+    """Atomically write ``arrays`` (a name -> ndarray mapping) to ``path``."""
+    layout = {}
+    offset = 0
+    for name, arr in arrays.items():
+        offset = _align(offset)
+        layout[name] = (offset, arr.dtype.str, list(arr.shape))
+        offset += arr.nbytes
+    header = json.dumps({"version": PACK_VERSION, "names": list(names), "arrays": layout}).encode()
+    data_start = _align(len(MAGIC) + 8 + len(header))
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for name, arr in arrays.items():
+            f.seek(data_start + layout[name][0])
+            f.write(np.ascontiguousarray(arr).tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp, path)
+
+
+class LabelPack:
+    """Boxes of every image in a split; see the module docstring.
+
+    Open with :meth:`open`. Saved labels are applied with :meth:`refresh`
+    and kept in memory until :meth:`save` rewrites the file.
+    """
+
+    def __init__(self, names, label_dir, path, arrays):
+        # Sorted, like the manifest's
+        self.names = list(names)
+        self.label_dir = label_dir
+        self.path = path
+        self._lock = threading.RLock()
+        self._overrides = {}
+        self._stats = {}
+        # Set when rows were added or removed since the last save
+        self._reindexed = False
+        self._set_arrays(arrays)
+
+    def _set_arrays(self, arrays):
+        for name, _ in BOX_COLUMNS + IMAGE_COLUMNS:
+            setattr(self, name, arrays[name])
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def box_count(self):
+        with self._lock:
+            extra = sum(
+                len(b) - int(self.offsets[i + 1] - self.offsets[i])
+                for i, b in self._overrides.items()
+            )
+        return len(self.class_ids) + extra
+
+    @property
+    def dirty(self):
+        return bool(self._overrides or self._stats or self._reindexed)
+
+    # --- building -------------------------------------------------------
+
+    @classmethod
+    def open(cls, manifest, cache_path=None, workers=None):
+        """Open the pack of ``manifest``'s split, re-parsing only label files
+        that changed since it was written, and save it if anything did."""
+        path = cache_path or os.path.join(dataset_cache_dir(manifest.label_dir), PACK_NAME)
+        names = list(manifest.names)
+        label_dir = manifest.label_dir
+        on_disk = scan_label_dir(label_dir)
+        stats = [on_disk.get(label_name(n), (MISSING, MISSING)) for n in names]
+        sizes = np.array([s for s, _ in stats], dtype=np.int64)
+        mtimes = np.array([m for _, m in stats], dtype=np.int64)
+
+        old = read_pack(path)
+        if old is not None:
+            old_names, old_arrays = old
+            if (
+                old_names == names
+                and np.array_equal(old_arrays["label_sizes"], sizes)
+                and np.array_equal(old_arrays["label_mtimes"], mtimes)
+            ):
+                return cls(names, label_dir, path, old_arrays)
+        else:
+            old_names, old_arrays = [], None
+
+        # Work out, per image, where its boxes come from: the old pack when
+        # the label file is unchanged, otherwise a fresh parse.
+        old_row = {n: i for i, n in enumerate(old_names)}
+        reuse = {}
+        stale = []
+        for idx, name in enumerate(names):
+            j = old_row.get(name)
+            if (
+                j is not None
+                and old_arrays["label_sizes"][j] == sizes[idx]
+                and old_arrays["label_mtimes"][j] == mtimes[idx]
+            ):
+                reuse[idx] = j
+            elif sizes[idx] != MISSING:
+                stale.append(idx)
+
+        chunks = [stale[i:i + CHUNK_SIZE] for i in range(0, len(stale), CHUNK_SIZE)]
+        jobs = [[label_name(names[i]) for i in chunk] for chunk in chunks]
+        workers = workers or os.cpu_count() or 1
+        if len(stale) <= SERIAL_THRESHOLD or workers == 1:
+            results = [_parse_chunk(label_dir, job) for job in jobs]
+        else:
+            ctx = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+                results = list(pool.map(_parse_chunk, [label_dir] * len(jobs), jobs))
+
+        parsed = {}
+        for chunk, (lengths, *columns) in zip(chunks, results):
+            starts = np.concatenate(([0], np.cumsum(lengths)))
+            for k, idx in enumerate(chunk):
+                parsed[idx] = (columns, starts[k], starts[k + 1])
+
+        lengths = np.zeros(len(names), dtype=np.int64)
+        pieces = {col: [] for col, _ in BOX_COLUMNS[1:]}
+        for idx in range(len(names)):
+            if idx in reuse:
+                j = reuse[idx]
+                s, e = old_arrays["offsets"][j], old_arrays["offsets"][j + 1]
+                source = [old_arrays[col][s:e] for col, _ in BOX_COLUMNS[1:]]
+            elif idx in parsed:
+                columns, s, e = parsed[idx]
+                source = [c[s:e] for c in columns]
+            else:
+                continue
+            lengths[idx] = len(source[0])
+            for (col, _), values in zip(BOX_COLUMNS[1:], source):
+                pieces[col].append(values)
+
+        arrays = {
+            "image_idx": np.repeat(np.arange(len(names), dtype=np.int32), lengths),
+            "offsets": np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+            "label_sizes": sizes,
+            "label_mtimes": mtimes,
+        }
+        for col, dtype in BOX_COLUMNS[1:]:
+            arrays[col] = np.concatenate(pieces[col] or [np.empty(0, dtype)]).astype(dtype)
+        pack = cls(names, label_dir, path, arrays)
+        pack.save(force=True)
+        return pack
+
+    def save(self, force=False):
+        """Write pending changes to disk and re-map the file."""
+        with self._lock:
+            if not (force or self.dirty):
+                return
+            arrays = self._merged()
+            # Drop the old mappings before the file is replaced
+            self._set_arrays(arrays)
+            write_pack(self.path, self.names, {n: arrays[n] for n, _ in BOX_COLUMNS + IMAGE_COLUMNS})
+            self._overrides.clear()
+            self._stats.clear()
+            self._reindexed = False
+            mapped = read_pack(self.path)
+            if mapped is not None:
+                self._set_arrays(mapped[1])
+
+    def _merged(self):
+        sizes = np.array(self.label_sizes, dtype=np.int64)
+        mtimes = np.array(self.label_mtimes, dtype=np.int64)
+        for idx, (size, mtime_ns) in self._stats.items():
+            sizes[idx], mtimes[idx] = size, mtime_ns
+        if not self._overrides:
+            arrays = {col: np.asarray(getattr(self, col)) for col, _ in BOX_COLUMNS}
+            arrays["offsets"] = np.asarray(self.offsets)
+        else:
+            lengths = np.diff(np.asarray(self.offsets))
+            pieces = {col: [] for col, _ in BOX_COLUMNS[1:]}
+            for idx in range(len(self.names)):
+                boxes = self.boxes(idx)
+                lengths[idx] = len(boxes)
+                for col, _ in BOX_COLUMNS[1:]:
+                    pieces[col].append(getattr(boxes, col))
+            arrays = {
+                col: np.concatenate(pieces[col] or [np.empty(0, dtype)]).astype(dtype)
+                for col, dtype in BOX_COLUMNS[1:]
+            }
+            arrays["image_idx"] = np.repeat(np.arange(len(self.names), dtype=np.int32), lengths)
+            arrays["offsets"] = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        arrays["label_sizes"] = sizes
+        arrays["label_mtimes"] = mtimes
+        return arrays
+
+    # --- access ---------------------------------------------------------
+
+    def boxes(self, idx):
+        """Return the boxes of image ``idx``; a view into the pack unless the
+        image's labels changed since it was last saved."""
+        with self._lock:
+            boxes = self._overrides.get(idx)
+            if boxes is not None:
+                return boxes
+            s, e = int(self.offsets[idx]), int(self.offsets[idx + 1])
+            return BoxArray(
+                self.class_ids[s:e], self.xc[s:e], self.yc[s:e], self.w[s:e], self.h[s:e]
+            )
+
+    def to_yolo_text(self, idx):
+        return self.boxes(idx).to_yolo_text()
+
+    def images_with_classes(self, class_ids):
+        """Sorted indices of the images with a box of any of ``class_ids``."""
+        class_ids = np.asarray(list(class_ids), dtype=np.int32)
+        with self._lock:
+            mask = np.isin(self.class_ids, class_ids)
+            found = set(np.unique(self.image_idx[mask]).tolist())
+            for idx, boxes in self._overrides.items():
+                found.discard(idx)
+                if np.isin(boxes.class_ids, class_ids).any():
+                    found.add(idx)
+        return sorted(found)
+
+    # --- updates --------------------------------------------------------
+
+    def update(self, idx, boxes, stat=(MISSING, MISSING)):
+        """Replace the boxes of image ``idx``; ``stat`` is the label file's
+        ``(size, mtime_ns)``."""
+        boxes = BoxArray(boxes.class_ids, boxes.xc, boxes.yc, boxes.w, boxes.h)
+        with self._lock:
+            self._overrides[idx] = boxes
+            self._stats[idx] = stat
+
+    def refresh(self, idx):
+        """Re-read the label file of image ``idx``."""
+        path = os.path.join(self.label_dir, label_name(self.names[idx]))
+        try:
+            stat = storage.stat(path)
+        except FileNotFoundError:
+            self.update(idx, BoxArray())
+            return
+        self.update(idx, _read_boxes(path), stat)
+
+    def indices_for_label(self, label_path):
+        """Indices of the images whose label file is ``label_path``."""
+        return label_indices(self.names, os.path.basename(label_path))
+
+    def refresh_path(self, label_path):
+        """Re-read ``label_path`` for every image that uses it."""
+        for idx in self.indices_for_label(label_path):
+            self.refresh(idx)
+
+    def reindex(self, names, added, removed):
+        """Follow images ``added`` to and ``removed`` from the split, which
+        now has the sorted ``names``: rows of the other images are kept and
+        the label files of new images are read. Returns the
+        :func:`moved_rows` of the change."""
+        with self._lock:
+            arrays = self._merged()
+            rows = moved_rows(names, added, removed)
+            kept = rows >= 0
+            offsets = arrays["offsets"]
+            lengths = np.where(kept, np.diff(offsets)[rows], 0) if len(offsets) > 1 else np.zeros(len(names), np.int64)
+            new_offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+            # Position of every kept box in the old columns
+            source = np.repeat(offsets[rows[kept]] - new_offsets[:-1][kept], lengths[kept]) + np.arange(new_offsets[-1])
+            reindexed = {col: arrays[col][source] for col, _ in BOX_COLUMNS[1:]}
+            reindexed["image_idx"] = np.repeat(np.arange(len(names), dtype=np.int32), lengths)
+            reindexed["offsets"] = new_offsets
+            for col in ("label_sizes", "label_mtimes"):
+                values = arrays[col][rows] if len(arrays[col]) else np.zeros(len(names), np.int64)
+                reindexed[col] = np.where(kept, values, MISSING).astype(np.int64)
+            self.names = list(names)
+            self._set_arrays(reindexed)
+            self._overrides.clear()
+            self._stats.clear()
+            self._reindexed = True
+            for idx in np.flatnonzero(~kept).tolist():
+                self.refresh(idx)
+        return rows
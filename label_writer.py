@@ -0,0 +1,181 @@
+"""Crash-safe label file writes.
+
+Every label file is written to a temporary file in the same directory,
+flushed to disk with ``fsync`` and renamed over the original, so a crash
+leaves either the old or the new file but never a truncated one.
+
+:class:`LabelWriter` does this on a background thread. Writes queued while
+the thread is busy are coalesced per path and handled as one batch: all
+temporary files are written first, then fsynced together, renamed, and each
+touched directory is fsynced once.
+"""
+
+import os
+import threading
+
+import storage
+
+# Limit on temporary files held open at once within a batch
+MAX_BATCH = 64
+
+
+def _tmp_path(path):
+    # Unique per thread too: a foreground save may race the writer thread
+    head, tail = os.path.split(path)
+    return os.path.join(head, f".{tail}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # e.g. Windows, where directories can't be opened
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _discard(f, tmp):
+    if f is not None:
+        f.close()
+    try:
+        os.remove(tmp)
+    except OSError:
+        pass
+
+
+def write_batch(items):
+    """Atomically write ``(path, text)`` pairs.
+
+    Returns a list of ``(path, exception)`` for the writes that failed; the
+    original files of those are left untouched.
+    """
+    failed = []
+    for start in range(0, len(items), MAX_BATCH):
+        staged = []
+        for path, text in items[start:start + MAX_BATCH]:
+            try:
+                # Labels of archived datasets are written to the overlay
+                target = storage.write_path(path)
+            except OSError as e:
+                failed.append((path, e))
+                continue
+            tmp = _tmp_path(target)
+            f = None
+            try:
+                f = open(tmp, "w")
+                f.write(text)
+                f.flush()
+            except OSError as e:
+                _discard(f, tmp)
+                failed.append((path, e))
+                continue
+            staged.append((path, target, tmp, f))
+        synced = []
+        for path, target, tmp, f in staged:
+            try:
+                os.fsync(f.fileno())
+                f.close()
+            except OSError as e:
+                _discard(f, tmp)
+                failed.append((path, e))
+                continue
+            synced.append((path, target, tmp))
+        dirs = set()
+        for path, target, tmp in synced:
+            try:
+                os.replace(tmp, target)
+            except OSError as e:
+                _discard(None, tmp)
+                failed.append((path, e))
+                continue
+            dirs.add(os.path.dirname(os.path.abspath(target)))
+        for d in dirs:
+            _fsync_dir(d)
+    return failed
+
+
+def write_atomic(path, text):
+    """Write one file atomically, raising on failure."""
+    failed = write_batch([(path, text)])
+    if failed:
+        raise failed[0][1]
+
+
+class LabelWriter:
+    """Background writer for label files.
+
+    ``on_written(path)`` is called on the writer thread after each file is
+    in place. Failed writes are collected and returned by
+    :meth:`take_errors`.
+    """
+
+    def __init__(self, on_written=None):
+        self.on_written = on_written
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._queued = {}
+        self._inflight = {}
+        self._errors = []
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="annoq-label-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, path, text):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("label writer is closed")
+            self._queued[path] = text
+            self._cond.notify_all()
+
+    def pending(self, path):
+        """Return the text waiting to be written to ``path``, or ``None``."""
+        with self._lock:
+            if path in self._queued:
+                return self._queued[path]
+            return self._inflight.get(path)
+
+    def take_errors(self):
+        """Return and forget ``(path, exception)`` pairs of failed writes."""
+        with self._lock:
+            errors, self._errors = self._errors, []
+        return errors
+
+    def flush(self):
+        """Block until every queued write has been attempted."""
+        with self._lock:
+            while (self._queued or self._inflight) and self._thread.is_alive():
+                self._cond.wait()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._queued and not self._closed:
+                    self._cond.wait()
+                if not self._queued:
+                    return
+                self._inflight, self._queued = self._queued, {}
+                batch = list(self._inflight.items())
+            failed = write_batch(batch)
+            failed_paths = {p for p, _ in failed}
+            if self.on_written is not None:
+                for path, _ in batch:
+                    if path not in failed_paths:
+                        try:
+                            self.on_written(path)
+                        except Exception:
+                            pass
+            with self._lock:
+                self._errors.extend(failed)
+                self._inflight = {}
+                self._cond.notify_all()
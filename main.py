@@ -1,32 +1,57 @@
+import multiprocessing
 import os
-import shutil
+import queue
+import threading
+import time
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox, simpledialog
 from yaml_dataset_loader import YamlDatasetLoader
 from yolo_dataset import YoloDataset
+from class_index import FilteredView
 from image_viewer import ImageViewer
-from cache import get_cached_index, update_cache
+from filmstrip import Filmstrip
+from thumbnails import ThumbnailCache
+from watcher import DatasetWatcher
+from cache import get_cached_index
+from session import NEEDS_FIX, REVIEWED, SessionStore
+from inference_worker import InferenceWorker
+import duplicates
+import export
+import preannotate
+import validation
+import tracing
 import argparse
-import cv2
 from PIL import Image, ImageTk
-import yaml
 
 try:
     from ultralytics import YOLO
 except Exception:  # pragma: no cover - optional dependency
     YOLO = None
 
+# How often the inference window checks the worker process for results
+INFERENCE_POLL_MS = 50
+# How often changes found by the dataset watcher are applied
+WATCH_POLL_MS = 500
+# Fixed entries of the navigation filter; one "Class: <name>" entry per
+# class follows them.
+FILTER_ALL = "All images"
+FILTER_BACKGROUND = "Only backgrounds"
+FILTER_MANY_BOXES = "More than K boxes"
+FILTERS = (FILTER_ALL, FILTER_BACKGROUND, FILTER_MANY_BOXES)
+
 class App:
     def __init__(self, root, yaml_path=None, model_path=None):
         self.root = root
         self.root.title("YOLO Dataset Viewer")
 
         # Model / inference state
-        self.model = None
+        self.inference_worker = None
         self.model_path = None
         self.inference_window = None
         self.inference_label = None
         self.inference_photo = None
+        self.inference_poll_job = None
+        self.inference_started = None
 
         # Ask for YAML file
         if not yaml_path:
@@ -48,7 +73,9 @@ class App:
             return
 
         self.yaml_path = os.path.abspath(yaml_path)
-        cached_index = get_cached_index(self.yaml_path)
+        self.session = SessionStore()
+        # Position saved by versions that kept one index per YAML file
+        legacy_index = get_cached_index(self.yaml_path)
 
         splits = self.yaml_loader.get_dataset_splits()
         if not splits:
@@ -62,8 +89,11 @@ class App:
         for split in splits:
             paths = self.yaml_loader.get_paths(split)
             ds = YoloDataset(paths["images"], paths["labels"], class_names)
-            if cached_index is not None:
-                ds.set_index(cached_index)
+            position = self.session.get_position(self.yaml_path, split)
+            if position is None:
+                position = legacy_index
+            if position is not None:
+                ds.set_index(position)
             self.datasets[split] = ds
 
         # GUI dropdown to select split
@@ -77,6 +107,41 @@ class App:
         btn_frame.pack(pady=5)
         tk.Button(btn_frame, text="Show Stats", command=self.show_stats).pack(side=tk.LEFT, padx=5)
         tk.Button(btn_frame, text="Export", command=self.export_dataset).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Pre-annotate", command=self.preannotate_split).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Duplicates", command=self.show_duplicates).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Validate", command=self.show_validation).pack(side=tk.LEFT, padx=5)
+
+        # Review status of the current image
+        review_frame = tk.Frame(root)
+        review_frame.pack(pady=(0, 5))
+        self.review_label = tk.Label(review_frame, text="", width=20, anchor="w")
+        self.review_label.pack(side=tk.LEFT, padx=5)
+        tk.Button(review_frame, text="Reviewed", command=lambda: self.set_review_status(REVIEWED)).pack(side=tk.LEFT, padx=5)
+        tk.Button(review_frame, text="Needs Fix", command=lambda: self.set_review_status(NEEDS_FIX)).pack(side=tk.LEFT, padx=5)
+        tk.Button(review_frame, text="Clear", command=lambda: self.set_review_status(None)).pack(side=tk.LEFT, padx=5)
+        tk.Button(review_frame, text="Next Unreviewed", command=self.next_unreviewed).pack(side=tk.LEFT, padx=5)
+        tk.Button(review_frame, text="Next Needs Fix", command=self.next_needs_fix).pack(side=tk.LEFT, padx=5)
+
+        # Restrict Prev/Next to images matching a filter
+        filter_frame = tk.Frame(root)
+        filter_frame.pack(pady=(0, 5))
+        tk.Label(filter_frame, text="Show").pack(side=tk.LEFT, padx=5)
+        self.filter_selector = ttk.Combobox(
+            filter_frame,
+            values=list(FILTERS) + [f"Class: {name}" for name in class_names],
+            state="readonly",
+            width=30,
+        )
+        self.filter_selector.current(0)
+        self.filter_selector.pack(side=tk.LEFT, padx=5)
+        self.filter_selector.bind("<<ComboboxSelected>>", self.apply_filter)
+        tk.Label(filter_frame, text="K").pack(side=tk.LEFT)
+        self.filter_k = tk.StringVar(value="10")
+        k_entry = tk.Entry(filter_frame, width=5, textvariable=self.filter_k)
+        k_entry.pack(side=tk.LEFT, padx=5)
+        k_entry.bind("<Return>", self.apply_filter)
+        self.filter_status = tk.Label(filter_frame, text="", width=24, anchor="w")
+        self.filter_status.pack(side=tk.LEFT, padx=5)
 
         # Inference button on top right
         self.inference_button = tk.Button(root, text="Inference", command=self.on_inference_button)
@@ -88,42 +153,377 @@ class App:
 
         self.current_dataset = self.datasets[self.split_selector.get()]
         self.viewer = None
+        self.filmstrip = None
+        self.thumbnail_cache = ThumbnailCache()
+        self.watcher = None
+        self.watch_job = None
 
         # Load model from CLI if provided
         if model_path:
             self.load_model(model_path)
 
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         self.load_viewer()
 
+    def on_close(self):
+        if self.watch_job is not None:
+            self.root.after_cancel(self.watch_job)
+            self.watch_job = None
+        if self.watcher is not None:
+            self.watcher.stop()
+        if self.viewer is not None:
+            self.viewer.destroy()
+        if self.inference_worker is not None:
+            self.inference_worker.close()
+        self.session.close()
+        if tracing.TRACER.enabled:
+            path = tracing.TRACER.save()
+            print(f"Trace written to {os.path.abspath(path)}")
+        self.root.destroy()
+
     def load_viewer(self):
         for widget in self.viewer_frame.winfo_children():
             widget.destroy()
 
-        self.viewer = ImageViewer(self.viewer_frame, self.current_dataset, index_callback=self.on_index_update)
+        self.filmstrip = Filmstrip(
+            self.viewer_frame, self.current_dataset, self.thumbnail_cache, on_select=self.jump_to
+        )
+        self.filmstrip.pack(side="right", fill="y")
+        self.viewer = ImageViewer(
+            self.viewer_frame,
+            self.current_dataset,
+            index_callback=self.on_index_update,
+            class_callback=self.on_class_update,
+        )
+        last_class = self.session.get_setting(self.yaml_path, "last_class")
+        if last_class is not None and int(last_class) < len(self.current_dataset.class_names):
+            self.viewer.last_selected_class_id = int(last_class)
         self.viewer.pack(fill="both", expand=True)
+        self.start_watcher()
+
+    def start_watcher(self):
+        """Watch the current split for files changed by other programs."""
+        if self.watcher is not None:
+            self.watcher.stop()
+        self.watcher = DatasetWatcher(self.current_dataset)
+        self.watcher.start()
+        if self.watch_job is None:
+            self.watch_job = self.root.after(WATCH_POLL_MS, self.poll_watcher)
+
+    def poll_watcher(self):
+        """Apply what the watcher found and check the open label file."""
+        self.watch_job = self.root.after(WATCH_POLL_MS, self.poll_watcher)
+        ds = self.current_dataset
+        images, labels = self.watcher.take_changes()
+        if images or labels:
+            summary = ds.apply_changes(images, labels)
+            if summary["added"] or summary["removed"]:
+                self.viewer.images_changed(summary["rows"])
+                self.filmstrip.reload()
+                if ds.total_images():
+                    self.filmstrip.set_current(ds.current_index())
+                    self.session.set_position(self.yaml_path, self.split_selector.get(), ds.current_index())
+                if self.viewer.view is not None:
+                    self.filter_status.config(text=f"{len(self.viewer.view)} matching images")
+        if ds.total_images():
+            self.viewer.check_labels_on_disk()
 
     def on_split_selected(self, event=None):
         split = self.split_selector.get()
         self.current_dataset = self.datasets[split]
         self.load_viewer()
+        self.apply_filter()
+
+    def apply_filter(self, event=None):
+        choice = self.filter_selector.current()
+        if choice <= 0:
+            self.viewer.set_view(None)
+            self.filter_status.config(text="")
+            return
+        try:
+            k = int(self.filter_k.get())
+        except ValueError:
+            messagebox.showerror("Error", "K must be a whole number.")
+            return
+        # The class index may have to be built from the label files first,
+        # so it is opened on a background thread.
+        ds, viewer = self.current_dataset, self.viewer
+        result = queue.Queue()
+        self.filter_status.config(text="Indexing labels...")
+
+        def worker():
+            try:
+                result.put(ds.class_index())
+            except Exception as e:
+                result.put(e)
+
+        def poll():
+            try:
+                index = result.get_nowait()
+            except queue.Empty:
+                self.root.after(100, poll)
+                return
+            if viewer is not self.viewer:
+                return  # the split changed meanwhile
+            if isinstance(index, Exception):
+                self.filter_status.config(text="Indexing failed")
+                messagebox.showerror("Error", f"Failed to index labels:\n{index}")
+                return
+            if choice == FILTERS.index(FILTER_BACKGROUND):
+                view = FilteredView("backgrounds", index.backgrounds())
+            elif choice == FILTERS.index(FILTER_MANY_BOXES):
+                view = FilteredView(f">{k} boxes", index.images_with_more_boxes(k))
+            else:
+                name = ds.class_names[choice - len(FILTERS)]
+                view = FilteredView(name, index.images_with_class(choice - len(FILTERS)))
+            self.filter_status.config(text=f"{len(view)} matching images")
+            viewer.set_view(view)
+
+        threading.Thread(target=worker, daemon=True).start()
+        poll()
 
     def show_stats(self):
-        stats = self.current_dataset.compute_stats()
         win = tk.Toplevel(self.root)
         win.title("Dataset Stats")
+        progress = tk.Label(win, text="Scanning label files...", anchor="w")
+        progress.pack(fill="x", padx=10, pady=(10, 0))
         text = tk.Text(win, width=50, height=20)
         text.pack(padx=10, pady=10)
-        text.insert(tk.END, f"Total images: {stats['total_images']}\n")
-        text.insert(tk.END, f"Background images: {stats['background_images']}\n\n")
-        text.insert(tk.END, "Class occurrences:\n")
-        for name, count in stats['class_counts'].items():
-            text.insert(tk.END, f"  {name}: {count}\n")
         text.config(state=tk.DISABLED)
 
+        # Stats are computed on a background thread (which fans out to a
+        # process pool) and streamed to the window as partial results.
+        engine = self.current_dataset.stats_engine()
+        updates = queue.Queue()
+        cancelled = threading.Event()
+        finished = object()
+
+        def worker():
+            try:
+                for update in engine.iter_compute():
+                    updates.put(update)
+                    if cancelled.is_set():
+                        return
+            except Exception as e:
+                updates.put(e)
+            updates.put(finished)
+
+        def render(stats):
+            text.config(state=tk.NORMAL)
+            text.delete("1.0", tk.END)
+            text.insert(tk.END, f"Total images: {stats['total_images']}\n")
+            text.insert(tk.END, f"Background images: {stats['background_images']}\n\n")
+            text.insert(tk.END, "Class occurrences:\n")
+            for name, count in stats['class_counts'].items():
+                text.insert(tk.END, f"  {name}: {count}\n")
+            text.config(state=tk.DISABLED)
+
+        def poll():
+            if cancelled.is_set():
+                return
+            latest = None
+            done = False
+            while True:
+                try:
+                    item = updates.get_nowait()
+                except queue.Empty:
+                    break
+                if item is finished:
+                    done = True
+                elif isinstance(item, Exception):
+                    progress.config(text=f"Failed: {item}")
+                    return
+                else:
+                    latest = item
+            if latest is not None:
+                count, total, stats = latest
+                progress.config(text=f"Read {count}/{total} changed label files")
+                render(stats)
+            if done:
+                progress.config(text="Up to date")
+            else:
+                win.after(100, poll)
+
+        def on_close():
+            cancelled.set()
+            win.destroy()
+
+        win.protocol("WM_DELETE_WINDOW", on_close)
+        threading.Thread(target=worker, daemon=True).start()
+        poll()
+
+    def show_duplicates(self):
+        win = tk.Toplevel(self.root)
+        win.title("Duplicates")
+        status = tk.Label(win, text="Hashing images...", width=60, anchor="w")
+        status.pack(fill="x", padx=10, pady=(10, 0))
+        lists = tk.Frame(win)
+        lists.pack(fill="both", expand=True, padx=10, pady=10)
+        group_list = tk.Listbox(lists, width=40, height=20, exportselection=False)
+        group_list.pack(side=tk.LEFT, fill="both", expand=True)
+        member_list = tk.Listbox(lists, width=50, height=20, exportselection=False)
+        member_list.pack(side=tk.LEFT, fill="both", expand=True, padx=(5, 0))
+        export_button = tk.Button(win, text="Export Report...", state=tk.DISABLED)
+        export_button.pack(pady=(0, 10))
+
+        # Hashing runs on a background thread (which fans out to a process
+        # pool); hashes are cached, so later runs only hash new images.
+        updates = queue.Queue()
+        groups = []
+
+        def worker():
+            try:
+                found = duplicates.find_duplicates(
+                    self.datasets,
+                    progress=lambda split, done, total: updates.put(("progress", (split, done, total))),
+                )
+            except Exception as e:
+                updates.put(("error", e))
+                return
+            updates.put(("done", found))
+
+        def on_group(event=None):
+            member_list.delete(0, tk.END)
+            for sel in group_list.curselection():
+                for m in groups[sel]["members"]:
+                    member_list.insert(
+                        tk.END,
+                        f"{m['split']} #{m['index'] + 1}  {os.path.basename(m['image'])}  (d={m['distance']})",
+                    )
+
+        def on_member(event=None):
+            group, member = group_list.curselection(), member_list.curselection()
+            if group and member:
+                m = groups[group[0]]["members"][member[0]]
+                self.show_image(m["split"], m["index"])
+
+        def export_report():
+            path = filedialog.asksaveasfilename(
+                title="Save duplicate report",
+                defaultextension=".csv",
+                filetypes=[("CSV", "*.csv"), ("JSON", "*.json")],
+            )
+            if path:
+                duplicates.write_report(groups, path)
+
+        def poll():
+            if not win.winfo_exists():
+                return
+            while True:
+                try:
+                    kind, payload = updates.get_nowait()
+                except queue.Empty:
+                    break
+                if kind == "progress":
+                    split, done, total = payload
+                    if total:
+                        status.config(text=f"{split}: hashed {done}/{total} new images")
+                    continue
+                if kind == "error":
+                    status.config(text=f"Failed: {payload}")
+                    return
+                groups.extend(payload)
+                leaks = sum(g["leak"] for g in groups)
+                status.config(text=f"{len(groups)} duplicate groups, {leaks} spanning splits")
+                for g in groups:
+                    where = "/".join(g["splits"])
+                    group_list.insert(
+                        tk.END,
+                        f"{len(g['members'])} {g['kind']} in {where}" + ("  LEAK" if g["leak"] else ""),
+                    )
+                export_button.config(state=tk.NORMAL, command=export_report)
+                return
+            win.after(100, poll)
+
+        group_list.bind("<<ListboxSelect>>", on_group)
+        member_list.bind("<<ListboxSelect>>", on_member)
+        threading.Thread(target=worker, daemon=True).start()
+        poll()
+
+    def show_validation(self):
+        win = tk.Toplevel(self.root)
+        win.title("Validation")
+        status = tk.Label(win, text="Checking images and labels...", width=60, anchor="w")
+        status.pack(fill="x", padx=10, pady=(10, 0))
+        frame = tk.Frame(win)
+        frame.pack(fill="both", expand=True, padx=10, pady=10)
+        scroll = tk.Scrollbar(frame)
+        scroll.pack(side=tk.RIGHT, fill="y")
+        finding_list = tk.Listbox(frame, width=90, height=25, yscrollcommand=scroll.set)
+        finding_list.pack(side=tk.LEFT, fill="both", expand=True)
+        scroll.config(command=finding_list.yview)
+
+        # Checks run on a background thread (which fans out to a process
+        # pool); results are cached per file, so re-validating is quick.
+        ds, viewer = self.current_dataset, self.viewer
+        updates = queue.Queue()
+        findings = []
+        finished = object()
+
+        def worker():
+            try:
+                for finding in validation.validate_split(ds):
+                    updates.put(finding)
+            except Exception as e:
+                updates.put(e)
+            updates.put(finished)
+
+        def on_select(event=None):
+            sel = finding_list.curselection()
+            if sel and findings[sel[0]]["index"] is not None and viewer is self.viewer:
+                self.jump_to(findings[sel[0]]["index"])
+
+        def poll():
+            if not win.winfo_exists():
+                return
+            while True:
+                try:
+                    item = updates.get_nowait()
+                except queue.Empty:
+                    break
+                if item is finished:
+                    errors = sum(f["severity"] == "error" for f in findings)
+                    status.config(text=f"{len(findings)} findings, {errors} errors")
+                    return
+                if isinstance(item, Exception):
+                    status.config(text=f"Failed: {item}")
+                    return
+                findings.append(item)
+                name = os.path.basename(item["image"] or item["label"])
+                line = f":{item['line']}" if item["line"] else ""
+                finding_list.insert(tk.END, f"{item['severity']:8} {name}{line}  {item['kind']}: {item['message']}")
+            status.config(text=f"Checking images and labels... {len(findings)} findings so far")
+            win.after(100, poll)
+
+        finding_list.bind("<<ListboxSelect>>", on_select)
+        threading.Thread(target=worker, daemon=True).start()
+        poll()
+
+    def show_image(self, split, idx):
+        """Switch to ``split`` if needed and open its image ``idx``."""
+        if split != self.split_selector.get():
+            self.split_selector.set(split)
+            self.on_split_selected()
+        self.jump_to(idx)
+
     def export_dataset(self):
         dataset_name = simpledialog.askstring("Export Dataset", "Enter name for the exported dataset:")
         if not dataset_name:
             return
+        ds = self.current_dataset
+        total = ds.total_images()
+        ranges = simpledialog.askstring(
+            "Export Dataset",
+            "Images to export (e.g. 0-99, 150, 200-):",
+            initialvalue=f"0-{ds.current_index()}",
+        )
+        if ranges is None:
+            return
+        try:
+            indices = export.parse_ranges(ranges, total)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
         base_dir = filedialog.askdirectory(
             title="Select directory for export",
             initialdir=os.path.dirname(self.yaml_path),
@@ -131,53 +531,206 @@ class App:
         if not base_dir:
             return
         export_dir = os.path.join(base_dir, dataset_name)
-        images_dir = os.path.join(export_dir, "images")
-        labels_dir = os.path.join(export_dir, "labels")
         if os.path.exists(export_dir):
             messagebox.showerror("Error", f"Directory '{export_dir}' already exists.")
             return
-        try:
-            os.makedirs(images_dir, exist_ok=True)
-            os.makedirs(labels_dir, exist_ok=True)
-            current_idx = self.current_dataset.current_index()
-            for img_path in self.current_dataset.image_paths[: current_idx + 1]:
-                shutil.copy2(img_path, images_dir)
-                base = os.path.splitext(os.path.basename(img_path))[0]
-                label_src = os.path.join(self.current_dataset.label_dir, base + ".txt")
-                if os.path.exists(label_src):
-                    shutil.copy2(label_src, labels_dir)
-            data = {
-                "names": self.yaml_loader.get_class_names(),
-                "train": os.path.relpath(images_dir, export_dir),
-            }
-            with open(os.path.join(export_dir, "data.yaml"), "w") as f:
-                yaml.safe_dump(data, f)
-            messagebox.showinfo("Export Complete", f"Dataset exported to {export_dir}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Export failed:\n{e}")
+
+        win = tk.Toplevel(self.root)
+        win.title("Export Dataset")
+        status = tk.Label(win, text=f"0/{len(indices)} images", width=40, anchor="w")
+        status.pack(padx=10, pady=10)
+        cancel = threading.Event()
+        tk.Button(win, text="Cancel", command=cancel.set).pack(pady=(0, 10))
+        win.protocol("WM_DELETE_WINDOW", cancel.set)
+
+        # Copying runs on a background thread (which fans out to a thread
+        # pool); reflinks make the export nearly free where supported.
+        updates = queue.Queue()
+
+        def worker():
+            try:
+                summary = export.export_dataset(
+                    ds,
+                    export_dir,
+                    self.yaml_loader.get_class_names(),
+                    indices=indices,
+                    mode="reflink",
+                    progress=lambda done, total: updates.put(("progress", (done, total))),
+                    cancel=cancel,
+                )
+            except Exception as e:
+                updates.put(("error", e))
+                return
+            updates.put(("done", summary))
+
+        def poll():
+            while True:
+                try:
+                    kind, payload = updates.get_nowait()
+                except queue.Empty:
+                    break
+                if kind == "progress":
+                    status.config(text=f"{payload[0]}/{payload[1]} images")
+                    continue
+                win.destroy()
+                if kind == "error":
+                    messagebox.showerror("Error", f"Export failed:\n{payload}")
+                elif payload["finished"]:
+                    messagebox.showinfo("Export Complete", f"Dataset exported to {export_dir}")
+                return
+            win.after(100, poll)
+
+        threading.Thread(target=worker, daemon=True).start()
+        poll()
+
+    def preannotate_split(self):
+        if self.model_path is None:
+            # The run loads the model in its own process; starting an
+            # inference worker here would only hold a second copy of it.
+            if YOLO is None:
+                messagebox.showerror("Error", "Ultralytics YOLO is not installed.")
+                return
+            model_path = filedialog.askopenfilename(
+                title="Select model file",
+                filetypes=[("Model Files", "*.pt *.onnx *.pth"), ("All Files", "*.*")]
+            )
+            if not model_path:
+                return
+            self.model_path = model_path
+        conf = simpledialog.askfloat(
+            "Pre-annotate", "Confidence threshold:", initialvalue=preannotate.DEFAULT_CONF,
+            minvalue=0.0, maxvalue=1.0,
+        )
+        if conf is None:
+            return
+        only_unlabeled = messagebox.askyesno(
+            "Pre-annotate", "Only annotate images that have no labels yet?\n\n"
+            "Choosing 'No' overwrites existing label files of this split."
+        )
+        ds = self.current_dataset
+        if self.inference_worker is not None and not (
+            self.inference_window and self.inference_window.winfo_exists()
+        ):
+            # Free the idle worker's copy of the model; it is started again
+            # from model_path when the inference window is next opened.
+            self.inference_worker.close()
+            self.inference_worker = None
+        # The model runs in its own process so the UI stays responsive;
+        # progress comes back over a queue polled from the Tk loop.
+        ctx = multiprocessing.get_context("spawn")
+        messages = ctx.Queue()
+        cancel = ctx.Event()
+        options = {"conf": conf, "only_unlabeled": only_unlabeled}
+        process = ctx.Process(
+            target=preannotate.run_in_process,
+            args=(ds.image_dir, ds.label_dir, ds.class_names, self.model_path, options, messages, cancel),
+            daemon=True,
+        )
+        process.start()
+
+        win = tk.Toplevel(self.root)
+        win.title("Pre-annotate")
+        status = tk.Label(win, text="Loading model...", width=50, anchor="w")
+        status.pack(padx=10, pady=10)
+        tk.Button(win, text="Cancel", command=cancel.set).pack(pady=(0, 10))
+        win.protocol("WM_DELETE_WINDOW", cancel.set)
+
+        def poll():
+            while True:
+                try:
+                    kind, payload = messages.get_nowait()
+                except queue.Empty:
+                    break
+                if kind == "progress":
+                    done, total, ips = payload
+                    status.config(text=f"{done}/{total} images ({ips:.1f} img/s)")
+                    continue
+                win.destroy()
+                if kind == "error":
+                    messagebox.showerror("Error", f"Pre-annotation failed:\n{payload}")
+                else:
+                    verb = "Finished" if payload["finished"] else "Cancelled (run again to resume)"
+                    messagebox.showinfo(
+                        "Pre-annotate",
+                        f"{verb}: wrote {payload['written']} label files, skipped "
+                        f"{payload['skipped']}, {payload['images_per_second']:.1f} img/s",
+                    )
+                if self.viewer is not None and self.current_dataset is ds:
+                    self.viewer.load_image()
+                return
+            if not process.is_alive() and messages.empty():
+                win.destroy()
+                messagebox.showerror("Error", "Pre-annotation process exited unexpectedly.")
+                return
+            win.after(200, poll)
+
+        poll()
 
     def on_index_update(self, index):
-        update_cache(self.yaml_path, index)
+        with tracing.span("save_position"):
+            self.session.set_position(self.yaml_path, self.split_selector.get(), index)
+        self.filmstrip.set_current(index)
+        self.update_review_label()
         self.run_inference_on_current_image()
 
+    def on_class_update(self, class_id):
+        self.session.set_setting(self.yaml_path, "last_class", class_id)
+
+    def current_image_name(self):
+        return os.path.basename(self.current_dataset.current_image_path())
+
+    def update_review_label(self):
+        status = self.session.get_status(self.yaml_path, self.split_selector.get(), self.current_image_name())
+        text = {REVIEWED: "Reviewed", NEEDS_FIX: "Needs fix"}.get(status, "Not reviewed")
+        self.review_label.config(text=text)
+
+    def set_review_status(self, status):
+        self.session.set_status(self.yaml_path, self.split_selector.get(), self.current_image_name(), status)
+        self.update_review_label()
+
+    def jump_to(self, idx):
+        if idx is None:
+            messagebox.showinfo("Review", "No more matching images in this split.")
+            return
+        self.current_dataset.set_index(idx)
+        self.viewer.load_image()
+
+    def next_unreviewed(self):
+        ds = self.current_dataset
+        self.jump_to(self.session.next_unreviewed(
+            self.yaml_path, self.split_selector.get(), ds.manifest.names, ds.current_index() + 1
+        ))
+
+    def next_needs_fix(self):
+        ds = self.current_dataset
+        name = self.session.next_with_status(
+            self.yaml_path, self.split_selector.get(), self.current_image_name(), NEEDS_FIX
+        )
+        self.jump_to(None if name is None else ds.manifest.index_of(name))
+
     def load_model(self, path):
         if YOLO is None:
             messagebox.showerror("Error", "Ultralytics YOLO is not installed.")
             return False
         try:
-            self.model = YOLO(path)
-            self.model_path = path
-            return True
+            worker = InferenceWorker(path)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load model:\n{e}")
             return False
+        if self.inference_worker is not None:
+            self.inference_worker.close()
+        self.inference_worker = worker
+        self.model_path = path
+        return True
 
     def on_inference_button(self):
-        if self.model is None:
-            model_path = filedialog.askopenfilename(
-                title="Select model file",
-                filetypes=[("Model Files", "*.pt *.onnx *.pth"), ("All Files", "*.*")]
-            )
+        if self.inference_worker is None or not self.inference_worker.is_alive():
+            model_path = self.model_path if self.inference_worker is None else None
+            if model_path is None:
+                model_path = filedialog.askopenfilename(
+                    title="Select model file",
+                    filetypes=[("Model Files", "*.pt *.onnx *.pth"), ("All Files", "*.*")]
+                )
             if not model_path:
                 return
             if not self.load_model(model_path):
@@ -191,43 +744,70 @@ class App:
         self.inference_window.title("Inference")
         self.inference_window.attributes("-topmost", True)
         self.inference_window.protocol("WM_DELETE_WINDOW", self.close_inference_window)
-        self.inference_label = tk.Label(self.inference_window)
+        self.inference_label = tk.Label(self.inference_window, text="Loading model...")
         self.inference_label.pack()
         self.run_inference_on_current_image()
 
     def close_inference_window(self):
+        if self.inference_poll_job is not None:
+            self.root.after_cancel(self.inference_poll_job)
+            self.inference_poll_job = None
         if self.inference_window:
             self.inference_window.destroy()
             self.inference_window = None
             self.inference_label = None
             self.inference_photo = None
 
+    @tracing.traced("run_inference_on_current_image")
     def run_inference_on_current_image(self):
-        if not (self.model and self.inference_window and self.inference_window.winfo_exists()):
+        if not (self.inference_worker and self.inference_window and self.inference_window.winfo_exists()):
             return
-        try:
-            image_path = self.current_dataset.current_image_path()
-            results = self.model(image_path)
-            if not results:
-                return
-            img = results[0].plot()
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            pil_img = Image.fromarray(img)
-            self.inference_photo = ImageTk.PhotoImage(pil_img)
-            self.inference_label.config(image=self.inference_photo)
-        except Exception as e:
-            messagebox.showerror("Error", f"Inference failed:\n{e}")
-            self.close_inference_window()
+        # The worker coalesces queued requests, so fast navigation only
+        # costs one inference for the image the user stops on.
+        self.inference_worker.submit(self.current_dataset.current_image_path())
+        self.inference_started = time.perf_counter()
+        if self.inference_poll_job is None:
+            self.poll_inference()
+
+    def poll_inference(self):
+        self.inference_poll_job = None
+        if not (self.inference_worker and self.inference_window and self.inference_window.winfo_exists()):
+            return
+        result = self.inference_worker.poll()
+        if result is not None:
+            kind, _, payload = result
+            if kind == "error":
+                messagebox.showerror("Error", payload)
+                self.close_inference_window()
+                return
+            if kind == "frame":
+                if tracing.TRACER.enabled and self.inference_started is not None:
+                    # From the last request to its result arriving here
+                    tracing.TRACER.record("inference", self.inference_started, time.perf_counter())
+                    self.inference_started = None
+                self.inference_photo = ImageTk.PhotoImage(Image.fromarray(payload))
+                self.inference_label.config(image=self.inference_photo, text="")
+        self.inference_poll_job = self.root.after(INFERENCE_POLL_MS, self.poll_inference)
 
 def parse_args():
     parser = argparse.ArgumentParser(description="AnnoQ - Simple Image Annotation Tool")
     parser.add_argument("--yaml", help="Path to YAML dataset config file")
     parser.add_argument("--model", help="Path to YOLO model file", default=None)
+    parser.add_argument(
+        "--trace",
+        nargs="?",
+        const=tracing.DEFAULT_TRACE_PATH,
+        default=None,
+        metavar="PATH",
+        help=f"Record timing spans, show them on screen and write a Chrome trace to PATH on exit "
+        f"(default: {tracing.DEFAULT_TRACE_PATH}; also enabled by ${tracing.ENV_VAR})",
+    )
     return parser.parse_args()
 
 if __name__ == "__main__":
 
     args = parse_args()
+    tracing.enable_from_env(args.trace)
     root = tk.Tk()
     app = App(root, args.yaml if args.yaml else None, model_path=args.model)
     root.mainloop()
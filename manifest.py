@@ -0,0 +1,266 @@
+"""Persistent listing of a dataset split's images and labels.
+
+Scanning a large image directory on every launch is slow, especially on
+network mounts. The manifest stores one row per image (file name, size,
+mtime, pixel dimensions and whether a label file exists) together with the
+mtimes of the image and label directories. When both directory mtimes are
+unchanged the stored rows are used as they are; otherwise the directories
+are re-listed with ``os.scandir`` and only new or modified images have
+their dimensions read again.
+
+While the viewer is open, :meth:`DatasetManifest.update_images` and
+:meth:`DatasetManifest.set_label` apply individual changes reported by
+:mod:`watcher` without listing the directories.
+"""
+
+import bisect
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+import storage
+from cache import dataset_cache_dir
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+IMAGE_EXTENSIONS = {".bmp", ".jpeg", ".jpg", ".png", ".tif", ".tiff", ".webp"}
+COLUMNS = ("names", "sizes", "mtimes", "widths", "heights", "has_label")
+# Above this many added or removed images the rows are rebuilt in one pass
+# instead of being inserted and deleted one at a time
+REBUILD_THRESHOLD = 256
+
+
+def is_image_file(name):
+    return not name.startswith(".") and os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def read_image_size(path):
+    """Return ``(width, height)`` from the image header, ``(0, 0)`` if the
+    file cannot be read."""
+    try:
+        with storage.open_file(path, "rb") as f, Image.open(f) as img:
+            return img.size
+    except Exception:
+        return 0, 0
+
+
+def label_name(image_name):
+    return os.path.splitext(image_name)[0] + ".txt"
+
+
+def label_indices(names, label):
+    """Indices of the images in sorted ``names`` whose label file is
+    called ``label``."""
+    stem = os.path.splitext(label)[0] + "."
+    found = []
+    i = bisect.bisect_left(names, stem)
+    while i < len(names) and names[i].startswith(stem):
+        if label_name(names[i]) == label:
+            found.append(i)
+        i += 1
+    return found
+
+
+def _dir_mtime_ns(path):
+    return storage.dir_mtime_ns(path)
+
+
+def _list_images(image_dir):
+    return {name: stat for name, stat in storage.scandir(image_dir).items() if is_image_file(name)}
+
+
+def _list_labels(label_dir):
+    return {name for name in storage.scandir(label_dir) if name.endswith(".txt")}
+
+
+class DatasetManifest:
+    """Sorted image rows of one split; see the module docstring."""
+
+    def __init__(self, image_dir, label_dir, cache_path=None):
+        self.image_dir = image_dir
+        self.label_dir = label_dir
+        self.cache_path = cache_path or os.path.join(dataset_cache_dir(image_dir), MANIFEST_NAME)
+        self.names = []
+        self.sizes = []
+        self.mtimes = []
+        self.widths = []
+        self.heights = []
+        self.has_label = []
+        self.image_dir_mtime_ns = None
+        self.label_dir_mtime_ns = None
+        # Filled in place, so datasets can hold on to the lists
+        self.image_paths = []
+        self.label_paths = []
+        self._build_paths()
+
+    def __len__(self):
+        return len(self.names)
+
+    def index_of(self, name):
+        """Return the index of image file ``name``, or ``None``."""
+        i = bisect.bisect_left(self.names, name)
+        if i < len(self.names) and self.names[i] == name:
+            return i
+        return None
+
+    @classmethod
+    def open(cls, image_dir, label_dir, cache_path=None):
+        """Load the cached manifest, bring it up to date and save it if it
+        changed."""
+        manifest = cls(image_dir, label_dir, cache_path)
+        manifest._load()
+        if manifest.refresh():
+            manifest.save()
+        return manifest
+
+    def indices_for_label(self, name):
+        """Indices of the images whose label file is called ``name``."""
+        return label_indices(self.names, name)
+
+    def _build_paths(self):
+        self.image_paths[:] = [os.path.join(self.image_dir, n) for n in self.names]
+        self.label_paths[:] = [os.path.join(self.label_dir, label_name(n)) for n in self.names]
+
+    def _load(self):
+        try:
+            with open(self.cache_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if (
+            data.get("version") != MANIFEST_VERSION
+            or data.get("image_dir") != os.path.abspath(self.image_dir)
+            or data.get("label_dir") != os.path.abspath(self.label_dir)
+        ):
+            return
+        for field in COLUMNS:
+            setattr(self, field, data[field])
+        self.image_dir_mtime_ns = data["image_dir_mtime_ns"]
+        self.label_dir_mtime_ns = data["label_dir_mtime_ns"]
+        self._build_paths()
+
+    def save(self):
+        data = {
+            "version": MANIFEST_VERSION,
+            "image_dir": os.path.abspath(self.image_dir),
+            "label_dir": os.path.abspath(self.label_dir),
+            "image_dir_mtime_ns": self.image_dir_mtime_ns,
+            "label_dir_mtime_ns": self.label_dir_mtime_ns,
+            "names": self.names,
+            "sizes": self.sizes,
+            "mtimes": self.mtimes,
+            "widths": self.widths,
+            "heights": self.heights,
+            "has_label": self.has_label,
+        }
+        tmp = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, self.cache_path)
+
+    def refresh(self):
+        """Re-list whichever directories changed since the manifest was
+        written. Returns ``True`` if anything changed."""
+        image_mtime = _dir_mtime_ns(self.image_dir)
+        label_mtime = _dir_mtime_ns(self.label_dir)
+        images_changed = image_mtime is None or image_mtime != self.image_dir_mtime_ns
+        labels_changed = label_mtime is None or label_mtime != self.label_dir_mtime_ns
+        if not images_changed and not labels_changed:
+            return False
+
+        if images_changed:
+            self._rescan_images()
+        labels = _list_labels(self.label_dir)
+        self.has_label = [label_name(n) in labels for n in self.names]
+        self.image_dir_mtime_ns = image_mtime
+        self.label_dir_mtime_ns = label_mtime
+        self._build_paths()
+        return True
+
+    def _rescan_images(self):
+        old = {
+            name: (size, mtime, w, h)
+            for name, size, mtime, w, h in zip(
+                self.names, self.sizes, self.mtimes, self.widths, self.heights
+            )
+        }
+        found = _list_images(self.image_dir)
+        names = sorted(found)
+        stale = [n for n in names if old.get(n, (None, None))[:2] != found[n]]
+        dims = self._read_sizes(stale)
+        self.names = names
+        self.sizes = [found[n][0] for n in names]
+        self.mtimes = [found[n][1] for n in names]
+        self.widths = []
+        self.heights = []
+        for n in names:
+            w, h = dims[n] if n in dims else old[n][2:]
+            self.widths.append(w)
+            self.heights.append(h)
+
+    def _read_sizes(self, names):
+        if not names:
+            return {}
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            return dict(zip(names, pool.map(
+                lambda n: read_image_size(os.path.join(self.image_dir, n)), names
+            )))
+
+    def update_images(self, changes):
+        """Apply ``{name: (size, mtime_ns) or None}`` for images that were
+        added or rewritten (their new stat) or removed (``None``), keeping
+        the rows sorted. Only the dimensions of those images are read.
+
+        Returns the lists of added and removed names.
+        """
+        added, removed, rewritten = [], [], []
+        for name, stat in changes.items():
+            idx = self.index_of(name)
+            if stat is None:
+                if idx is not None:
+                    removed.append(name)
+            elif idx is None:
+                if is_image_file(name):
+                    added.append(name)
+            elif (self.sizes[idx], self.mtimes[idx]) != tuple(stat):
+                rewritten.append(name)
+        added.sort()
+        dims = self._read_sizes(added + rewritten)
+        for name in rewritten:
+            idx = self.index_of(name)
+            self.sizes[idx], self.mtimes[idx] = changes[name]
+            self.widths[idx], self.heights[idx] = dims[name]
+        rows = {
+            name: (*changes[name], *dims[name], storage.exists(os.path.join(self.label_dir, label_name(name))))
+            for name in added
+        }
+
+        if len(added) + len(removed) > REBUILD_THRESHOLD:
+            gone = set(removed)
+            old = zip(*(getattr(self, column) for column in COLUMNS))
+            merged = sorted([row for row in old if row[0] not in gone] + [(n, *r) for n, r in rows.items()])
+            for column, values in zip(COLUMNS, zip(*merged) if merged else [()] * len(COLUMNS)):
+                setattr(self, column, list(values))
+            self._build_paths()
+            return added, removed
+
+        for name in removed:
+            idx = self.index_of(name)
+            for column in COLUMNS + ("image_paths", "label_paths"):
+                del getattr(self, column)[idx]
+        for name, row in rows.items():
+            idx = bisect.bisect_left(self.names, name)
+            paths = (os.path.join(self.image_dir, name), os.path.join(self.label_dir, label_name(name)))
+            for column, value in zip(COLUMNS + ("image_paths", "label_paths"), (name, *row, *paths)):
+                getattr(self, column).insert(idx, value)
+        return added, removed
+
+    def set_label(self, name, exists):
+        """Record whether label file ``name`` exists; returns the indices of
+        the images using it."""
+        indices = self.indices_for_label(name)
+        for idx in indices:
+            self.has_label[idx] = exists
+        return indices
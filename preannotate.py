@@ -0,0 +1,307 @@
+"""Batch pre-annotation of a dataset split with a YOLO model.
+
+Images are decoded on a reader thread, run through the model in batches on
+the calling thread and written as YOLO label files by a writer thread. The
+stages are connected by bounded queues so memory stays flat however large
+the split is. Progress is checkpointed after every written batch; running
+the same job again resumes where the previous run stopped.
+
+Command line usage::
+
+    python preannotate.py --yaml data.yaml --split train --model best.pt
+"""
+
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+import storage
+from box_array import BoxArray
+from cache import dataset_cache_dir
+
+DEFAULT_BATCH_SIZE = 16
+DEFAULT_CONF = 0.25
+QUEUE_BATCHES = 4
+CHECKPOINT_NAME = "preannotate_checkpoint.json"
+
+_DONE = object()
+_SKIP = object()
+
+
+def _to_numpy(values):
+    if hasattr(values, "cpu"):
+        values = values.cpu().numpy()
+    return np.asarray(values)
+
+
+def result_to_boxes(result, conf):
+    """Convert one ultralytics ``Results`` object into a :class:`BoxArray`,
+    keeping detections with confidence of at least ``conf``."""
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return BoxArray()
+    keep = _to_numpy(boxes.conf) >= conf
+    xywhn = _to_numpy(boxes.xywhn)[keep]
+    class_ids = _to_numpy(boxes.cls)[keep].astype(np.int32)
+    return BoxArray(class_ids, xywhn[:, 0], xywhn[:, 1], xywhn[:, 2], xywhn[:, 3])
+
+
+def _is_unlabeled(dataset, idx):
+    # An empty label file marks a background image, which is labelled
+    return not dataset.has_label(idx) and not storage.exists(dataset.label_path(idx))
+
+
+class PreAnnotator:
+    """Write model predictions for ``dataset[start:stop]`` as label files.
+
+    ``model`` is anything callable like an ultralytics ``YOLO`` object:
+    ``model(list_of_bgr_arrays, conf=..., verbose=False)`` returning one
+    result per image.
+    """
+
+    def __init__(
+        self,
+        dataset,
+        model,
+        model_id="",
+        batch_size=DEFAULT_BATCH_SIZE,
+        conf=DEFAULT_CONF,
+        only_unlabeled=False,
+        checkpoint_path=None,
+    ):
+        self.dataset = dataset
+        self.model = model
+        self.model_id = model_id
+        self.batch_size = batch_size
+        self.conf = conf
+        self.only_unlabeled = only_unlabeled
+        self.checkpoint_path = checkpoint_path or os.path.join(
+            dataset_cache_dir(dataset.image_dir), CHECKPOINT_NAME
+        )
+
+    # --- checkpointing --------------------------------------------------
+
+    def _job(self, start, stop):
+        return {
+            "model": self.model_id,
+            "start": start,
+            "stop": stop,
+            "conf": self.conf,
+            "only_unlabeled": self.only_unlabeled,
+        }
+
+    def _resume_point(self, job):
+        try:
+            with open(self.checkpoint_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return job["start"]
+        if data.get("job") != job:
+            return job["start"]
+        return max(job["start"], min(job["stop"], data.get("next", job["start"])))
+
+    def _save_checkpoint(self, job, next_idx):
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"job": job, "next": next_idx}, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    def _clear_checkpoint(self):
+        try:
+            os.remove(self.checkpoint_path)
+        except FileNotFoundError:
+            pass
+
+    # --- pipeline -------------------------------------------------------
+
+    def run(self, start=0, stop=None, progress=None, cancel=None):
+        """Annotate images ``start`` to ``stop`` (exclusive).
+
+        ``progress(done, total, images_per_second)`` is called after each
+        written batch; setting the ``cancel`` event stops the run after the
+        batch in flight, leaving a checkpoint to resume from. Returns a
+        summary dictionary.
+        """
+        total_images = self.dataset.total_images()
+        stop = total_images if stop is None else min(stop, total_images)
+        job = self._job(start, stop)
+        first = self._resume_point(job)
+        cancel = cancel or threading.Event()
+        decoded = queue.Queue(maxsize=QUEUE_BATCHES)
+        predicted = queue.Queue(maxsize=QUEUE_BATCHES)
+        errors = []
+        counts = {"processed": 0, "written": 0, "skipped": 0, "unreadable": 0}
+        started = time.perf_counter()
+
+        def reader():
+            batch = []
+            try:
+                for idx in range(first, stop):
+                    if cancel.is_set():
+                        break
+                    if self.only_unlabeled and not _is_unlabeled(self.dataset, idx):
+                        batch.append((idx, _SKIP))
+                    else:
+                        batch.append((idx, storage.imread(self.dataset.image_paths[idx])))
+                    if len(batch) == self.batch_size:
+                        decoded.put(batch)
+                        batch = []
+                if batch:
+                    decoded.put(batch)
+            finally:
+                decoded.put(_DONE)
+
+        def writer():
+            while True:
+                item = predicted.get()
+                if item is _DONE:
+                    return
+                batch, predictions = item
+                try:
+                    for idx, image in batch:
+                        if image is _SKIP:
+                            counts["skipped"] += 1
+                        elif image is None:
+                            counts["unreadable"] += 1
+                        else:
+                            self.dataset.save_labels(predictions[idx], idx, background=True)
+                            counts["written"] += 1
+                        counts["processed"] += 1
+                    # Labels must be on disk before the checkpoint moves past them
+                    failed = self.dataset.flush_labels()
+                    if failed:
+                        raise failed[0][1]
+                    self._save_checkpoint(job, batch[-1][0] + 1)
+                except Exception as e:
+                    errors.append(e)
+                    cancel.set()
+                    continue
+                if progress:
+                    elapsed = time.perf_counter() - started
+                    progress(
+                        first - start + counts["processed"],
+                        stop - start,
+                        counts["processed"] / elapsed if elapsed > 0 else 0.0,
+                    )
+
+        threads = [threading.Thread(target=reader, daemon=True), threading.Thread(target=writer, daemon=True)]
+        for t in threads:
+            t.start()
+        try:
+            while True:
+                batch = decoded.get()
+                if batch is _DONE:
+                    break
+                if cancel.is_set():
+                    continue
+                images = [(idx, img) for idx, img in batch if img is not None and img is not _SKIP]
+                predictions = {}
+                if images:
+                    results = self.model(
+                        [img for _, img in images], conf=self.conf, verbose=False
+                    )
+                    for (idx, _), result in zip(images, results):
+                        predictions[idx] = result_to_boxes(result, self.conf)
+                predicted.put((batch, predictions))
+        except Exception as e:
+            errors.append(e)
+            cancel.set()
+            # Unblock the reader so it can finish
+            while decoded.get() is not _DONE:
+                pass
+        finally:
+            predicted.put(_DONE)
+            for t in threads:
+                t.join()
+        if errors:
+            raise errors[0]
+
+        elapsed = time.perf_counter() - started
+        finished = not cancel.is_set()
+        if finished:
+            self._clear_checkpoint()
+        return dict(
+            counts,
+            resumed_from=first,
+            finished=finished,
+            seconds=elapsed,
+            images_per_second=counts["processed"] / elapsed if elapsed > 0 else 0.0,
+        )
+
+
+def run_in_process(image_dir, label_dir, class_names, model_path, options, messages, cancel):
+    """Entry point for running a :class:`PreAnnotator` in a child process.
+
+    Progress is reported on the ``messages`` queue as
+    ``("progress", (done, total, ips))`` followed by ``("done", summary)`` or
+    ``("error", message)``.
+    """
+    from inference_worker import load_yolo
+    from yolo_dataset import YoloDataset
+
+    try:
+        dataset = YoloDataset(image_dir, label_dir, class_names)
+        annotator = PreAnnotator(dataset, load_yolo(model_path), model_id=model_path, **options)
+        summary = annotator.run(
+            progress=lambda *p: messages.put(("progress", p)), cancel=cancel
+        )
+    except Exception as e:
+        messages.put(("error", str(e)))
+        return
+    messages.put(("done", summary))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-annotate a dataset split with a YOLO model")
+    parser.add_argument("--yaml", required=True, help="Path to YAML dataset config file")
+    parser.add_argument("--split", default="train", help="Dataset split to annotate")
+    parser.add_argument("--model", required=True, help="Path to YOLO model file")
+    parser.add_argument("--start", type=int, default=0, help="First image index")
+    parser.add_argument("--stop", type=int, default=None, help="Stop before this image index")
+    parser.add_argument("--conf", type=float, default=DEFAULT_CONF, help="Confidence threshold")
+    parser.add_argument("--batch", type=int, default=DEFAULT_BATCH_SIZE, help="Inference batch size")
+    parser.add_argument(
+        "--only-unlabeled", action="store_true", help="Skip images that already have labels"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from inference_worker import load_yolo
+    from yaml_dataset_loader import YamlDatasetLoader
+    from yolo_dataset import YoloDataset
+
+    args = parse_args(argv)
+    loader = YamlDatasetLoader(args.yaml)
+    paths = loader.get_paths(args.split)
+    if paths is None:
+        raise SystemExit(f"Split '{args.split}' not found in {args.yaml}")
+    dataset = YoloDataset(paths["images"], paths["labels"], loader.get_class_names())
+    annotator = PreAnnotator(
+        dataset,
+        load_yolo(args.model),
+        model_id=os.path.abspath(args.model),
+        batch_size=args.batch,
+        conf=args.conf,
+        only_unlabeled=args.only_unlabeled,
+    )
+
+    def report(done, total, ips):
+        print(f"\r{done}/{total} images ({ips:.1f} img/s)", end="", flush=True)
+
+    summary = annotator.run(args.start, args.stop, progress=report)
+    print()
+    print(
+        f"Wrote {summary['written']} label files, skipped {summary['skipped']}, "
+        f"unreadable {summary['unreadable']} in {summary['seconds']:.1f}s "
+        f"({summary['images_per_second']:.1f} img/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
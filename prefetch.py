@@ -0,0 +1,259 @@
+"""Background decoding of the images around the viewer's current position.
+
+Images are decoded for display: when a ``display_size`` is given, large
+JPEGs are decoded by libjpeg at 1/2, 1/4 or 1/8 scale (``IMREAD_REDUCED_*``),
+picking the smallest scale that still fills the display at the zoom that
+fits the whole image. Full resolution is only decoded on request, when the
+viewer zooms past the reduced buffer.
+"""
+
+import math
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+from PIL import Image
+
+import storage
+from manifest import read_image_size
+from tracing import traced
+
+DEFAULT_RADIUS = 3
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def fit_zoom(width, height, display_size):
+    """Largest zoom, at most 1, at which a ``width`` x ``height`` image fits
+    in ``display_size``; 1 if either is unknown."""
+    if not display_size or not width or not height:
+        return 1.0
+    return min(1.0, display_size[0] / width, display_size[1] / height)
+
+
+def reduction_factor(width, height, display_size):
+    """Largest decode reduction (1, 2, 4 or 8) whose buffer still has at
+    least one pixel per display pixel at :func:`fit_zoom`."""
+    zoom = fit_zoom(width, height, display_size)
+    factor = 1
+    for f in (2, 4, 8):
+        if zoom * f <= 1.0:
+            factor = f
+    return factor
+
+
+def _full_size(w, h, factor, size):
+    # Full size for a ``w`` x ``h`` decode reduced by ``factor`` if ``size``
+    # matches it; the decoder may have applied an EXIF rotation the header
+    # size doesn't reflect.
+    width, height = size
+    if (w, h) == (math.ceil(width / factor), math.ceil(height / factor)):
+        return width, height
+    if (h, w) == (math.ceil(width / factor), math.ceil(height / factor)):
+        return height, width
+    return None
+
+
+@traced("decode_image")
+def decode_image(path, size=(0, 0), display_size=None):
+    """Decode ``path`` into an RGB PIL image.
+
+    ``size`` is the image's ``(width, height)`` if known (e.g. from the
+    manifest); together with ``display_size`` it selects a reduced decode.
+    Returns ``(image, full_size)`` where ``full_size`` is the size of the
+    image at full resolution, which box coordinates are relative to.
+    """
+    factor = reduction_factor(size[0], size[1], display_size)
+    img = storage.imread(path, REDUCED_FLAGS[factor])
+    if img is None:
+        raise IOError(f"Could not read image: {path}")
+    h, w = img.shape[:2]
+    full = (w, h)
+    if factor > 1:
+        full = _full_size(w, h, factor, size)
+        if full is None:
+            # Stale dimensions, e.g. the image was rewritten in place; the
+            # header has the real ones.
+            full = _full_size(w, h, factor, read_image_size(path)) or (w * factor, h * factor)
+    # Convert in place and let PIL take the only retained copy
+    cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=img)
+    return Image.fromarray(img), full
+
+
+def _mtime_ns(path):
+    return storage.mtime_ns(path)
+
+
+class PrefetchedImage:
+    def __init__(self, path, mtime_ns, image, full_size, boxes, label_mtime_ns):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.image = image
+        self.full_size = full_size
+        self.boxes = boxes
+        self.label_mtime_ns = label_mtime_ns
+        self.nbytes = image.width * image.height * len(image.getbands())
+
+    def copy_boxes(self, class_names):
+        # The viewer edits boxes in place; unsaved edits must not leak back
+        # into the cache when the user navigates away and returns.
+        return self.boxes.to_boxes(class_names)
+
+
+class ImagePrefetcher:
+    """Decode the next/previous images of a dataset on a thread pool.
+
+    Decoded images and their labels are kept in an LRU cache keyed by
+    ``(path, mtime_ns)`` and bounded by ``max_bytes`` of pixel data.
+    :meth:`schedule` queues the ``radius`` images ahead in the direction of
+    travel plus the one behind; :meth:`get` returns a cached entry, waits for
+    an in-flight decode or decodes synchronously as a last resort.
+    """
+
+    def __init__(
+        self,
+        dataset,
+        radius=DEFAULT_RADIUS,
+        max_bytes=DEFAULT_MAX_BYTES,
+        workers=2,
+        display_size=None,
+    ):
+        self.dataset = dataset
+        self.display_size = display_size
+        self.radius = radius
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="annoq-prefetch"
+        )
+        self._lock = threading.RLock()
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._bytes = 0
+        self._last_index = None
+        self._direction = 1
+
+    @property
+    def cached_bytes(self):
+        return self._bytes
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get(self, idx):
+        """Return ``(image, full_size, boxes)`` for image ``idx``.
+
+        ``image`` may be a reduced decode; ``full_size`` is the size at full
+        resolution. ``boxes`` is a fresh list of copies that the caller may
+        mutate.
+        """
+        with self._lock:
+            future = self._pending.pop(idx, None)
+        if future is not None and not future.cancel():
+            future.exception()  # wait; errors are re-raised by _load below
+        entry = self._load(idx)
+        label_mtime_ns = _mtime_ns(self.dataset.label_path(idx))
+        # A save still queued for this image hasn't reached the file yet
+        pending = self.dataset.pending_labels(idx) is not None
+        if pending:
+            entry.boxes = self.dataset.load_box_array(idx)
+        elif label_mtime_ns != entry.label_mtime_ns:
+            entry.boxes = self.dataset.reload_box_array(idx)
+            entry.label_mtime_ns = label_mtime_ns
+        return entry.image, entry.full_size, entry.copy_boxes(self.dataset.class_names)
+
+    def decode_full(self, idx):
+        """Decode image ``idx`` at full resolution on the worker pool.
+
+        Returns a future of ``(image, full_size)``. The result is not cached:
+        it is only needed while the viewer is zoomed into that image.
+        """
+        return self._executor.submit(decode_image, self.dataset.image_paths[idx])
+
+    def schedule(self, idx, view=None):
+        """Queue decodes around ``idx`` following the direction of travel.
+
+        With a :class:`~class_index.FilteredView` containing ``idx`` the
+        neighbours are taken from the view instead of the whole split.
+        """
+        if self._last_index is not None and idx != self._last_index:
+            self._direction = 1 if idx > self._last_index else -1
+        self._last_index = idx
+        pos = view.position(idx) if view is not None else None
+        if pos is None:
+            order, pos = None, idx
+            total = self.dataset.total_images()
+        else:
+            order, total = view.indices, len(view)
+        steps = [self._direction * k for k in range(1, self.radius + 1)] + [-self._direction]
+        wanted = [pos + step for step in steps if 0 <= pos + step < total]
+        if order is not None:
+            wanted = [order[p] for p in wanted]
+        keys = {i: (self.dataset.image_paths[i], _mtime_ns(self.dataset.image_paths[i])) for i in wanted}
+        with self._lock:
+            for i, future in list(self._pending.items()):
+                if i not in keys and future.cancel():
+                    self._pending.pop(i, None)
+            for i in wanted:
+                if i in self._pending or keys[i] in self._cache:
+                    continue
+                future = self._executor.submit(self._load_quietly, i)
+                self._pending[i] = future
+                future.add_done_callback(lambda f, i=i: self._forget(i, f))
+
+    def invalidate(self, idx):
+        """Drop any cached entry for image ``idx``."""
+        path = self.dataset.image_paths[idx]
+        with self._lock:
+            for key in [k for k in self._cache if k[0] == path]:
+                self._bytes -= self._cache.pop(key).nbytes
+
+    def shutdown(self):
+        with self._lock:
+            for future in list(self._pending.values()):
+                future.cancel()
+            self._pending.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _forget(self, idx, future):
+        with self._lock:
+            if self._pending.get(idx) is future:
+                del self._pending[idx]
+
+    def _load_quietly(self, idx):
+        try:
+            self._load(idx)
+        except Exception:
+            # Unreadable files are reported when the viewer asks for them.
+            pass
+
+    def _load(self, idx):
+        path = self.dataset.image_paths[idx]
+        key = (path, _mtime_ns(path))
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+                return entry
+        label_mtime_ns = _mtime_ns(self.dataset.label_path(idx))
+        boxes = self.dataset.load_box_array(idx)
+        image, full_size = decode_image(path, self.dataset.image_size(idx), self.display_size)
+        entry = PrefetchedImage(path, key[1], image, full_size, boxes, label_mtime_ns)
+        with self._lock:
+            old = self._cache.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._cache[key] = entry
+            self._bytes += entry.nbytes
+            while self._bytes > self.max_bytes and len(self._cache) > 1:
+                _, evicted = self._cache.popitem(last=False)
+                self._bytes -= evicted.nbytes
+        return entry
@@ -0,0 +1,110 @@
+"""Cached, tiled rendering of zoomed viewports.
+
+A viewport is described in *zoomed space*: the image scaled by ``zoom``
+with its top-left corner at ``(0, 0)``. ``zoom`` is relative to the
+image's logical (full resolution) size, which may be larger than the pixel
+buffer when the image was decoded at reduced resolution. Zoomed space is cut into fixed
+square tiles; each tile is resampled once from the most suitable pyramid
+level and reused while the user pans or edits boxes at the same zoom.
+"""
+
+from collections import OrderedDict
+
+from PIL import Image
+
+TILE_SIZE = 256
+DEFAULT_MAX_BYTES = 96 * 1024 * 1024
+FAST_FILTER = Image.BILINEAR
+QUALITY_FILTER = Image.LANCZOS
+
+
+class ImagePyramid:
+    """Lazily built stack of 2x box-downsampled copies of an image."""
+
+    def __init__(self, image, min_size=64):
+        self.levels = [image]
+        self.min_size = min_size
+
+    def _build(self, k):
+        while len(self.levels) <= k:
+            prev = self.levels[-1]
+            if min(prev.size) // 2 < self.min_size:
+                return False
+            self.levels.append(prev.reduce(2))
+        return True
+
+    def select(self, magnification):
+        """Return ``(level_image, scale_x, scale_y)`` for the coarsest level
+        that still has at least ``magnification`` pixels per base pixel."""
+        k = 0
+        while magnification <= 0.5 ** (k + 1) and self._build(k + 1):
+            k += 1
+        level = self.levels[k]
+        base = self.levels[0]
+        return level, level.width / base.width, level.height / base.height
+
+
+class ViewportRenderer:
+    def __init__(self, image, tile_size=TILE_SIZE, max_bytes=DEFAULT_MAX_BYTES, size=None):
+        self.image = image
+        # Logical image size that zoom is relative to
+        self.width, self.height = size or image.size
+        self.pyramid = ImagePyramid(image)
+        self.tile_size = tile_size
+        self.max_bytes = max_bytes
+        self._tiles = OrderedDict()
+        self._bytes = 0
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def zoomed_size(self, zoom):
+        return max(1, int(self.width * zoom)), max(1, int(self.height * zoom))
+
+    def render(self, ox, oy, width, height, zoom, fast=False):
+        """Render the ``width`` x ``height`` region of zoomed space whose
+        top-left corner is ``(ox, oy)``.
+
+        The result is clipped to the zoomed image, so it may be smaller than
+        requested. ``fast`` selects a cheap filter for use while the view is
+        moving; tiles for both filters are cached independently.
+        """
+        zw, zh = self.zoomed_size(zoom)
+        width = max(1, min(width, zw - ox))
+        height = max(1, min(height, zh - oy))
+        out = Image.new(self.image.mode, (width, height))
+        t = self.tile_size
+        for ty in range(oy // t, (oy + height - 1) // t + 1):
+            for tx in range(ox // t, (ox + width - 1) // t + 1):
+                tile = self._tile(tx, ty, zoom, fast, zw, zh)
+                out.paste(tile, (tx * t - ox, ty * t - oy))
+        return out
+
+    def _tile(self, tx, ty, zoom, fast, zw, zh):
+        key = (zoom, fast, tx, ty)
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+            return tile
+        t = self.tile_size
+        x0, y0 = tx * t, ty * t
+        tw, th = min(t, zw - x0), min(t, zh - y0)
+        # Pyramid levels are relative to the buffer; convert to logical size
+        level, sx, sy = self.pyramid.select(zoom * self.width / self.image.width)
+        sx *= self.image.width / self.width
+        sy *= self.image.height / self.height
+        box = (
+            x0 / zoom * sx,
+            y0 / zoom * sy,
+            min(level.width, (x0 + tw) / zoom * sx),
+            min(level.height, (y0 + th) / zoom * sy),
+        )
+        # Resampling from the whole level with ``box`` lets the filter read
+        # pixels across tile edges, so neighbouring tiles join without seams.
+        tile = level.resize((tw, th), FAST_FILTER if fast else QUALITY_FILTER, box=box)
+        self._tiles[key] = tile
+        self._bytes += tw * th * len(tile.getbands())
+        while self._bytes > self.max_bytes and len(self._tiles) > 1:
+            _, old = self._tiles.popitem(last=False)
+            self._bytes -= old.width * old.height * len(old.getbands())
+        return tile
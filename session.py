@@ -0,0 +1,276 @@
+"""Persistent viewer session: positions, review status and settings.
+
+State lives in one SQLite database in WAL mode under ``cache.CACHE_ROOT``
+so several viewers can have it open at once. Writes are buffered in memory,
+where later writes to the same key replace earlier ones, and committed in a
+single transaction by a background thread once no new write has arrived for
+``flush_delay`` seconds. The transaction runs on its own connection without
+holding the buffer lock, so the getters and setters do not wait for it.
+Reads see buffered writes, and those being committed, immediately.
+
+Review status is keyed by image file name rather than index so it survives
+images being added to or removed from a split. Images without a status row
+are unreviewed.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import cache
+
+DB_NAME = "session.sqlite"
+FLUSH_DELAY = 0.5
+REVIEWED = "reviewed"
+NEEDS_FIX = "needs_fix"
+STATUSES = (REVIEWED, NEEDS_FIX)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS positions (
+    yaml TEXT NOT NULL, split TEXT NOT NULL, idx INTEGER NOT NULL,
+    PRIMARY KEY (yaml, split)
+);
+CREATE TABLE IF NOT EXISTS status (
+    yaml TEXT NOT NULL, split TEXT NOT NULL, image TEXT NOT NULL,
+    status TEXT NOT NULL, updated REAL NOT NULL,
+    PRIMARY KEY (yaml, split, image)
+);
+CREATE INDEX IF NOT EXISTS status_by_kind ON status (yaml, split, status, image);
+CREATE TABLE IF NOT EXISTS settings (
+    yaml TEXT NOT NULL, key TEXT NOT NULL, value TEXT,
+    PRIMARY KEY (yaml, key)
+);
+"""
+
+# Sentinel for a buffered status removal
+_CLEARED = object()
+
+
+class SessionStore:
+    """Viewer session state shared by all datasets opened from one machine.
+
+    ``yaml`` arguments are normalised with :func:`os.path.abspath`.
+    """
+
+    def __init__(self, path=None, flush_delay=FLUSH_DELAY):
+        self.path = path or os.path.join(cache.CACHE_ROOT, DB_NAME)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.flush_delay = flush_delay
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        # Commits use their own connection; WAL readers do not wait for it
+        self._write_conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._write_conn.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._positions = {}
+        self._statuses = {}
+        self._settings = {}
+        # Writes swapped out of the buffers and being committed
+        self._inflight = {"positions": {}, "status": {}, "settings": {}}
+        self._last_write = 0.0
+        self._closed = False
+        self._thread = threading.Thread(target=self._writer, name="annoq-session", daemon=True)
+        self._thread.start()
+
+    # --- positions ------------------------------------------------------
+
+    def get_position(self, yaml, split):
+        key = (os.path.abspath(yaml), split)
+        with self._lock:
+            found, value = self._buffered(self._positions, "positions", key)
+            if found:
+                return value
+            row = self._conn.execute(
+                "SELECT idx FROM positions WHERE yaml = ? AND split = ?", key
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_position(self, yaml, split, idx):
+        self._buffer(self._positions, (os.path.abspath(yaml), split), int(idx))
+
+    # --- review status --------------------------------------------------
+
+    def get_status(self, yaml, split, image):
+        key = (os.path.abspath(yaml), split, image)
+        with self._lock:
+            found, value = self._buffered(self._statuses, "status", key)
+            if found:
+                return None if value is _CLEARED else value
+            row = self._conn.execute(
+                "SELECT status FROM status WHERE yaml = ? AND split = ? AND image = ?", key
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_status(self, yaml, split, image, status):
+        """Set the review status of ``image``; ``None`` marks it unreviewed."""
+        if status is not None and status not in STATUSES:
+            raise ValueError(f"Unknown status '{status}', expected one of {STATUSES}")
+        key = (os.path.abspath(yaml), split, image)
+        self._buffer(self._statuses, key, _CLEARED if status is None else status)
+
+    def statuses(self, yaml, split):
+        """Return ``{image: status}`` for every image with a status."""
+        self.flush()
+        rows = self._query(
+            "SELECT image, status FROM status WHERE yaml = ? AND split = ?",
+            (os.path.abspath(yaml), split),
+        )
+        return dict(rows)
+
+    def next_with_status(self, yaml, split, after, status):
+        """Return the first image name after ``after`` with ``status``."""
+        self.flush()
+        rows = self._query(
+            "SELECT image FROM status WHERE yaml = ? AND split = ? AND status = ? AND image > ?"
+            " ORDER BY image LIMIT 1",
+            (os.path.abspath(yaml), split, status, after),
+        )
+        return rows[0][0] if rows else None
+
+    def next_unreviewed(self, yaml, split, names, start=0):
+        """Return the index of the first image in ``names[start:]`` without a
+        status, or ``None``.
+
+        ``names`` must be sorted, as the manifest keeps them. The sorted
+        names are merged with an index range scan of the status table, so
+        the cost is proportional to the run of reviewed images skipped.
+        """
+        if start >= len(names):
+            return None
+        self.flush()
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT image FROM status WHERE yaml = ? AND split = ? AND image >= ?"
+                " ORDER BY image",
+                (os.path.abspath(yaml), split, names[start]),
+            )
+            try:
+                for idx in range(start, len(names)):
+                    row = cursor.fetchone()
+                    while row is not None and row[0] < names[idx]:
+                        row = cursor.fetchone()
+                    if row is None or row[0] != names[idx]:
+                        return idx
+                return None
+            finally:
+                cursor.close()
+
+    # --- settings -------------------------------------------------------
+
+    def get_setting(self, yaml, key, default=None):
+        k = (os.path.abspath(yaml), key)
+        with self._lock:
+            found, value = self._buffered(self._settings, "settings", k)
+            if found:
+                return value
+            row = self._conn.execute(
+                "SELECT value FROM settings WHERE yaml = ? AND key = ?", k
+            ).fetchone()
+        return row[0] if row else default
+
+    def set_setting(self, yaml, key, value):
+        self._buffer(self._settings, (os.path.abspath(yaml), key), None if value is None else str(value))
+
+    # --- writing --------------------------------------------------------
+
+    def _query(self, sql, params):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _buffered(self, pending, table, key):
+        # Called with the lock held: ``(found, value)`` of the newest write
+        # of ``key`` not yet visible in the database
+        for writes in (pending, self._inflight[table]):
+            if key in writes:
+                return True, writes[key]
+        return False, None
+
+    def _buffer(self, pending, key, value):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("session store is closed")
+            pending[key] = value
+            self._last_write = time.monotonic()
+            self._wake.notify()
+
+    def _has_pending(self):
+        return bool(self._positions or self._statuses or self._settings)
+
+    def _commit_pending(self):
+        # Called without the lock: the buffers are swapped out under it and
+        # committed outside it, one batch at a time
+        with self._commit_lock:
+            with self._lock:
+                if not self._has_pending():
+                    return
+                positions, self._positions = self._positions, {}
+                statuses, self._statuses = self._statuses, {}
+                settings, self._settings = self._settings, {}
+                self._inflight = {"positions": positions, "status": statuses, "settings": settings}
+            try:
+                self._commit(positions, statuses, settings)
+            finally:
+                with self._lock:
+                    self._inflight = {"positions": {}, "status": {}, "settings": {}}
+
+    def _commit(self, positions, statuses, settings):
+        now = time.time()
+        cleared = [k for k, v in statuses.items() if v is _CLEARED]
+        kept = [k + (v, now) for k, v in statuses.items() if v is not _CLEARED]
+        conn = self._write_conn
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO positions VALUES (?, ?, ?)",
+                [k + (v,) for k, v in positions.items()],
+            )
+            conn.executemany("DELETE FROM status WHERE yaml = ? AND split = ? AND image = ?", cleared)
+            conn.executemany("INSERT OR REPLACE INTO status VALUES (?, ?, ?, ?, ?)", kept)
+            conn.executemany(
+                "INSERT OR REPLACE INTO settings VALUES (?, ?, ?)",
+                [k + (v,) for k, v in settings.items()],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _writer(self):
+        while True:
+            with self._lock:
+                while not self._has_pending() and not self._closed:
+                    self._wake.wait()
+                if self._closed:
+                    return
+                # Debounce: wait until writes have been quiet for flush_delay
+                remaining = self._last_write + self.flush_delay - time.monotonic()
+                if remaining > 0:
+                    self._wake.wait(remaining)
+                    continue
+            try:
+                self._commit_pending()
+            except sqlite3.Error:
+                # Session state is best effort; drop the batch rather
+                # than kill the writer.
+                pass
+
+    def flush(self):
+        """Commit buffered writes now, and wait for a commit in progress."""
+        with self._lock:
+            if self._closed:
+                return
+        self._commit_pending()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._closed = True
+            self._wake.notify()
+        self._thread.join()
+        self._conn.close()
+        self._write_conn.close()
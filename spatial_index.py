@@ -0,0 +1,120 @@
+"""Uniform-grid spatial index over the boxes of one image."""
+
+import math
+from collections import defaultdict
+
+# Boxes covering more cells than this are kept in a short list that is
+# always scanned, so one huge box does not have to be registered in
+# thousands of cells.
+MAX_CELLS_PER_BOX = 64
+
+
+class BoxIndex:
+    """Answer point and rectangle queries over boxes in pixel space.
+
+    Boxes are indexed by identity using the same truncated pixel rects as
+    :meth:`BoundingBox.to_pixel_rect`, so :meth:`smallest_containing` returns
+    exactly what :func:`bounding_box.smallest_box_containing_point` would for
+    the boxes in insertion order. Call :meth:`update` after moving or
+    resizing a box and :meth:`remove` after deleting it.
+    """
+
+    def __init__(self, boxes, img_w, img_h, cell_size=None):
+        boxes = list(boxes)
+        self.img_w = img_w
+        self.img_h = img_h
+        if cell_size is None:
+            # Aim for a handful of boxes per cell on average
+            cell_size = math.sqrt(img_w * img_h * 4 / max(len(boxes), 1))
+        self.cell_size = max(8, int(cell_size))
+        self._cells = defaultdict(set)
+        self._oversize = set()
+        self._entries = {}
+        self._seq = 0
+        for box in boxes:
+            self.insert(box)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, box):
+        return id(box) in self._entries
+
+    def insert(self, box):
+        rect = box.to_pixel_rect(self.img_w, self.img_h)
+        cells = self._cell_range(rect)
+        key = id(box)
+        self._entries[key] = (box, rect, self._seq, cells)
+        self._seq += 1
+        if cells is None:
+            self._oversize.add(key)
+        else:
+            for cell in cells:
+                self._cells[cell].add(key)
+
+    def remove(self, box):
+        key = id(box)
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        cells = entry[3]
+        if cells is None:
+            self._oversize.discard(key)
+            return
+        for cell in cells:
+            bucket = self._cells[cell]
+            bucket.discard(key)
+            if not bucket:
+                del self._cells[cell]
+
+    def update(self, box):
+        """Re-index ``box`` after its geometry changed, keeping its position
+        in the tie-break order."""
+        entry = self._entries.get(id(box))
+        if entry is None:
+            self.insert(box)
+            return
+        seq = entry[2]
+        self.remove(box)
+        self.insert(box)
+        b, rect, _, cells = self._entries[id(box)]
+        self._entries[id(box)] = (b, rect, seq, cells)
+
+    def smallest_containing(self, x, y):
+        """Return the smallest box whose pixel rect contains ``(x, y)``."""
+        cs = self.cell_size
+        keys = self._cells.get((int(x // cs), int(y // cs)), set())
+        best = None
+        best_key = None
+        for key in keys | self._oversize:
+            box, (x1, y1, x2, y2), seq, _ = self._entries[key]
+            if x1 <= x <= x2 and y1 <= y <= y2:
+                rank = (box.width * box.height, seq)
+                if best_key is None or rank < best_key:
+                    best, best_key = box, rank
+        return best
+
+    def intersecting(self, x1, y1, x2, y2):
+        """Return the boxes whose pixel rect overlaps ``(x1, y1, x2, y2)``,
+        in insertion order."""
+        cs = self.cell_size
+        keys = set(self._oversize)
+        for cx in range(int(x1 // cs), int(x2 // cs) + 1):
+            for cy in range(int(y1 // cs), int(y2 // cs) + 1):
+                keys.update(self._cells.get((cx, cy), ()))
+        hits = []
+        for key in keys:
+            box, (bx1, by1, bx2, by2), seq, _ = self._entries[key]
+            if bx1 <= x2 and x1 <= bx2 and by1 <= y2 and y1 <= by2:
+                hits.append((seq, box))
+        hits.sort(key=lambda item: item[0])
+        return [box for _, box in hits]
+
+    def _cell_range(self, rect):
+        cs = self.cell_size
+        x1, y1, x2, y2 = rect
+        cx1, cx2 = int(min(x1, x2) // cs), int(max(x1, x2) // cs)
+        cy1, cy2 = int(min(y1, y2) // cs), int(max(y1, y2) // cs)
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > MAX_CELLS_PER_BOX:
+            return None
+        return [(cx, cy) for cx in range(cx1, cx2 + 1) for cy in range(cy1, cy2 + 1)]
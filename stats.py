@@ -0,0 +1,263 @@
+"""Incremental, parallel dataset statistics with an on-disk cache.
+
+Per-label-file results are stored in a small SQLite database keyed by file
+name together with the file's size and ``mtime_ns``. A recompute only
+re-reads label files whose size or mtime changed, spreading large batches
+over a process pool.
+"""
+
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import storage
+from cache import dataset_cache_dir
+
+CACHE_NAME = "label_stats.sqlite"
+CHUNK_SIZE = 512
+# Below this many changed files a process pool costs more than it saves
+SERIAL_THRESHOLD = 2048
+
+
+def read_label_counts(path):
+    """Return ``(counts, nonempty)`` for one label file.
+
+    ``counts`` maps class id to number of boxes; ``nonempty`` tells whether
+    the file has any non-blank line. Malformed lines are skipped but still
+    make the file non-empty, as in :meth:`YoloDataset.compute_stats`.
+    """
+    counts = {}
+    nonempty = False
+    with storage.open_file(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            nonempty = True
+            parts = line.split()
+            if len(parts) != 5:
+                continue
+            try:
+                class_id = int(parts[0])
+            except ValueError:
+                continue
+            counts[class_id] = counts.get(class_id, 0) + 1
+    return counts, nonempty
+
+
+def _read_chunk(label_dir, items):
+    results = []
+    for name, size, mtime_ns in items:
+        try:
+            counts, nonempty = read_label_counts(os.path.join(label_dir, name))
+        except OSError:
+            counts, nonempty = {}, False
+        results.append((name, size, mtime_ns, counts, nonempty))
+    return results
+
+
+def scan_label_dir(label_dir):
+    """Return ``{name: (size, mtime_ns)}`` for the ``.txt`` files in ``label_dir``."""
+    return {name: stat for name, stat in storage.scandir(label_dir).items() if name.endswith(".txt")}
+
+
+class StatsEngine:
+    """Maintain class counts and background images for one dataset split.
+
+    The running aggregate is updated in place whenever a file's cached
+    result changes, so :meth:`refresh` after a save and the partial results
+    yielded by :meth:`iter_compute` are cheap.
+    """
+
+    def __init__(self, dataset, cache_path=None, workers=None):
+        self.dataset = dataset
+        self.cache_path = cache_path or os.path.join(
+            dataset_cache_dir(dataset.label_dir), CACHE_NAME
+        )
+        self.workers = workers or os.cpu_count() or 1
+        self._lock = threading.RLock()
+        self._files = {}
+        self._wanted = Counter()
+        self._class_counts = Counter()
+        self._nonempty_images = 0
+        self._loaded = False
+
+    # --- persistence ----------------------------------------------------
+
+    def _connect(self):
+        conn = sqlite3.connect(self.cache_path)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "name TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+            "counts TEXT, nonempty INTEGER)"
+        )
+        return conn
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._wanted = Counter(
+            os.path.splitext(os.path.basename(p))[0] + ".txt" for p in self.dataset.image_paths
+        )
+        conn = self._connect()
+        try:
+            for name, size, mtime_ns, counts, nonempty in conn.execute(
+                "SELECT name, size, mtime_ns, counts, nonempty FROM files"
+            ):
+                counts = {int(k): v for k, v in json.loads(counts).items()}
+                self._set(name, (size, mtime_ns, counts, bool(nonempty)))
+        finally:
+            conn.close()
+        self._loaded = True
+
+    def _persist(self, results, removed=()):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (name, size, mtime_ns, json.dumps(counts), int(nonempty))
+                        for name, size, mtime_ns, counts, nonempty in results
+                    ],
+                )
+                conn.executemany("DELETE FROM files WHERE name = ?", [(n,) for n in removed])
+        finally:
+            conn.close()
+
+    # --- aggregate ------------------------------------------------------
+
+    def _set(self, name, entry):
+        """Replace the cached result for ``name`` and adjust the aggregate."""
+        weight = self._wanted.get(name, 0)
+        old = self._files.pop(name, None)
+        if old is not None and weight:
+            self._class_counts.subtract({k: v * weight for k, v in old[2].items()})
+            self._nonempty_images -= weight if old[3] else 0
+        if entry is None:
+            return
+        self._files[name] = entry
+        if weight:
+            self._class_counts.update({k: v * weight for k, v in entry[2].items()})
+            self._nonempty_images += weight if entry[3] else 0
+
+    def snapshot(self):
+        """Return the current aggregate in the format of
+        :meth:`YoloDataset.compute_stats`."""
+        with self._lock:
+            names = self.dataset.class_names
+            class_counts = {name: 0 for name in names}
+            for class_id in sorted(self._class_counts):
+                count = self._class_counts[class_id]
+                if class_id < len(names):
+                    class_counts[names[class_id]] += count
+                elif count:
+                    class_counts[str(class_id)] = class_counts.get(str(class_id), 0) + count
+            total = len(self.dataset.image_paths)
+            return {
+                "total_images": total,
+                "class_counts": class_counts,
+                "background_images": total - self._nonempty_images,
+            }
+
+    # --- computation ----------------------------------------------------
+
+    def iter_compute(self, chunk_size=CHUNK_SIZE):
+        """Bring the cache up to date, yielding ``(done, total, stats)``.
+
+        ``total`` is the number of label files that had to be re-read; the
+        first item is yielded before any of them is read and the last one
+        holds the final statistics.
+        """
+        with self._lock:
+            self._load()
+            on_disk = scan_label_dir(self.dataset.label_dir)
+            removed = [name for name in self._files if name not in on_disk]
+            for name in removed:
+                self._set(name, None)
+            stale = [
+                (name, size, mtime_ns)
+                for name, (size, mtime_ns) in on_disk.items()
+                if name in self._wanted
+                and self._files.get(name, (None, None))[:2] != (size, mtime_ns)
+            ]
+            # Cached stamps of the stale files; a file refresh()-ed while its
+            # chunk is read has a newer result than the chunk
+            cached = {name: self._files.get(name, (None, None))[:2] for name, _, _ in stale}
+        if removed:
+            self._persist([], removed)
+        total = len(stale)
+        done = 0
+        yield done, total, self.snapshot()
+        chunks = [stale[i:i + chunk_size] for i in range(0, total, chunk_size)]
+        label_dir = self.dataset.label_dir
+        if total <= SERIAL_THRESHOLD or self.workers == 1:
+            results_iter = (_read_chunk(label_dir, chunk) for chunk in chunks)
+            for results in results_iter:
+                done += self._apply(results, cached)
+                yield done, total, self.snapshot()
+            return
+        # Not forked: the children would inherit the archive registry's
+        # locks and open file handles in whatever state other threads left them
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx) as pool:
+            futures = [pool.submit(_read_chunk, label_dir, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                done += self._apply(future.result(), cached)
+                yield done, total, self.snapshot()
+
+    def compute(self):
+        stats = None
+        for _, _, stats in self.iter_compute():
+            pass
+        return stats
+
+    def _apply(self, results, cached=None):
+        """Store chunk ``results``; with ``cached``, only those of files whose
+        cache entry still has the stamp it had when the chunk was made."""
+        with self._lock:
+            if cached is not None:
+                fresh = [r for r in results if self._files.get(r[0], (None, None))[:2] == cached[r[0]]]
+            else:
+                fresh = results
+            for name, size, mtime_ns, counts, nonempty in fresh:
+                self._set(name, (size, mtime_ns, counts, nonempty))
+        self._persist(fresh)
+        return len(results)
+
+    def images_changed(self, added, removed):
+        """Adjust the aggregate for image names added to or removed from the
+        split. Label files of added images still have to be :meth:`refresh`-ed."""
+        with self._lock:
+            if not self._loaded:
+                return
+            for delta, names in ((1, added), (-1, removed)):
+                for name in names:
+                    label = os.path.splitext(name)[0] + ".txt"
+                    entry = self._files.get(label)
+                    self._set(label, None)
+                    self._wanted[label] += delta
+                    if entry is not None:
+                        self._set(label, entry)
+
+    def refresh(self, label_path):
+        """Re-read one label file, e.g. right after it was saved."""
+        with self._lock:
+            if not self._loaded:
+                return
+            name = os.path.basename(label_path)
+            try:
+                size, mtime_ns = storage.stat(label_path)
+            except FileNotFoundError:
+                self._set(name, None)
+                removed = [name]
+            else:
+                removed = []
+        if removed:
+            self._persist([], removed)
+            return
+        self._apply(_read_chunk(os.path.dirname(label_path), [(name, size, mtime_ns)]))
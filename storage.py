@@ -0,0 +1,355 @@
+"""File access that also reaches into tar and zip archives.
+
+A dataset can live in an uncompressed tar (e.g. a WebDataset shard) or a
+zip archive instead of a directory: paths simply continue through the
+archive file, so ``data/train.tar/images/a.jpg`` is member
+``images/a.jpg`` of ``data/train.tar``. A split may also be an archive
+holding images and labels side by side (``train: train.tar`` in the YAML
+file).
+
+Each archive is indexed once (member name, byte offset, size and mtime)
+and the index is saved in the cache directory until the archive changes.
+Stored members are then read as slices of a read-only memory map of the
+whole archive, without extracting anything; compressed zip members are
+inflated on read. Archives are never written to: files written through
+:func:`write_path`, i.e. edited labels, go to an overlay directory next to
+the archive (``train.tar.overlay/labels/a.txt``), which reads see first.
+
+The functions here take plain paths too and then behave like their
+``os``/``open``/``cv2`` counterparts.
+"""
+
+import functools
+import io
+import mmap
+import os
+import shutil
+import struct
+import tarfile
+import threading
+import time
+import zipfile
+
+import cv2
+import numpy as np
+
+from cache import dataset_cache_dir
+
+ARCHIVE_SUFFIXES = (".tar", ".zip")
+OVERLAY_SUFFIX = ".overlay"
+INDEX_NAME = "archive_index.npz"
+INDEX_VERSION = 1
+# Compression method of members that can be sliced out of the memory map
+STORED = 0
+
+_LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+
+
+def _normalize(name):
+    return name.replace("\\", "/").lstrip("/").removeprefix("./")
+
+
+def _index_tar(path):
+    members = []
+    with tarfile.open(path, "r:") as tf:
+        for m in tf:
+            if m.isfile():
+                members.append((_normalize(m.name), m.offset_data, m.size, int(m.mtime * 1e9), STORED))
+    return members
+
+
+def _index_zip(path):
+    members = []
+    with zipfile.ZipFile(path) as zf, open(path, "rb") as f:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            f.seek(info.header_offset)
+            header = _LOCAL_HEADER.unpack(f.read(_LOCAL_HEADER.size))
+            offset = info.header_offset + _LOCAL_HEADER.size + header[9] + header[10]
+            mtime_ns = int(time.mktime(info.date_time + (0, 0, -1)) * 1e9)
+            members.append((_normalize(info.filename), offset, info.file_size, mtime_ns, info.compress_type))
+    return members
+
+
+class Archive:
+    """Member index and memory map of one archive. Use :meth:`open`."""
+
+    _registry = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, path, stamp, names, offsets, sizes, mtimes, methods):
+        self.path = path
+        self.stamp = stamp
+        self.members = {
+            name: (int(o), int(s), int(m), int(c))
+            for name, o, s, m, c in zip(names, offsets, sizes, mtimes, methods)
+        }
+        self._dirs = None
+        self._lock = threading.Lock()
+        self._mmap = None
+        self._zip = None
+
+    @classmethod
+    def open(cls, path):
+        """Return the :class:`Archive` for ``path``, indexing it (or
+        reloading the index) if it is new or changed."""
+        st = os.stat(path)
+        stamp = (st.st_size, st.st_mtime_ns)
+        with cls._registry_lock:
+            archive = cls._registry.get(path)
+            if archive is None or archive.stamp != stamp:
+                archive = cls._load_index(path, stamp) or cls._build_index(path, stamp)
+                cls._registry[path] = archive
+            return archive
+
+    @classmethod
+    def _index_path(cls, path):
+        return os.path.join(dataset_cache_dir(path), INDEX_NAME)
+
+    @classmethod
+    def _load_index(cls, path, stamp):
+        try:
+            with np.load(cls._index_path(path), allow_pickle=False) as data:
+                if int(data["version"]) != INDEX_VERSION or tuple(data["stamp"].tolist()) != stamp:
+                    return None
+                return cls(
+                    path, stamp, data["names"].tolist(), data["offsets"], data["sizes"],
+                    data["mtimes"], data["methods"],
+                )
+        except (OSError, KeyError, ValueError):
+            return None
+
+    @classmethod
+    def _build_index(cls, path, stamp):
+        members = _index_zip(path) if path.lower().endswith(".zip") else _index_tar(path)
+        columns = list(zip(*members)) or [[], [], [], [], []]
+        names, offsets, sizes, mtimes, methods = columns
+        arrays = {
+            "version": np.array(INDEX_VERSION),
+            "stamp": np.array(stamp, dtype=np.int64),
+            "names": np.array(names, dtype=str),
+            "offsets": np.array(offsets, dtype=np.int64),
+            "sizes": np.array(sizes, dtype=np.int64),
+            "mtimes": np.array(mtimes, dtype=np.int64),
+            "methods": np.array(methods, dtype=np.int16),
+        }
+        index_path = cls._index_path(path)
+        tmp = f"{index_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, index_path)
+        except OSError:
+            pass  # an unwritable cache only costs re-indexing next time
+        return cls(path, stamp, names, offsets, sizes, mtimes, methods)
+
+    # --- queries --------------------------------------------------------
+
+    def stat(self, member):
+        """``(size, mtime_ns)`` of ``member``; raises FileNotFoundError."""
+        entry = self.members.get(member)
+        if entry is None:
+            raise FileNotFoundError(f"{member} is not in {self.path}")
+        return entry[1], entry[2]
+
+    def _directories(self):
+        if self._dirs is None:
+            dirs = {}
+            for name, (_, size, mtime_ns, _) in self.members.items():
+                head, _, tail = name.rpartition("/")
+                dirs.setdefault(head, {})[tail] = (size, mtime_ns)
+                while head:
+                    head = head.rpartition("/")[0]
+                    dirs.setdefault(head, {})
+            self._dirs = dirs
+        return self._dirs
+
+    def isdir(self, member):
+        return member.rstrip("/") in self._directories()
+
+    def listdir(self, member):
+        """``{name: (size, mtime_ns)}`` of the files directly in ``member``."""
+        return dict(self._directories().get(member.rstrip("/"), {}))
+
+    # --- reading --------------------------------------------------------
+
+    def _map(self):
+        with self._lock:
+            if self._mmap is None:
+                with open(self.path, "rb") as f:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return self._mmap
+
+    def buffer(self, member):
+        """Contents of ``member`` as a ``uint8`` array; a view of the memory
+        map when the member is stored uncompressed."""
+        entry = self.members.get(member)
+        if entry is None:
+            raise FileNotFoundError(f"{member} is not in {self.path}")
+        offset, size, _, method = entry
+        if method == STORED:
+            if size == 0:
+                return np.empty(0, dtype=np.uint8)
+            return np.frombuffer(self._map(), dtype=np.uint8, count=size, offset=offset)
+        with self._lock:
+            if self._zip is None:
+                self._zip = zipfile.ZipFile(self.path)
+            return np.frombuffer(self._zip.read(member), dtype=np.uint8)
+
+
+@functools.lru_cache(maxsize=4096)
+def _archive_root(path):
+    # The archive ``path`` is or lies under, or None
+    if path.lower().endswith(ARCHIVE_SUFFIXES) and os.path.isfile(path):
+        return path
+    parent = os.path.dirname(path)
+    return None if parent == path else _archive_root(parent)
+
+
+def locate(path):
+    """Return ``(archive_path, member)`` if ``path`` lies in an archive
+    (``member`` is ``""`` for the archive itself), else ``None``."""
+    path = os.path.abspath(path)
+    root = _archive_root(path) if path.lower().endswith(ARCHIVE_SUFFIXES) else _archive_root(os.path.dirname(path))
+    if root is None:
+        return None
+    member = "" if root == path else os.path.relpath(path, root).replace(os.sep, "/")
+    return root, member
+
+
+def is_archive_path(path):
+    return locate(path) is not None
+
+
+def overlay_path(archive, member):
+    return os.path.join(archive + OVERLAY_SUFFIX, *member.split("/"))
+
+
+def stat(path):
+    """``(size, mtime_ns)`` of a file; raises FileNotFoundError."""
+    loc = locate(path)
+    if loc is None:
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+    try:
+        st = os.stat(overlay_path(*loc))
+        return st.st_size, st.st_mtime_ns
+    except FileNotFoundError:
+        return Archive.open(loc[0]).stat(loc[1])
+
+
+def mtime_ns(path):
+    """``mtime_ns`` of a file, ``None`` if it does not exist."""
+    try:
+        return stat(path)[1]
+    except OSError:
+        return None
+
+
+def exists(path):
+    """Whether ``path`` is an existing file or directory."""
+    loc = locate(path)
+    if loc is None:
+        return os.path.exists(path)
+    return mtime_ns(path) is not None or isdir(path)
+
+
+def isdir(path):
+    loc = locate(path)
+    if loc is None:
+        return os.path.isdir(path)
+    return Archive.open(loc[0]).isdir(loc[1]) or os.path.isdir(overlay_path(*loc))
+
+
+def dir_mtime_ns(path):
+    """Modification time of a directory, ``None`` if it does not exist.
+
+    Inside an archive this changes whenever the archive or the directory's
+    overlay does.
+    """
+    loc = locate(path)
+    try:
+        if loc is None:
+            return os.stat(path).st_mtime_ns
+        archive = os.stat(loc[0]).st_mtime_ns
+    except OSError:
+        return None
+    try:
+        return max(archive, os.stat(overlay_path(*loc)).st_mtime_ns)
+    except OSError:
+        return archive
+
+
+def scandir(path):
+    """``{name: (size, mtime_ns)}`` of the files directly in ``path``."""
+    loc = locate(path)
+    found = {}
+    if loc is not None:
+        found = Archive.open(loc[0]).listdir(loc[1])
+        path = overlay_path(*loc)
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_file():
+                    st = entry.stat()
+                    found[entry.name] = (st.st_size, st.st_mtime_ns)
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+    return found
+
+
+def buffer(path):
+    """Contents of a file as a ``uint8`` array."""
+    loc = locate(path)
+    if loc is not None:
+        overlay = overlay_path(*loc)
+        if not os.path.exists(overlay):
+            return Archive.open(loc[0]).buffer(loc[1])
+        path = overlay
+    return np.fromfile(path, dtype=np.uint8)
+
+
+def open_file(path, mode="r"):
+    """Open a file for reading (``"r"`` or ``"rb"``)."""
+    loc = locate(path)
+    if loc is not None:
+        overlay = overlay_path(*loc)
+        if not os.path.exists(overlay):
+            data = Archive.open(loc[0]).buffer(loc[1]).tobytes()
+            return io.BytesIO(data) if "b" in mode else io.StringIO(data.decode())
+        path = overlay
+    return open(path, mode)
+
+
+def imread(path, flags=cv2.IMREAD_COLOR):
+    """Like ``cv2.imread``; decodes archive members from the memory map."""
+    if locate(path) is None:
+        return cv2.imread(path, flags)
+    try:
+        data = buffer(path)
+    except OSError:
+        return None
+    return cv2.imdecode(data, flags) if len(data) else None
+
+
+def copy_file(src, dst):
+    """Copy a file, keeping its mtime."""
+    if locate(src) is None:
+        shutil.copy2(src, dst)
+        return
+    _, mtime = stat(src)
+    with open(dst, "wb") as f:
+        f.write(buffer(src).tobytes())
+    os.utime(dst, ns=(mtime, mtime))
+
+
+def write_path(path):
+    """Where a write to ``path`` goes: its overlay file for archive members
+    (whose directory is created), else ``path`` itself."""
+    loc = locate(path)
+    if loc is None:
+        return path
+    target = overlay_path(*loc)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    return target
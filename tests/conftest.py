@@ -0,0 +1,9 @@
+import pytest
+
+import cache
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache_dir(tmp_path_factory, monkeypatch):
+    """Keep per-dataset caches (manifests, stats, ...) out of the real home."""
+    monkeypatch.setattr(cache, "CACHE_ROOT", str(tmp_path_factory.mktemp("annoq-cache")))
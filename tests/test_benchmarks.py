@@ -0,0 +1,25 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import suite
+
+
+def test_suite_runs_on_a_tiny_dataset():
+    doc = suite.run_suite(images=6, boxes=3, size=(160, 120), repeat=1, workers=1)
+    assert doc["meta"]["images"] == 6
+    results = doc["results"]
+    for name in ("dataset_scan_cold", "load_labels", "compute_stats_cold", "render_tiles_warm", "export_copy"):
+        assert results[name]["min"] > 0
+    assert results["load_labels"]["ops"] == 6
+
+
+def test_compare_flags_slowdowns_above_threshold():
+    def doc(**times):
+        return {"results": {k: {"min": v} for k, v in times.items()}}
+
+    rows = suite.compare(doc(a=0.1, b=0.1, c=0.0001), doc(a=0.2, b=0.11, c=0.0005), threshold=0.25)
+    regressed = {name: flag for name, _, _, _, flag in rows}
+    # c is 5x slower but below the noise floor
+    assert regressed == {"a": True, "b": False, "c": False}
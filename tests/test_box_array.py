@@ -0,0 +1,78 @@
+import random
+
+import numpy as np
+
+from bounding_box import BoundingBox, smallest_box_containing_point
+from box_array import BoxArray
+
+
+def random_boxes(n, seed=0):
+    rng = random.Random(seed)
+    return [
+        BoundingBox(rng.randrange(5), rng.random(), rng.random(), rng.random() / 3, rng.random() / 3)
+        for _ in range(n)
+    ]
+
+
+def test_text_round_trip_matches_to_yolo_format():
+    boxes = random_boxes(200)
+    text = "".join(box.to_yolo_format() + "\n" for box in boxes)
+    arr = BoxArray.from_yolo_text(text)
+    assert len(arr) == 200
+    assert arr.to_yolo_text() == text
+    assert BoxArray.from_yolo_text(arr.to_yolo_text()) == arr
+
+
+def test_malformed_lines_are_skipped():
+    text = "0 0.5 0.5 0.1 0.1\n1 0.2 0.2\n\nx 0.1 0.1 0.1 0.1\n2 0.3 0.3 0.2 0.2\n"
+    arr = BoxArray.from_yolo_text(text)
+    assert arr.class_ids.tolist() == [0, 2]
+    assert BoxArray.from_yolo_text("").to_yolo_text() == ""
+
+
+def test_class_ids_out_of_int32_range_are_skipped():
+    arr = BoxArray.from_yolo_text("99999999999 0.5 0.5 0.1 0.1\n1 0.2 0.2 0.1 0.1\n")
+    assert arr.class_ids.tolist() == [1]
+    assert len(BoxArray.from_yolo_text("-99999999999 0.5 0.5 0.1 0.1\n")) == 0
+
+
+def test_pixel_rects_match_bounding_box():
+    boxes = random_boxes(100, seed=1)
+    arr = BoxArray.from_boxes(boxes, np.float64)
+    rects = arr.to_pixel_rects(640, 480)
+    assert [tuple(r) for r in rects.tolist()] == [b.to_pixel_rect(640, 480) for b in boxes]
+
+
+def test_smallest_containing_matches_linear_scan():
+    boxes = random_boxes(300, seed=2)
+    arr = BoxArray.from_boxes(boxes, np.float64)
+    rng = random.Random(3)
+    for _ in range(100):
+        x, y = rng.randrange(640), rng.randrange(480)
+        expected = smallest_box_containing_point(boxes, x, y, 640, 480)
+        idx = arr.smallest_containing(x, y, 640, 480)
+        assert (None if idx is None else boxes[idx]) is expected
+
+
+def test_clip_and_areas():
+    arr = BoxArray([0, 1], [0.0, 0.5], [0.5, 0.5], [0.4, 0.2], [0.2, 0.2])
+    clipped = arr.clip()
+    assert np.allclose(clipped.xc, [0.1, 0.5])
+    assert np.allclose(clipped.w, [0.2, 0.2])
+    assert np.allclose(clipped.areas(), [0.04, 0.04])
+
+
+def test_to_boxes_uses_class_names_and_colors():
+    arr = BoxArray([0, 3], [0.5, 0.5], [0.5, 0.5], [0.1, 0.1], [0.1, 0.1])
+    boxes = arr.to_boxes(["cat", "dog"])
+    assert [b.class_name for b in boxes] == ["cat", "3"]
+    assert [b.color for b in boxes] == arr.colors()
+
+
+def test_to_boxes_matches_parsed_text():
+    rng = np.random.default_rng(1)
+    text = "".join(f"{i % 3} {a:.6f} {b:.6f} {c:.6f} {d:.6f}\n" for i, (a, b, c, d) in enumerate(rng.random((500, 4))))
+    expected = [[float(v) for v in line.split()[1:]] for line in text.splitlines()]
+    for dtype in (np.float64, np.float32):
+        boxes = BoxArray.from_yolo_text(text, dtype).to_boxes()
+        assert [[b.x_center, b.y_center, b.width, b.height] for b in boxes] == expected
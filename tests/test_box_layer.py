@@ -0,0 +1,105 @@
+import itertools
+
+from bounding_box import BoundingBox
+from box_layer import BoxLayer
+
+
+class RecordingCanvas:
+    def __init__(self):
+        self.items = {}
+        self.calls = []
+        self._ids = itertools.count(1)
+
+    def _create(self, kind, coords, **kw):
+        item = next(self._ids)
+        self.items[item] = dict(kind=kind, coords=list(coords), **kw)
+        self.calls.append(("create", item))
+        return item
+
+    def create_rectangle(self, *coords, **kw):
+        return self._create("rect", coords, **kw)
+
+    def create_text(self, *coords, **kw):
+        return self._create("text", coords, **kw)
+
+    def coords(self, item, *coords):
+        self.calls.append(("coords", item))
+        self.items[item]["coords"] = list(coords)
+
+    def itemconfig(self, item, **kw):
+        self.calls.append(("itemconfig", item))
+        self.items[item].update(kw)
+
+    def move(self, tag, dx, dy):
+        self.calls.append(("move", tag))
+        for item in self.items.values():
+            if item.get("tag") == tag:
+                item["coords"] = [v + (dx if i % 2 == 0 else dy) for i, v in enumerate(item["coords"])]
+
+    def delete(self, *items):
+        for item in items:
+            self.calls.append(("delete", item))
+            del self.items[item]
+
+
+def pixel_rects(boxes):
+    return [box.to_pixel_rect(100, 100) for box in boxes]
+
+
+def make_boxes(n):
+    return [BoundingBox(i % 3, 0.1 + i * 0.01, 0.5, 0.1, 0.1, f"c{i % 3}") for i in range(n)]
+
+
+def test_sync_creates_items_once():
+    canvas = RecordingCanvas()
+    layer = BoxLayer(canvas)
+    boxes = make_boxes(5)
+    layer.sync(boxes, pixel_rects(boxes))
+    assert len(canvas.items) == 10
+    canvas.calls.clear()
+    layer.sync(boxes, pixel_rects(boxes))
+    assert canvas.calls == []
+
+
+def test_moving_one_box_touches_only_its_items():
+    canvas = RecordingCanvas()
+    layer = BoxLayer(canvas)
+    boxes = make_boxes(5)
+    layer.sync(boxes, pixel_rects(boxes))
+    canvas.calls.clear()
+    boxes[2].x_center = 0.8
+    layer.sync(boxes, pixel_rects(boxes))
+    touched = {item for _, item in canvas.calls}
+    assert len(touched) == 2
+    assert all(op == "coords" for op, _ in canvas.calls)
+
+
+def test_class_change_restyles_and_removed_boxes_are_deleted():
+    canvas = RecordingCanvas()
+    layer = BoxLayer(canvas)
+    boxes = make_boxes(3)
+    layer.sync(boxes, pixel_rects(boxes))
+    boxes[0].class_name = "other"
+    boxes[0].color = "#123456"
+    layer.sync(boxes[:2], pixel_rects(boxes[:2]))
+    assert len(layer) == 2
+    assert len(canvas.items) == 4
+    texts = [item for item in canvas.items.values() if item["kind"] == "text"]
+    assert {"text": "other", "fill": "#123456"}.items() <= texts[0].items()
+    assert boxes[2] not in layer
+
+
+def test_move_translates_all_items_in_one_call():
+    canvas = RecordingCanvas()
+    layer = BoxLayer(canvas)
+    boxes = make_boxes(4)
+    layer.sync(boxes, pixel_rects(boxes))
+    canvas.calls.clear()
+    layer.move(-7, 3)
+    assert canvas.calls == [("move", "box")]
+    moved = [(x1 - 7, y1 + 3, x2 - 7, y2 + 3) for x1, y1, x2, y2 in pixel_rects(boxes)]
+    assert [canvas.items[i]["coords"] for i in (1, 3, 5, 7)] == [list(r) for r in moved]
+    # The stored rects follow, so syncing to the moved positions is a no-op
+    canvas.calls.clear()
+    layer.sync(boxes, moved)
+    assert canvas.calls == []
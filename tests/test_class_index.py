@@ -0,0 +1,106 @@
+import os
+
+import numpy as np
+
+import class_index
+from class_index import ClassIndex, FilteredView
+from yolo_dataset import YoloDataset
+
+
+def make_dataset(tmp_path, count=6):
+    img_dir = tmp_path / "images"
+    lbl_dir = tmp_path / "labels"
+    img_dir.mkdir()
+    lbl_dir.mkdir()
+    for i in range(count):
+        (img_dir / f"img_{i}.jpg").write_bytes(b"")
+        if i == 3:
+            continue  # no label file
+        lines = [f"{(i + k) % 3} {0.1 * k + 0.05:.6f} 0.500000 0.100000 0.250000\n" for k in range(i)]
+        (lbl_dir / f"img_{i}.txt").write_text("".join(lines))
+    return YoloDataset(str(img_dir), str(lbl_dir), ["a", "b", "c"])
+
+
+def test_index_lists_images_and_box_counts_per_class(tmp_path):
+    index = make_dataset(tmp_path).class_index()
+    assert index.class_ids() == [0, 1, 2]
+    images, counts = index.class_box_counts(0)
+    assert images.tolist() == [2, 4, 5] and counts.tolist() == [1, 1, 2]
+    assert index.images_with_class(1).tolist() == [1, 4, 5]
+    assert index.backgrounds().tolist() == [0, 3]
+    assert index.images_with_more_boxes(2).tolist() == [4, 5]
+
+
+def test_saved_labels_update_the_index_and_persist(tmp_path, monkeypatch):
+    ds = make_dataset(tmp_path)
+    index = ds.class_index()
+    ds.save_labels("2 0.5 0.5 0.1 0.1\n", 1)
+    assert index.images_with_class(1).tolist() == [4, 5]
+    assert index.images_with_class(2).tolist() == [1, 2, 4, 5]
+    ds.save_labels("", 5)
+    assert index.backgrounds().tolist() == [0, 3, 5]
+    ds.sync()
+
+    # Reopening loads the saved index instead of rebuilding it
+    reopened = YoloDataset(ds.image_dir, ds.label_dir, ds.class_names)
+    monkeypatch.setattr(ClassIndex, "build", classmethod(lambda cls, pack: 1 / 0))
+    again = reopened.class_index()
+    assert again.images_with_class(2).tolist() == [1, 2, 4]
+    assert again.backgrounds().tolist() == [0, 3, 5]
+
+
+def test_index_is_rebuilt_when_labels_change_outside(tmp_path):
+    ds = make_dataset(tmp_path)
+    ds.class_index()
+    with open(ds.label_path(0), "w") as f:
+        f.write("1 0.5 0.5 0.1 0.1\n")
+    reopened = YoloDataset(ds.image_dir, ds.label_dir, ds.class_names)
+    assert reopened.class_index().images_with_class(1).tolist() == [0, 1, 4, 5]
+
+
+def test_added_and_removed_images_are_remapped(tmp_path, monkeypatch):
+    ds = make_dataset(tmp_path)
+    index = ds.class_index()
+    view = FilteredView("b", index.images_with_class(1))
+    monkeypatch.setattr(ClassIndex, "build", classmethod(lambda cls, pack: 1 / 0))
+    (tmp_path / "images" / "img_0a.jpg").write_bytes(b"")
+    (tmp_path / "labels" / "img_0a.txt").write_text("1 0.5 0.5 0.1 0.1\n")
+    os.remove(tmp_path / "images" / "img_4.jpg")
+    st = os.stat(tmp_path / "images" / "img_0a.jpg")
+    summary = ds.apply_changes({"img_0a.jpg": (st.st_size, st.st_mtime_ns), "img_4.jpg": None})
+    assert summary["rows"].tolist() == [0, -1, 1, 2, 3, 5]
+    assert ds.class_index() is index
+    assert index.images_with_class(1).tolist() == [1, 2, 5]
+    assert index.backgrounds().tolist() == [0, 4]
+    view.reindex(summary["rows"])
+    assert view.indices == [2, 5]
+
+    ds.sync()
+    reopened = YoloDataset(ds.image_dir, ds.label_dir, ds.class_names)
+    assert reopened.class_index().images_with_class(1).tolist() == [1, 2, 5]
+
+
+def test_build_handles_an_empty_split():
+    class EmptyPack:
+        names = []
+        dirty = False
+        offsets = np.zeros(1, np.int64)
+        class_ids = image_idx = label_sizes = label_mtimes = np.empty(0, np.int64)
+
+        def __len__(self):
+            return 0
+
+    index = ClassIndex.build(EmptyPack())
+    assert len(index) == 0 and index.class_ids() == []
+    assert index.fingerprint == class_index.fingerprint(EmptyPack())
+
+
+def test_filtered_view_steps_through_matches():
+    view = FilteredView("a", [2, 5, 9])
+    assert view.first() == 2
+    assert view.next(2) == 5 and view.next(5) == 9 and view.next(9) is None
+    assert view.prev(9) == 5 and view.prev(2) is None
+    # From an image outside the view
+    assert 6 not in view
+    assert view.next(6) == 9 and view.prev(6) == 5
+    assert view.next(0) == 2 and view.prev(100) == 9
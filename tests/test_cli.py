@@ -0,0 +1,107 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import annoq
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_yaml_dataset(tmp_path):
+    for split in ("train", "val"):
+        (tmp_path / split / "images").mkdir(parents=True)
+        (tmp_path / split / "labels").mkdir(parents=True)
+        for i in range(3):
+            (tmp_path / split / "images" / f"{split}_{i}.jpg").write_bytes(b"jpg")
+    (tmp_path / "train" / "labels" / "train_0.txt").write_text("0 0.5 0.5 0.2 0.2\n")
+    (tmp_path / "train" / "labels" / "train_1.txt").write_text("5 0.5 0.5 0.2 0.2\n0 1.5 0.5 0.2 0.2\n")
+    (tmp_path / "train" / "labels" / "orphan.txt").write_text("")
+    yaml_path = tmp_path / "data.yaml"
+    yaml_path.write_text("names: [cat, dog]\ntrain: train/images\nval: val/images\n")
+    return str(yaml_path)
+
+
+def records(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_stats_emits_json_lines(tmp_path, capsys):
+    yaml_path = make_yaml_dataset(tmp_path)
+    assert annoq.main(["stats", "--yaml", yaml_path]) == 0
+    out = records(capsys)
+    assert [r["split"] for r in out] == ["train", "val"]
+    assert out[0]["class_counts"] == {"cat": 2, "dog": 0, "5": 1}
+    assert out[1]["background_images"] == 3
+
+
+def test_validate_reports_findings_with_indices(tmp_path, capsys):
+    yaml_path = make_yaml_dataset(tmp_path)
+    assert annoq.main(["validate", "--yaml", yaml_path, "--split", "train"]) == 1
+    out = records(capsys)
+    kinds = {(r["kind"], r["index"]) for r in out if r["event"] == "finding"}
+    assert kinds == {
+        ("missing_label", 2),
+        ("orphan_label", None),
+        ("bad_class_id", 1),
+        ("coords_out_of_range", 1),
+        # The fixture's images are not real JPEGs
+        ("unreadable_image", 0),
+        ("unreadable_image", 1),
+        ("unreadable_image", 2),
+    }
+    assert out[-1]["event"] == "summary"
+
+
+def test_export_range(tmp_path, capsys):
+    yaml_path = make_yaml_dataset(tmp_path)
+    out_dir = tmp_path / "out"
+    argv = ["export", "--yaml", yaml_path, "--split", "train", "--out", str(out_dir), "--stop", "2"]
+    assert annoq.main(argv) == 0
+    assert records(capsys)[0]["images"] == 2
+    assert sorted(os.listdir(out_dir / "images")) == ["train_0.jpg", "train_1.jpg"]
+    assert sorted(os.listdir(out_dir / "labels")) == ["train_0.txt", "train_1.txt"]
+
+
+def test_export_rejects_unknown_class(tmp_path, capsys):
+    yaml_path = make_yaml_dataset(tmp_path)
+    argv = ["export", "--yaml", yaml_path, "--split", "train", "--out", str(tmp_path / "out"), "--classes", "nope"]
+    with pytest.raises(SystemExit) as exc:
+        annoq.main(argv)
+    assert exc.value.code == 2
+    assert "unknown class 'nope'" in capsys.readouterr().err
+    assert not (tmp_path / "out").exists()
+
+
+def test_duplicates_finds_leak_between_splits(tmp_path, capsys):
+    import cv2
+    import numpy as np
+
+    yaml_path = make_yaml_dataset(tmp_path)
+    rng = np.random.default_rng(0)
+    for split in ("train", "val"):
+        for i in range(3):
+            img = cv2.resize(rng.integers(0, 256, (8, 8, 3), dtype=np.uint8), (64, 64))
+            cv2.imwrite(str(tmp_path / split / "images" / f"{split}_{i}.jpg"), img)
+    leaked = cv2.imread(str(tmp_path / "train" / "images" / "train_1.jpg"))
+    cv2.imwrite(str(tmp_path / "val" / "images" / "val_2.jpg"), leaked)
+    report = tmp_path / "report.json"
+    assert annoq.main(["duplicates", "--yaml", yaml_path, "--report", str(report)]) == 0
+    out = records(capsys)
+    groups = [r for r in out if r["event"] == "duplicates"]
+    assert [(m["split"], m["index"]) for m in groups[0]["members"]] == [("train", 1), ("val", 2)]
+    assert out[-1] == {"event": "summary", "groups": 1, "leaking_groups": 1, "images": 2}
+    assert json.loads(report.read_text())[0]["leak"] is True
+
+
+def test_cli_does_not_import_gui_modules(tmp_path):
+    yaml_path = make_yaml_dataset(tmp_path)
+    code = (
+        "import sys, annoq; annoq.main(['stats', '--yaml', sys.argv[1]]); "
+        "bad = {'tkinter', 'PIL.ImageTk', 'ultralytics'} & set(sys.modules); "
+        "assert not bad, bad"
+    )
+    env = dict(os.environ, ANNOQ_CACHE_DIR=str(tmp_path / "cache"))
+    subprocess.run([sys.executable, "-c", code, yaml_path], cwd=ROOT, env=env, check=True)
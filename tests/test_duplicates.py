@@ -0,0 +1,127 @@
+import csv
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+import duplicates
+from duplicates import (
+    ImageHashes,
+    connected_components,
+    duplicate_groups,
+    find_duplicates,
+    hamming,
+    image_hashes,
+    near_pairs,
+    write_report,
+)
+from yolo_dataset import YoloDataset
+
+
+def pattern(seed, size=(160, 120)):
+    rng = np.random.default_rng(seed)
+    img = rng.integers(0, 256, (size[1] // 8, size[0] // 8, 3), dtype=np.uint8)
+    return cv2.resize(img, size, interpolation=cv2.INTER_CUBIC)
+
+
+def make_split(root, images):
+    img_dir = root / "images"
+    lbl_dir = root / "labels"
+    img_dir.mkdir(parents=True)
+    lbl_dir.mkdir(parents=True)
+    for name, img in images.items():
+        cv2.imwrite(str(img_dir / name), img)
+    return YoloDataset(str(img_dir), str(lbl_dir), ["a"])
+
+
+def distances(a, b):
+    return [int(hamming(np.uint64(x), np.uint64(y))) for x, y in zip(a, b)]
+
+
+def test_hashes_survive_resize_and_reencode(tmp_path):
+    img = pattern(1)
+    cv2.imwrite(str(tmp_path / "a.png"), img)
+    cv2.imwrite(str(tmp_path / "b.jpg"), cv2.resize(img, (80, 60)), [cv2.IMWRITE_JPEG_QUALITY, 70])
+    cv2.imwrite(str(tmp_path / "c.png"), pattern(2))
+    a = image_hashes(str(tmp_path / "a.png"))
+    b = image_hashes(str(tmp_path / "b.jpg"))
+    c = image_hashes(str(tmp_path / "c.png"))
+    assert max(distances(a, b)) <= 6
+    assert min(distances(a, c)) > 10
+    assert all(0 <= h < 1 << 64 for h in a)
+
+
+def test_near_pairs_matches_brute_force():
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 2**63, 300, dtype=np.uint64) * np.uint64(2) + rng.integers(0, 2, 300).astype(np.uint64)
+    flips = np.uint64(1) << rng.integers(0, 64, (100, 3)).astype(np.uint64)
+    near = base[:100] ^ flips[:, 0] ^ flips[:, 1] ^ flips[:, 2]
+    hashes = np.unique(np.concatenate([base, near]))
+    d = hamming(hashes[:, None], hashes[None, :])
+    expected = {(i, j) for i, j in zip(*np.nonzero(d <= 4)) if i < j}
+    assert {tuple(p) for p in near_pairs(hashes, 4).tolist()} == expected
+    assert len(expected) >= 100
+
+
+def test_connected_components_and_groups():
+    labels = connected_components(6, np.array([[3, 4], [1, 3], [0, 5]]))
+    assert labels.tolist() == [0, 1, 2, 1, 1, 0]
+    groups = duplicate_groups(np.array([0b1111, 7, 1 << 40, 0b1111, 2**64 - 1], dtype=np.uint64), 1)
+    assert [g.tolist() for g in groups] == [[0, 1, 3]]
+
+
+def test_find_duplicates_reports_leaks_and_caches_hashes(tmp_path, monkeypatch):
+    img = pattern(1)
+    train = make_split(tmp_path / "train", {
+        "a.png": img, "b.png": pattern(2), "c.png": img, "broken.png": pattern(3),
+    })
+    (tmp_path / "train" / "images" / "broken.png").write_bytes(b"not an image")
+    val = make_split(tmp_path / "val", {"x.png": pattern(4), "y.png": cv2.resize(img, (80, 60))})
+    groups = find_duplicates({"train": train, "val": val})
+    assert len(groups) == 1
+    group = groups[0]
+    assert group["leak"] and group["splits"] == ["train", "val"]
+    assert group["kind"] == "near"
+    assert [(m["split"], m["index"]) for m in group["members"]] == [("train", 0), ("train", 3), ("val", 1)]
+    assert group["members"][1]["distance"] == 0
+
+    def fail(*args):
+        raise AssertionError("hashes should come from the cache")
+
+    monkeypatch.setattr(duplicates, "image_hashes", fail)
+    assert find_duplicates({"train": train, "val": val}) == groups
+    hashes, readable = ImageHashes(train).hashes()
+    assert readable.tolist() == [True, True, False, True]
+    assert (hashes[0] == hashes[3]).all()
+
+
+def test_identical_group_within_one_split(tmp_path):
+    img = pattern(5)
+    ds = make_split(tmp_path / "train", {"a.png": img, "b.png": img, "c.png": pattern(6)})
+    groups = find_duplicates({"train": ds})
+    assert [(g["kind"], g["leak"], len(g["members"])) for g in groups] == [("identical", False, 2)]
+
+
+def test_write_report(tmp_path):
+    groups = [{
+        "group": 0, "kind": "near", "splits": ["train", "val"], "leak": True,
+        "members": [
+            {"split": "train", "index": 3, "image": "/d/a.jpg", "distance": 0},
+            {"split": "val", "index": 1, "image": "/d/b.jpg", "distance": 2},
+        ],
+    }]
+    write_report(groups, str(tmp_path / "r.csv"))
+    with open(tmp_path / "r.csv") as f:
+        rows = list(csv.DictReader(f))
+    assert [(r["split"], r["index"], r["leak"]) for r in rows] == [("train", "3", "1"), ("val", "1", "1")]
+    write_report(groups, str(tmp_path / "r.json"))
+    assert json.loads((tmp_path / "r.json").read_text()) == groups
+
+
+@pytest.mark.parametrize("distance", [0, 1, 7, 63])
+def test_bands_cover_all_bits(distance):
+    bands = duplicates._bands(distance)
+    assert len(bands) == min(distance + 1, 64)
+    assert sum(bits for _, bits in bands) == 64
+    assert [shift for shift, _ in bands] == sorted(shift for shift, _ in bands)
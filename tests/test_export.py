@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+
+import pytest
+import yaml
+
+import export
+import label_writer
+from yolo_dataset import YoloDataset
+
+
+def make_dataset(tmp_path, count=10):
+    img_dir = tmp_path / "images"
+    lbl_dir = tmp_path / "labels"
+    img_dir.mkdir()
+    lbl_dir.mkdir()
+    for i in range(count):
+        (img_dir / f"img_{i:02d}.jpg").write_bytes(b"jpg%d" % i)
+        if i % 2 == 0:
+            (lbl_dir / f"img_{i:02d}.txt").write_text(f"{i % 3} 0.5 0.5 0.1 0.1\n")
+    return YoloDataset(str(img_dir), str(lbl_dir), ["a", "b", "c"])
+
+
+@pytest.mark.parametrize("mode", export.MODES)
+def test_export_subset(tmp_path, mode):
+    ds = make_dataset(tmp_path)
+    out = tmp_path / "out"
+    seen = []
+    summary = export.export_dataset(
+        ds, str(out), ds.class_names, indices=[1, 2, 4], mode=mode, progress=lambda *p: seen.append(p)
+    )
+    assert summary["images"] == 3 and summary["labels"] == 2 and summary["finished"]
+    assert sorted(os.listdir(out / "images")) == ["img_01.jpg", "img_02.jpg", "img_04.jpg"]
+    assert sorted(os.listdir(out / "labels")) == ["img_02.txt", "img_04.txt"]
+    assert (out / "images" / "img_04.jpg").read_bytes() == b"jpg4"
+    assert yaml.safe_load((out / "data.yaml").read_text())["names"] == ["a", "b", "c"]
+    assert seen[-1] == (3, 3)
+    assert [p for p in os.listdir(tmp_path) if "partial" in p] == []
+
+
+def test_hardlinks_images_but_copies_labels(tmp_path):
+    ds = make_dataset(tmp_path, count=2)
+    out = tmp_path / "out"
+    summary = export.export_dataset(ds, str(out), ds.class_names, mode="hardlink")
+    assert summary["linked"] == 2
+    assert os.path.samefile(ds.image_paths[0], out / "images" / "img_00.jpg")
+    assert not os.path.samefile(ds.label_path(0), out / "labels" / "img_00.txt")
+
+
+def test_cancel_removes_staging(tmp_path):
+    ds = make_dataset(tmp_path)
+    cancel = threading.Event()
+    cancel.set()
+    summary = export.export_dataset(ds, str(tmp_path / "out"), ds.class_names, cancel=cancel)
+    assert not summary["finished"]
+    assert sorted(os.listdir(tmp_path)) == ["images", "labels"]
+
+
+def test_failure_leaves_nothing_behind(tmp_path):
+    ds = make_dataset(tmp_path, count=3)
+    os.remove(ds.image_paths[1])
+    with pytest.raises(FileNotFoundError):
+        export.export_dataset(ds, str(tmp_path / "out"), ds.class_names)
+    assert sorted(os.listdir(tmp_path)) == ["images", "labels"]
+
+
+def test_queued_label_saves_are_exported(tmp_path, monkeypatch):
+    ds = make_dataset(tmp_path, count=2)
+    write_batch = label_writer.write_batch
+
+    def slow(items):
+        time.sleep(0.2)
+        return write_batch(items)
+
+    monkeypatch.setattr(label_writer, "write_batch", slow)
+    ds.save_labels("1 0.5 0.5 0.2 0.2\n", idx=0, background=True)
+    export.export_dataset(ds, str(tmp_path / "out"), ds.class_names)
+    assert (tmp_path / "out" / "labels" / "img_00.txt").read_text() == "1 0.5 0.5 0.2 0.2\n"
+
+    monkeypatch.setattr(label_writer, "write_batch", lambda items: [(p, OSError("disk full")) for p, _ in items])
+    ds.save_labels("", idx=1, background=True)
+    with pytest.raises(OSError, match="disk full"):
+        export.export_dataset(ds, str(tmp_path / "out2"), ds.class_names)
+    assert not (tmp_path / "out2").exists()
+
+
+def test_existing_target_is_refused(tmp_path):
+    ds = make_dataset(tmp_path, count=1)
+    (tmp_path / "out").mkdir()
+    with pytest.raises(FileExistsError):
+        export.export_dataset(ds, str(tmp_path / "out"), ds.class_names)
+
+
+def test_select_indices_filters(tmp_path):
+    ds = make_dataset(tmp_path)
+    assert export.select_indices(ds, 2, 6) == [2, 3, 4, 5]
+    assert export.select_indices(ds, labeled=True) == [0, 2, 4, 6, 8]
+    assert export.select_indices(ds, labeled=False) == [1, 3, 5, 7, 9]
+    assert export.select_indices(ds, classes=[1]) == [4]
+
+
+def test_parse_ranges():
+    assert export.parse_ranges("0-2, 5, 8-", 10) == [0, 1, 2, 5, 8, 9]
+    assert export.parse_ranges("7-20", 9) == [7, 8]
+    with pytest.raises(ValueError):
+        export.parse_ranges("3-1", 10)
+    with pytest.raises(ValueError):
+        export.parse_ranges("x", 10)
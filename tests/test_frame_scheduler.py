@@ -0,0 +1,81 @@
+import itertools
+
+from frame_scheduler import FrameScheduler
+
+
+class FakeWidget:
+    def __init__(self):
+        self.jobs = {}
+        self._ids = itertools.count(1)
+
+    def after(self, ms, fn):
+        job = f"after#{next(self._ids)}"
+        self.jobs[job] = (ms, fn)
+        return job
+
+    def after_idle(self, fn):
+        return self.after("idle", fn)
+
+    def after_cancel(self, job):
+        self.jobs.pop(job, None)
+
+    def run(self):
+        jobs, self.jobs = self.jobs, {}
+        for _, fn in jobs.values():
+            fn()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_scheduler():
+    widget, clock, frames = FakeWidget(), FakeClock(), []
+    scheduler = FrameScheduler(
+        widget, lambda layers, fast: frames.append((layers, fast)), frame_ms=16, clock=clock
+    )
+    return scheduler, widget, clock, frames
+
+
+def test_requests_are_coalesced_into_one_frame():
+    scheduler, widget, _, frames = make_scheduler()
+    for _ in range(10):
+        scheduler.request("crosshair", fast=True)
+    scheduler.request("boxes", fast=True)
+    assert len(widget.jobs) == 1
+    widget.run()
+    assert frames == [(frozenset({"crosshair", "boxes"}), True)]
+    stats = scheduler.stats()
+    assert stats["frames"] == 1
+    assert stats["requests"] == 11
+    assert stats["dropped"] == 10
+
+
+def test_next_frame_waits_for_the_frame_interval():
+    scheduler, widget, clock, frames = make_scheduler()
+    scheduler.request("image")
+    assert [ms for ms, _ in widget.jobs.values()] == ["idle"]
+    widget.run()
+    clock.now = 0.004
+    scheduler.request("image")
+    assert [ms for ms, _ in widget.jobs.values()] == [12]
+    widget.run()
+    clock.now = 0.1
+    scheduler.request("image")
+    assert [ms for ms, _ in widget.jobs.values()] == ["idle"]
+
+
+def test_flush_draws_pending_layers_now():
+    scheduler, widget, _, frames = make_scheduler()
+    scheduler.request("crosshair", fast=True)
+    scheduler.flush("boxes")
+    assert frames == [(frozenset({"crosshair", "boxes"}), False)]
+    assert widget.jobs == {}
+    scheduler.request("overlay")
+    scheduler.cancel()
+    widget.run()
+    assert len(frames) == 1
@@ -0,0 +1,67 @@
+import time
+
+import numpy as np
+
+from inference_worker import InferenceWorker
+
+
+class FakeModel:
+    def __init__(self, delay):
+        self.delay = delay
+
+
+def load_fake(model_path):
+    if model_path == "broken.pt":
+        raise RuntimeError("no such model")
+    return FakeModel(0.2 if model_path == "slow.pt" else 0.0)
+
+
+def plot_fake(model, image_path):
+    time.sleep(model.delay)
+    value = int(image_path.split("_")[-1])
+    return np.full((4, 6, 3), value, dtype=np.uint8)
+
+
+def wait_for_result(worker, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = worker.poll(timeout=0.5)
+        if result is not None:
+            return result
+    raise AssertionError("no result from worker")
+
+
+def test_frame_comes_back_through_shared_memory():
+    worker = InferenceWorker("fast.pt", loader=load_fake, plot=plot_fake)
+    try:
+        request_id = worker.submit("img_7")
+        kind, rid, frame = wait_for_result(worker)
+        assert (kind, rid) == ("frame", request_id)
+        assert frame.shape == (4, 6, 3)
+        assert (frame == 7).all()
+    finally:
+        worker.close()
+
+
+def test_only_latest_request_is_returned():
+    worker = InferenceWorker("slow.pt", loader=load_fake, plot=plot_fake)
+    try:
+        for i in range(1, 6):
+            last = worker.submit(f"img_{i}")
+        kind, rid, frame = wait_for_result(worker)
+        while rid != last:
+            kind, rid, frame = wait_for_result(worker)
+        assert kind == "frame"
+        assert (frame == 5).all()
+    finally:
+        worker.close()
+
+
+def test_model_load_error_is_reported():
+    worker = InferenceWorker("broken.pt", loader=load_fake, plot=plot_fake)
+    try:
+        kind, rid, message = wait_for_result(worker)
+        assert kind == "error" and rid is None
+        assert "no such model" in message
+    finally:
+        worker.close()
@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+
+from box_array import BoxArray
+from label_pack import LabelPack, moved_rows, read_pack
+from yolo_dataset import YoloDataset
+
+
+def make_dataset(tmp_path, count=6):
+    img_dir = tmp_path / "images"
+    lbl_dir = tmp_path / "labels"
+    img_dir.mkdir()
+    lbl_dir.mkdir()
+    for i in range(count):
+        (img_dir / f"img_{i}.jpg").write_bytes(b"")
+        if i == 3:
+            continue  # no label file
+        lines = [f"{(i + k) % 3} {0.1 * k + 0.05:.6f} 0.500000 0.123457 0.250000\n" for k in range(i)]
+        (lbl_dir / f"img_{i}.txt").write_text("".join(lines))
+    return YoloDataset(str(img_dir), str(lbl_dir), ["a", "b", "c"])
+
+
+def test_pack_matches_label_files(tmp_path):
+    ds = make_dataset(tmp_path)
+    pack = ds.label_pack()
+    assert len(pack) == 6 and pack.box_count == 0 + 1 + 2 + 4 + 5
+    for idx in range(6):
+        path = ds.label_path(idx)
+        expected = open(path).read() if os.path.exists(path) else ""
+        assert pack.to_yolo_text(idx) == expected
+    assert list(pack.image_idx) == [1, 2, 2, 4, 4, 4, 4, 5, 5, 5, 5, 5]
+
+
+def test_load_is_a_view_of_the_memory_map(tmp_path):
+    ds = make_dataset(tmp_path)
+    ds.label_pack()
+    reopened = LabelPack.open(ds.manifest)
+    boxes = reopened.boxes(4)
+    assert isinstance(reopened.class_ids, np.memmap)
+    assert np.shares_memory(boxes.xc, reopened.xc)
+    assert ds.load_box_array(4) == BoxArray.from_file(ds.label_path(4), np.float32)
+
+
+def test_reopen_only_parses_changed_files(tmp_path, monkeypatch):
+    ds = make_dataset(tmp_path)
+    ds.label_pack()
+    with open(ds.label_path(1), "w") as f:
+        f.write("2 0.5 0.5 0.1 0.1\n0 0.5 0.5 0.2 0.2\n")
+    os.utime(ds.label_path(1), ns=(1, 1))
+    parsed = []
+    import label_pack
+
+    real = label_pack._parse_chunk
+    monkeypatch.setattr(label_pack, "_parse_chunk", lambda d, names: parsed.extend(names) or real(d, names))
+    pack = LabelPack.open(ds.manifest)
+    assert parsed == ["img_1.txt"]
+    assert pack.boxes(1).class_ids.tolist() == [2, 0]
+    assert pack.to_yolo_text(4) == open(ds.label_path(4)).read()
+    parsed.clear()
+    LabelPack.open(ds.manifest)
+    assert parsed == []
+
+
+def test_saved_labels_are_applied_and_persisted(tmp_path):
+    ds = make_dataset(tmp_path)
+    pack = ds.label_pack()
+    ds.save_labels("1 0.5 0.5 0.1 0.1\n", 3, background=True)
+    ds.save_labels("", 5)
+    assert ds.load_box_array(3).class_ids.tolist() == [1]
+    ds.sync()
+    assert pack.boxes(3).class_ids.tolist() == [1]
+    assert len(pack.boxes(5)) == 0
+    assert not pack.dirty
+    names, arrays = read_pack(pack.path)
+    assert arrays["offsets"].tolist() == [0, 0, 1, 3, 4, 8, 8]
+    assert 3 in pack.images_with_classes([1])
+
+
+def test_images_with_classes_sees_unsaved_updates(tmp_path):
+    ds = make_dataset(tmp_path)
+    pack = ds.label_pack()
+    assert pack.images_with_classes([2]) == [2, 4, 5]
+    pack.update(2, BoxArray([0], [0.5], [0.5], [0.1], [0.1]))
+    pack.update(1, BoxArray([2], [0.5], [0.5], [0.1], [0.1]))
+    assert pack.images_with_classes([2]) == [1, 4, 5]
+
+
+def test_moved_rows():
+    rng = np.random.default_rng(0)
+    old = sorted(f"{i:05d}" for i in rng.choice(10_000, 500, replace=False))
+    removed = list(rng.choice(old, 40, replace=False))
+    added = [f"{i:05d}x" for i in rng.choice(10_000, 60, replace=False)]
+    names = sorted(set(old) - set(removed) | set(added))
+    rows = moved_rows(names, added, removed)
+    assert [old[r] if r >= 0 else None for r in rows] == [None if n in added else n for n in names]
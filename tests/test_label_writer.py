@@ -0,0 +1,97 @@
+import os
+import threading
+
+import label_writer
+from label_writer import LabelWriter, write_atomic, write_batch
+from yolo_dataset import YoloDataset
+
+
+def test_write_atomic_replaces_file(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("old\n")
+    write_atomic(str(path), "new\n")
+    assert path.read_text() == "new\n"
+    assert os.listdir(tmp_path) == ["a.txt"]
+
+
+def test_concurrent_writes_of_one_file_do_not_collide(tmp_path):
+    path = str(tmp_path / "a.txt")
+    texts = ["0 0.5 0.5 0.1 0.1\n" * 2000, "1 0.2 0.2 0.3 0.3\n" * 3000]
+    errors = []
+
+    def save(text):
+        for _ in range(50):
+            try:
+                write_atomic(path, text)
+            except OSError as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=save, args=(text,)) for text in texts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    with open(path) as f:
+        assert f.read() in texts
+    assert os.listdir(tmp_path) == ["a.txt"]
+
+
+def test_failed_write_keeps_original(tmp_path, monkeypatch):
+    path = tmp_path / "a.txt"
+    path.write_text("old\n")
+
+    def broken_fsync(fd):
+        raise OSError(5, "I/O error")
+
+    monkeypatch.setattr(label_writer.os, "fsync", broken_fsync)
+    failed = write_batch([(str(path), "new\n")])
+    assert [p for p, _ in failed] == [str(path)]
+    assert path.read_text() == "old\n"
+    assert os.listdir(tmp_path) == ["a.txt"]
+
+
+def test_writer_coalesces_and_batches(tmp_path, monkeypatch):
+    batches = []
+    gate = threading.Event()
+    started = threading.Event()
+    real = label_writer.write_batch
+
+    def recording(items):
+        started.set()
+        gate.wait(5)
+        batches.append(sorted(p for p, _ in items))
+        return real(items)
+
+    monkeypatch.setattr(label_writer, "write_batch", recording)
+    written = []
+    writer = LabelWriter(on_written=written.append)
+    a, b = str(tmp_path / "a.txt"), str(tmp_path / "b.txt")
+    writer.write(a, "1\n")
+    assert started.wait(5)
+    # The first batch is blocked; these pile up and are merged
+    for i in range(5):
+        writer.write(b, f"{i}\n")
+    writer.write(a, "2\n")
+    assert writer.pending(a) == "2\n"
+    gate.set()
+    writer.close()
+    assert batches[-1] == [a, b]
+    assert len(batches) == 2
+    assert open(a).read() == "2\n" and open(b).read() == "4\n"
+    assert writer.pending(a) is None
+    assert sorted(written) == [a, a, b]
+
+
+def test_dataset_background_save_is_visible_before_write(tmp_path):
+    (tmp_path / "images").mkdir()
+    (tmp_path / "labels").mkdir()
+    (tmp_path / "images" / "a.jpg").write_bytes(b"")
+    ds = YoloDataset(str(tmp_path / "images"), str(tmp_path / "labels"), ["x"])
+    assert not ds.has_label(0)
+    ds.save_labels("0 0.5 0.5 0.1 0.1\n", 0, background=True)
+    assert ds.has_label(0)
+    assert len(ds.load_box_array(0)) == 1
+    assert ds.flush_labels() == []
+    assert ds.pending_labels(0) is None
+    assert (tmp_path / "labels" / "a.txt").read_text() == "0 0.5 0.5 0.1 0.1\n"
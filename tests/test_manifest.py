@@ -0,0 +1,62 @@
+import os
+
+from PIL import Image
+
+from manifest import DatasetManifest
+from yolo_dataset import YoloDataset
+
+
+def make_split(tmp_path, count=4):
+    img_dir = tmp_path / "images"
+    lbl_dir = tmp_path / "labels"
+    img_dir.mkdir()
+    lbl_dir.mkdir()
+    for i in range(count):
+        Image.new("RGB", (20 + i, 10)).save(img_dir / f"img_{i}.png")
+    (img_dir / "notes.txt").write_text("not an image")
+    (img_dir / ".hidden.png").write_bytes(b"")
+    (lbl_dir / "img_1.txt").write_text("0 0.5 0.5 0.1 0.1\n")
+    return str(img_dir), str(lbl_dir)
+
+
+def bump_mtime(path, delta_ns=1_000_000_000):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + delta_ns))
+
+
+def test_manifest_lists_images_only(tmp_path):
+    img_dir, lbl_dir = make_split(tmp_path)
+    ds = YoloDataset(img_dir, lbl_dir, [])
+    assert [os.path.basename(p) for p in ds.image_paths] == [f"img_{i}.png" for i in range(4)]
+    assert ds.label_path(2) == os.path.join(lbl_dir, "img_2.txt")
+    assert [ds.has_label(i) for i in range(4)] == [False, True, False, False]
+    assert ds.image_size(3) == (23, 10)
+
+
+def test_unchanged_directories_skip_rescan(tmp_path, monkeypatch):
+    img_dir, lbl_dir = make_split(tmp_path)
+    DatasetManifest.open(img_dir, lbl_dir)
+
+    def fail(*args):
+        raise AssertionError("directory should not be listed")
+
+    monkeypatch.setattr("manifest._list_images", fail)
+    monkeypatch.setattr("manifest._list_labels", fail)
+    assert len(DatasetManifest.open(img_dir, lbl_dir)) == 4
+
+
+def test_incremental_rescan_only_reads_new_images(tmp_path, monkeypatch):
+    img_dir, lbl_dir = make_split(tmp_path)
+    DatasetManifest.open(img_dir, lbl_dir)
+    Image.new("RGB", (5, 6)).save(os.path.join(img_dir, "img_9.png"))
+    os.remove(os.path.join(img_dir, "img_0.png"))
+    bump_mtime(img_dir)
+
+    read = []
+    original = __import__("manifest").read_image_size
+    monkeypatch.setattr("manifest.read_image_size", lambda p: read.append(p) or original(p))
+    manifest = DatasetManifest.open(img_dir, lbl_dir)
+    assert manifest.names == ["img_1.png", "img_2.png", "img_3.png", "img_9.png"]
+    assert read == [os.path.join(img_dir, "img_9.png")]
+    assert (manifest.widths[-1], manifest.heights[-1]) == (5, 6)
+    assert manifest.has_label == [True, False, False, False]
@@ -0,0 +1,94 @@
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from preannotate import PreAnnotator
+from yolo_dataset import YoloDataset
+
+
+class FakeBoxes:
+    def __init__(self, value):
+        self.cls = np.array([0, 1])
+        self.conf = np.array([0.9, 0.1])
+        self.xywhn = np.array([[0.5, 0.5, value, 0.2], [0.1, 0.1, 0.1, 0.1]])
+
+    def __len__(self):
+        return 2
+
+
+class FakeResult:
+    def __init__(self, value):
+        self.boxes = FakeBoxes(value)
+
+
+class FakeModel:
+    def __init__(self, on_call=None):
+        self.batches = []
+        self.on_call = on_call
+
+    def __call__(self, images, conf, verbose):
+        self.batches.append(len(images))
+        if self.on_call:
+            self.on_call(len(self.batches))
+        return [FakeResult(img[0, 0, 0] / 100) for img in images]
+
+
+def make_dataset(tmp_path, count=10):
+    img_dir = tmp_path / "images"
+    lbl_dir = tmp_path / "labels"
+    img_dir.mkdir()
+    lbl_dir.mkdir()
+    for i in range(count):
+        cv2.imwrite(str(img_dir / f"img_{i:02d}.png"), np.full((8, 8, 3), i + 1, np.uint8))
+    (lbl_dir / "img_03.txt").write_text("1 0.5 0.5 0.5 0.5\n")
+    return YoloDataset(str(img_dir), str(lbl_dir), ["a", "b"])
+
+
+def test_writes_filtered_predictions_in_batches(tmp_path):
+    ds = make_dataset(tmp_path)
+    model = FakeModel()
+    progress = []
+    summary = PreAnnotator(ds, model, batch_size=4, conf=0.5).run(
+        progress=lambda *p: progress.append(p)
+    )
+    assert model.batches == [4, 4, 2]
+    assert summary["written"] == 10 and summary["finished"]
+    assert summary["images_per_second"] > 0
+    assert progress[-1][:2] == (10, 10)
+    boxes = ds.load_box_array(4)
+    assert boxes.class_ids.tolist() == [0]
+    assert boxes.w[0] == pytest.approx(0.05)
+
+
+def test_only_unlabeled_keeps_existing_labels(tmp_path):
+    ds = make_dataset(tmp_path)
+    summary = PreAnnotator(ds, FakeModel(), batch_size=4, only_unlabeled=True).run()
+    assert summary["skipped"] == 1 and summary["written"] == 9
+    assert ds.load_box_array(3).class_ids.tolist() == [1]
+
+
+def test_only_unlabeled_keeps_background_images(tmp_path):
+    ds = make_dataset(tmp_path)
+    ds.save_labels("", idx=5)
+    summary = PreAnnotator(ds, FakeModel(), batch_size=4, only_unlabeled=True).run()
+    assert summary["skipped"] == 2 and summary["written"] == 8
+    with open(ds.label_path(5)) as f:
+        assert f.read() == ""
+
+
+def test_cancelled_run_resumes_from_checkpoint(tmp_path):
+    ds = make_dataset(tmp_path)
+    cancel = threading.Event()
+    first = FakeModel(on_call=lambda n: n == 2 and cancel.set())
+    summary = PreAnnotator(ds, first, model_id="m", batch_size=3).run(cancel=cancel)
+    assert not summary["finished"]
+    assert 0 < summary["written"] < 10
+
+    second = FakeModel()
+    summary = PreAnnotator(ds, second, model_id="m", batch_size=3).run()
+    assert summary["finished"]
+    assert summary["resumed_from"] > 0
+    assert sum(second.batches) == 10 - summary["resumed_from"]
+    assert all(len(ds.load_box_array(i)) == 1 for i in range(10))
@@ -0,0 +1,114 @@
+import os
+
+import cv2
+import numpy as np
+
+from prefetch import ImagePrefetcher, decode_image, fit_zoom, reduction_factor
+from yolo_dataset import YoloDataset
+
+
+def make_dataset(tmp_path, count=6, size=(40, 30)):
+    img_dir = tmp_path / "images"
+    lbl_dir = tmp_path / "labels"
+    img_dir.mkdir()
+    lbl_dir.mkdir()
+    for i in range(count):
+        img = np.full((size[1], size[0], 3), i * 10, dtype=np.uint8)
+        cv2.imwrite(str(img_dir / f"img_{i}.png"), img)
+        (lbl_dir / f"img_{i}.txt").write_text(f"0 0.5 0.5 0.{i + 1} 0.2\n")
+    return YoloDataset(str(img_dir), str(lbl_dir), ["a"])
+
+
+def test_get_returns_image_and_independent_boxes(tmp_path):
+    ds = make_dataset(tmp_path)
+    pf = ImagePrefetcher(ds)
+    try:
+        img, size, boxes = pf.get(2)
+        assert img.size == size == (40, 30)
+        assert boxes[0].width == 0.3
+        boxes[0].width = 0.9
+        _, _, again = pf.get(2)
+        assert again[0].width == 0.3
+        assert len(pf) == 1
+    finally:
+        pf.shutdown()
+
+
+def test_schedule_follows_direction(tmp_path):
+    ds = make_dataset(tmp_path)
+    pf = ImagePrefetcher(ds, radius=2)
+    try:
+        pf.schedule(3)
+        pf.schedule(2)
+        assert pf._direction == -1
+        pf._executor.shutdown(wait=True)
+        paths = {key[0] for key in pf._cache}
+        assert {ds.image_paths[i] for i in (0, 1, 3)} <= paths
+    finally:
+        pf.shutdown()
+
+
+def test_label_changes_are_picked_up(tmp_path):
+    ds = make_dataset(tmp_path)
+    pf = ImagePrefetcher(ds)
+    try:
+        pf.get(0)
+        path = ds.label_path(0)
+        with open(path, "w") as f:
+            f.write("0 0.5 0.5 0.5 0.5\n0 0.1 0.1 0.1 0.1\n")
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+        _, _, boxes = pf.get(0)
+        assert len(boxes) == 2
+    finally:
+        pf.shutdown()
+
+
+def test_byte_budget_evicts_oldest(tmp_path):
+    ds = make_dataset(tmp_path)
+    one_image = 40 * 30 * 3
+    pf = ImagePrefetcher(ds, max_bytes=one_image * 2)
+    try:
+        for i in range(4):
+            pf.get(i)
+        assert len(pf) == 2
+        assert pf.cached_bytes <= one_image * 2
+    finally:
+        pf.shutdown()
+
+
+def test_reduction_factor_keeps_a_pixel_per_display_pixel():
+    assert fit_zoom(4000, 3000, (1000, 1000)) == 0.25
+    assert fit_zoom(400, 300, (1000, 1000)) == 1.0
+    assert reduction_factor(4000, 3000, (1000, 1000)) == 4
+    assert reduction_factor(4000, 3000, (1500, 1000)) == 2
+    assert reduction_factor(4000, 3000, None) == 1
+    assert reduction_factor(0, 0, (1000, 1000)) == 1
+
+
+def test_decode_image_reduces_large_jpegs(tmp_path):
+    path = str(tmp_path / "big.jpg")
+    cv2.imwrite(path, np.full((1001, 1603, 3), 128, dtype=np.uint8))
+    img, full = decode_image(path, (1603, 1001), display_size=(400, 400))
+    assert reduction_factor(1603, 1001, (400, 400)) == 4
+    assert img.size == (401, 251)
+    assert full == (1603, 1001)
+    img, full = decode_image(path)
+    assert img.size == full == (1603, 1001)
+    # Stale manifest dimensions: the header gives the exact size
+    img, full = decode_image(path, (1600, 1000), display_size=(400, 400))
+    assert full == (1603, 1001)
+
+
+def test_schedule_follows_a_filtered_view(tmp_path):
+    from class_index import FilteredView
+
+    ds = make_dataset(tmp_path, count=10)
+    pf = ImagePrefetcher(ds, radius=2)
+    try:
+        pf.schedule(1, FilteredView("odd", [1, 3, 5, 7, 9]))
+        pf._executor.shutdown(wait=True)
+        paths = {key[0] for key in pf._cache}
+        assert paths == {ds.image_paths[i] for i in (3, 5)}
+    finally:
+        pf.shutdown()
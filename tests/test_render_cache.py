@@ -0,0 +1,64 @@
+import numpy as np
+from PIL import Image
+
+from render_cache import ImagePyramid, ViewportRenderer, FAST_FILTER
+
+
+def gradient_image(w=300, h=200):
+    x = np.linspace(0, 255, w, dtype=np.float32)
+    y = np.linspace(0, 255, h, dtype=np.float32)
+    arr = np.stack(np.broadcast_arrays(x[None, :], y[:, None], (x[None, :] + y[:, None]) / 2), axis=-1)
+    return Image.fromarray(arr.astype(np.uint8))
+
+
+def test_pyramid_selects_base_level_when_magnifying():
+    pyramid = ImagePyramid(gradient_image())
+    level, sx, sy = pyramid.select(2.0)
+    assert level.size == (300, 200)
+    assert (sx, sy) == (1.0, 1.0)
+    assert len(pyramid.levels) == 1
+
+
+def test_pyramid_selects_coarser_level_when_minifying():
+    pyramid = ImagePyramid(gradient_image(), min_size=16)
+    level, sx, _ = pyramid.select(0.3)
+    assert level.size == (150, 100)
+    assert sx == 0.5
+
+
+def test_render_matches_direct_resize():
+    img = gradient_image()
+    renderer = ViewportRenderer(img, tile_size=64)
+    zoom = 2.5
+    out = renderer.render(100, 80, 200, 150, zoom, fast=True)
+    assert out.size == (200, 150)
+    box = (100 / zoom, 80 / zoom, 300 / zoom, 230 / zoom)
+    expected = img.resize((200, 150), FAST_FILTER, box=box)
+    diff = np.abs(np.asarray(out, dtype=np.int16) - np.asarray(expected, dtype=np.int16))
+    assert diff.max() <= 2
+
+
+def test_render_is_clipped_to_zoomed_image():
+    renderer = ViewportRenderer(gradient_image(), tile_size=64)
+    out = renderer.render(500, 300, 400, 400, 2.0)
+    assert out.size == (100, 100)
+
+
+def test_panning_reuses_cached_tiles():
+    renderer = ViewportRenderer(gradient_image(), tile_size=64)
+    renderer.render(0, 0, 128, 128, 2.0)
+    assert len(renderer) == 4
+    renderer.render(64, 0, 128, 128, 2.0)
+    assert len(renderer) == 6
+    renderer.render(64, 0, 128, 128, 2.0, fast=True)
+    assert len(renderer) == 10
+
+
+def test_reduced_buffer_renders_in_logical_coordinates():
+    img = gradient_image(600, 400)
+    reduced = img.resize((300, 200), Image.LANCZOS)
+    renderer = ViewportRenderer(reduced, tile_size=64, size=(600, 400))
+    assert renderer.zoomed_size(0.5) == (300, 200)
+    out = renderer.render(0, 0, 300, 200, 0.5, fast=True)
+    diff = np.abs(np.asarray(out, dtype=np.int16) - np.asarray(reduced, dtype=np.int16))
+    assert diff.max() <= 2
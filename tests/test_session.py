@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+
+from session import NEEDS_FIX, REVIEWED, SessionStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = SessionStore(str(tmp_path / "session.sqlite"), flush_delay=0.05)
+    yield s
+    s.close()
+
+
+def test_positions_per_split_persist(tmp_path):
+    path = str(tmp_path / "session.sqlite")
+    s = SessionStore(path)
+    s.set_position("data.yaml", "train", 5)
+    s.set_position("data.yaml", "val", 2)
+    s.set_position("data.yaml", "train", 7)
+    assert s.get_position("data.yaml", "train") == 7
+    s.close()
+
+    s = SessionStore(path)
+    assert s.get_position("data.yaml", "train") == 7
+    assert s.get_position("data.yaml", "val") == 2
+    assert s.get_position("other.yaml", "train") is None
+    s.close()
+
+
+def test_writes_are_debounced_off_thread(store):
+    calls = []
+    real_commit = store._commit_pending
+
+    def commit():
+        calls.append(threading.current_thread().name)
+        real_commit()
+
+    store._commit_pending = commit
+    for i in range(50):
+        store.set_position("d.yaml", "train", i)
+    deadline = time.monotonic() + 2
+    while not calls and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert calls == ["annoq-session"]
+    row = store._query("SELECT idx FROM positions", ())
+    assert row == [(49,)]
+
+
+def test_status_and_next_queries(store):
+    names = [f"img_{i:02d}.jpg" for i in range(6)]
+    for name in names[:3]:
+        store.set_status("d.yaml", "train", name, REVIEWED)
+    store.set_status("d.yaml", "train", names[4], NEEDS_FIX)
+    store.set_status("d.yaml", "val", names[3], REVIEWED)
+    assert store.get_status("d.yaml", "train", names[4]) == NEEDS_FIX
+    assert store.next_unreviewed("d.yaml", "train", names) == 3
+    assert store.next_unreviewed("d.yaml", "train", names, 4) == 5
+    assert store.next_unreviewed("d.yaml", "train", names[:3]) is None
+    assert store.next_with_status("d.yaml", "train", names[0], NEEDS_FIX) == names[4]
+    assert store.next_with_status("d.yaml", "train", names[4], NEEDS_FIX) is None
+
+    store.set_status("d.yaml", "train", names[1], None)
+    assert store.get_status("d.yaml", "train", names[1]) is None
+    assert store.next_unreviewed("d.yaml", "train", names) == 1
+    assert store.statuses("d.yaml", "train") == {
+        names[0]: REVIEWED, names[2]: REVIEWED, names[4]: NEEDS_FIX
+    }
+    with pytest.raises(ValueError):
+        store.set_status("d.yaml", "train", names[0], "bogus")
+
+
+def test_next_unreviewed_uses_index(store):
+    plan = " ".join(
+        r[-1] for r in store._conn.execute(
+            "EXPLAIN QUERY PLAN SELECT image FROM status WHERE yaml = ? AND split = ? AND image >= ?"
+            " ORDER BY image",
+            ("a", "b", "c"),
+        )
+    )
+    assert "USING" in plan and "SCAN status" not in plan
+
+
+def test_settings(store):
+    assert store.get_setting("d.yaml", "last_class", 0) == 0
+    store.set_setting("d.yaml", "last_class", 3)
+    assert store.get_setting("d.yaml", "last_class") == "3"
+    store.flush()
+    store._settings.clear()
+    assert store.get_setting("d.yaml", "last_class") == "3"
+
+
+def test_commits_do_not_block_the_caller(store):
+    conn = store._write_conn
+    committing, release = threading.Event(), threading.Event()
+
+    class SlowCommit:
+        def execute(self, sql, *args):
+            if sql == "COMMIT":
+                committing.set()
+                release.wait(5)
+            return conn.execute(sql, *args)
+
+        def executemany(self, sql, rows):
+            return conn.executemany(sql, rows)
+
+    store._write_conn = SlowCommit()
+    try:
+        store.set_position("data.yaml", "train", 3)
+        assert committing.wait(5)
+        started = time.monotonic()
+        # Values being committed are still read back, and writes are buffered
+        assert store.get_position("data.yaml", "train") == 3
+        store.set_status("data.yaml", "train", "a.jpg", REVIEWED)
+        assert store.get_status("data.yaml", "train", "a.jpg") == REVIEWED
+        assert time.monotonic() - started < 1
+    finally:
+        release.set()
+        store.flush()
+        store._write_conn = conn
+    assert store.statuses("data.yaml", "train") == {"a.jpg": REVIEWED}
+    assert store.get_position("data.yaml", "train") == 3
+
@@ -0,0 +1,62 @@
+import random
+
+from bounding_box import BoundingBox, smallest_box_containing_point
+from spatial_index import BoxIndex
+
+IMG_W, IMG_H = 1280, 720
+
+
+def random_boxes(n, seed=0, max_size=0.2):
+    rng = random.Random(seed)
+    boxes = [
+        BoundingBox(0, rng.random(), rng.random(), rng.random() * max_size, rng.random() * max_size)
+        for _ in range(n)
+    ]
+    # A few boxes covering most of the image end up in the oversize list
+    boxes += [BoundingBox(0, 0.5, 0.5, 0.9, 0.9), BoundingBox(0, 0.5, 0.5, 0.9, 0.9)]
+    return boxes
+
+
+def assert_matches_linear_scan(index, boxes, seed=1):
+    rng = random.Random(seed)
+    for _ in range(300):
+        x, y = rng.uniform(-10, IMG_W + 10), rng.uniform(-10, IMG_H + 10)
+        assert index.smallest_containing(x, y) is smallest_box_containing_point(boxes, x, y, IMG_W, IMG_H)
+
+
+def test_smallest_containing_matches_linear_scan():
+    boxes = random_boxes(500)
+    assert_matches_linear_scan(BoxIndex(boxes, IMG_W, IMG_H), boxes)
+
+
+def test_index_stays_correct_after_edits():
+    boxes = random_boxes(300, seed=2)
+    index = BoxIndex(boxes, IMG_W, IMG_H)
+    rng = random.Random(3)
+    for box in rng.sample(boxes, 50):
+        box.x_center = rng.random()
+        box.width *= 1.5
+        index.update(box)
+    for box in rng.sample(boxes, 30):
+        boxes.remove(box)
+        index.remove(box)
+    new = BoundingBox(0, 0.3, 0.3, 0.01, 0.02)
+    boxes.append(new)
+    index.insert(new)
+    assert len(index) == len(boxes)
+    assert_matches_linear_scan(index, boxes, seed=4)
+
+
+def test_intersecting_matches_brute_force():
+    boxes = random_boxes(400, seed=5)
+    index = BoxIndex(boxes, IMG_W, IMG_H)
+    rng = random.Random(6)
+    for _ in range(50):
+        x1, y1 = rng.uniform(0, IMG_W), rng.uniform(0, IMG_H)
+        x2, y2 = x1 + rng.uniform(0, 300), y1 + rng.uniform(0, 300)
+        expected = []
+        for box in boxes:
+            bx1, by1, bx2, by2 = box.to_pixel_rect(IMG_W, IMG_H)
+            if bx1 <= x2 and x1 <= bx2 and by1 <= y2 and y1 <= by2:
+                expected.append(box)
+        assert index.intersecting(x1, y1, x2, y2) == expected
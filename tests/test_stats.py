@@ -0,0 +1,101 @@
+import os
+
+import stats
+from bounding_box import BoundingBox
+from yolo_dataset import YoloDataset
+
+
+def make_dataset(tmp_path):
+    img_dir = tmp_path / "images"
+    lbl_dir = tmp_path / "labels"
+    img_dir.mkdir()
+    lbl_dir.mkdir()
+    for i in range(6):
+        (img_dir / f"img_{i}.jpg").write_bytes(b"")
+    (lbl_dir / "img_0.txt").write_text("0 0.5 0.5 0.1 0.1\n1 0.5 0.5 0.1 0.1\n")
+    (lbl_dir / "img_1.txt").write_text("1 0.5 0.5 0.1 0.1\n7 0.1 0.1 0.1 0.1\n")
+    (lbl_dir / "img_2.txt").write_text("\n\n")
+    (lbl_dir / "img_3.txt").write_text("bad line\nx 0.1 0.1 0.1 0.1\n")
+    (lbl_dir / "img_4.txt").write_text("0 0.2 0.2 0.1 0.1\n")
+    # img_5 has no label file
+    return YoloDataset(str(img_dir), str(lbl_dir), ["cat", "dog"])
+
+
+def expected():
+    return {
+        "total_images": 6,
+        "class_counts": {"cat": 2, "dog": 2, "7": 1},
+        "background_images": 2,
+    }
+
+
+def test_compute_stats(tmp_path):
+    ds = make_dataset(tmp_path)
+    assert ds.compute_stats() == expected()
+
+
+def test_recompute_only_reads_changed_files(tmp_path):
+    ds = make_dataset(tmp_path)
+    ds.compute_stats()
+    # A fresh dataset object picks up the persisted per-file results
+    ds = YoloDataset(ds.image_dir, ds.label_dir, ds.class_names)
+    updates = list(ds.stats_engine().iter_compute())
+    assert updates[-1][:2] == (0, 0)
+    assert updates[-1][2] == expected()
+
+    path = os.path.join(ds.label_dir, "img_4.txt")
+    with open(path, "w") as f:
+        f.write("1 0.2 0.2 0.1 0.1\n1 0.3 0.3 0.1 0.1\n")
+    updates = list(ds.stats_engine().iter_compute())
+    assert updates[-1][:2] == (1, 1)
+    assert updates[-1][2]["class_counts"] == {"cat": 1, "dog": 4, "7": 1}
+
+    os.remove(path)
+    assert ds.compute_stats()["background_images"] == 3
+
+
+def test_save_labels_updates_aggregate(tmp_path):
+    ds = make_dataset(tmp_path)
+    ds.compute_stats()
+    ds.set_index(5)
+    ds.save_labels([BoundingBox(0, 0.5, 0.5, 0.2, 0.2)])
+    snapshot = ds.stats_engine().snapshot()
+    assert snapshot["class_counts"]["cat"] == 3
+    assert snapshot["background_images"] == 1
+
+
+def test_chunks_do_not_overwrite_a_newer_refresh(tmp_path, monkeypatch):
+    ds = make_dataset(tmp_path)
+    engine = ds.stats_engine()
+    path = os.path.join(ds.label_dir, "img_4.txt")
+    read_chunk = stats._read_chunk
+    calls = []
+
+    def save_while_reading(label_dir, items):
+        results = read_chunk(label_dir, items)
+        calls.append(len(items))
+        if len(calls) == 1:
+            # Saved and refreshed after the chunk read the old file
+            with open(path, "w") as f:
+                f.write("1 0.2 0.2 0.1 0.1\n1 0.3 0.3 0.1 0.1\n")
+            st = os.stat(path)
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+            engine.refresh(path)
+        return results
+
+    with monkeypatch.context() as m:
+        m.setattr(stats, "_read_chunk", save_while_reading)
+        assert engine.compute()["class_counts"] == {"cat": 1, "dog": 4, "7": 1}
+    # The cache on disk holds the refreshed result too
+    again = YoloDataset(ds.image_dir, ds.label_dir, ds.class_names)
+    assert list(again.stats_engine().iter_compute())[-1][:2] == (0, 0)
+
+
+def test_process_pool_path(tmp_path, monkeypatch):
+    ds = make_dataset(tmp_path)
+    monkeypatch.setattr(stats, "SERIAL_THRESHOLD", 0)
+    engine = stats.StatsEngine(ds, workers=2)
+    updates = list(engine.iter_compute(chunk_size=2))
+    assert len(updates) == 4
+    assert updates[-1][:2] == (5, 5)
+    assert updates[-1][2] == expected()
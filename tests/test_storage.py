@@ -0,0 +1,121 @@
+import io
+import os
+import tarfile
+import zipfile
+
+import cv2
+import numpy as np
+import pytest
+import yaml
+
+import export
+import storage
+from prefetch import decode_image
+from yaml_dataset_loader import YamlDatasetLoader
+from yolo_dataset import YoloDataset
+
+
+def image_bytes(seed, size=(64, 48)):
+    rng = np.random.default_rng(seed)
+    img = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    return cv2.imencode(".png", img)[1].tobytes()
+
+
+def dataset_files(prefix="", count=3):
+    files = {}
+    for i in range(count):
+        files[f"{prefix}images/img_{i}.png"] = image_bytes(i)
+        if i != 1:
+            files[f"{prefix}labels/img_{i}.txt"] = f"{i} 0.5 0.5 0.25 0.25\n".encode()
+    return files
+
+
+def write_archive(path, files):
+    if str(path).endswith(".zip"):
+        with zipfile.ZipFile(path, "w") as zf:
+            for name, data in files.items():
+                # Compress labels only, to cover both ways of reading members
+                method = zipfile.ZIP_DEFLATED if name.endswith(".txt") else zipfile.ZIP_STORED
+                zf.writestr(name, data, compress_type=method)
+    else:
+        with tarfile.open(path, "w") as tf:
+            for name, data in files.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = 1_700_000_000
+                tf.addfile(info, io.BytesIO(data))
+    return str(path)
+
+
+@pytest.fixture(params=["train.tar", "train.zip"])
+def archive(tmp_path, request):
+    return write_archive(tmp_path / request.param, dataset_files())
+
+
+def test_locate():
+    assert storage.locate("/nowhere/a.tar/images/a.png") is None
+
+
+def test_dataset_inside_archive(archive):
+    assert storage.locate(os.path.join(archive, "images", "img_0.png")) == (archive, "images/img_0.png")
+    assert storage.isdir(os.path.join(archive, "labels"))
+    ds = YoloDataset(os.path.join(archive, "images"), os.path.join(archive, "labels"), ["a", "b", "c"])
+    assert [os.path.basename(p) for p in ds.image_paths] == ["img_0.png", "img_1.png", "img_2.png"]
+    assert ds.image_size(0) == (64, 48)
+    assert [ds.has_label(i) for i in range(3)] == [True, False, True]
+    assert ds.load_box_array(2).class_ids.tolist() == [2]
+    image, full_size = decode_image(ds.image_paths[0])
+    assert image.size == full_size == (64, 48)
+    assert np.array_equal(np.asarray(image)[:, :, ::-1], cv2.imdecode(np.frombuffer(image_bytes(0), np.uint8), 1))
+    assert ds.compute_stats()["class_counts"] == {"a": 1, "b": 0, "c": 1}
+    assert ds.label_pack().boxes(0).class_ids.tolist() == [0]
+
+
+def test_edits_go_to_overlay(archive):
+    before = os.stat(archive)
+    ds = YoloDataset(os.path.join(archive, "images"), os.path.join(archive, "labels"), ["a", "b", "c"])
+    boxes = ds.load_box_array(0)
+    boxes.class_ids[:] = 1
+    ds.save_labels(boxes.to_boxes(ds.class_names), idx=0)
+    ds.save_labels(boxes.to_boxes(ds.class_names), idx=1)
+    ds.flush_labels()
+    assert (os.stat(archive).st_size, os.stat(archive).st_mtime_ns) == (before.st_size, before.st_mtime_ns)
+    overlay = archive + storage.OVERLAY_SUFFIX
+    assert sorted(os.listdir(os.path.join(overlay, "labels"))) == ["img_0.txt", "img_1.txt"]
+
+    reopened = YoloDataset(os.path.join(archive, "images"), os.path.join(archive, "labels"), ["a", "b", "c"])
+    assert [reopened.has_label(i) for i in range(3)] == [True, True, True]
+    assert reopened.load_box_array(0).class_ids.tolist() == [1]
+    assert reopened.load_box_array(2).class_ids.tolist() == [2]
+
+
+def test_index_is_cached(archive, monkeypatch):
+    storage.Archive.open(archive)
+    storage.Archive._registry.clear()
+
+    def fail(path):
+        raise AssertionError("the saved index should be used")
+
+    monkeypatch.setattr(storage, "_index_tar", fail)
+    monkeypatch.setattr(storage, "_index_zip", fail)
+    assert storage.Archive.open(archive).stat("labels/img_0.txt")[0] == len(b"0 0.5 0.5 0.25 0.25\n")
+    assert sorted(storage.Archive.open(archive).listdir("images")) == ["img_0.png", "img_1.png", "img_2.png"]
+
+
+def test_yaml_with_flat_shard_and_export(tmp_path):
+    files = {}
+    for i in range(2):
+        files[f"{i:06d}.png"] = image_bytes(i)
+        files[f"{i:06d}.txt"] = b"0 0.5 0.5 0.5 0.5\n"
+    write_archive(tmp_path / "shard-000.tar", files)
+    (tmp_path / "data.yaml").write_text(yaml.safe_dump({"names": ["a"], "train": "shard-000.tar"}))
+    loader = YamlDatasetLoader(str(tmp_path / "data.yaml"), verbose=False)
+    paths = loader.get_paths("train")
+    ds = YoloDataset(paths["images"], paths["labels"], loader.get_class_names())
+    assert ds.total_images() == 2
+    assert ds.load_box_array(1).class_ids.tolist() == [0]
+
+    summary = export.export_dataset(ds, str(tmp_path / "out"), ds.class_names, mode="hardlink")
+    assert (summary["images"], summary["labels"], summary["linked"]) == (2, 2, 0)
+    assert (tmp_path / "out" / "images" / "000001.png").read_bytes() == image_bytes(1)
+    assert (tmp_path / "out" / "labels" / "000000.txt").read_text() == "0 0.5 0.5 0.5 0.5\n"
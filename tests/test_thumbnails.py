@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import thumbnails
+from box_array import BoxArray
+from bounding_box import class_color
+from filmstrip import visible_cells
+from thumbnails import ThumbnailCache, ThumbnailLoader, render_thumbnail, thumbnail_key
+from yolo_dataset import YoloDataset
+
+
+def make_dataset(tmp_path, count=4, size=(400, 200)):
+    img_dir = tmp_path / "images"
+    lbl_dir = tmp_path / "labels"
+    img_dir.mkdir()
+    lbl_dir.mkdir()
+    for i in range(count):
+        img = np.full((size[1], size[0], 3), 20 * i, dtype=np.uint8)
+        cv2.imwrite(str(img_dir / f"img_{i}.jpg"), img)
+        (lbl_dir / f"img_{i}.txt").write_text("1 0.5 0.5 0.5 0.5\n")
+    return YoloDataset(str(img_dir), str(lbl_dir), ["a", "b"])
+
+
+def wait_ready(loader, indices, timeout=10):
+    deadline = time.monotonic() + timeout
+    ready = set()
+    while not set(indices) <= ready and time.monotonic() < deadline:
+        ready.update(loader.take_ready())
+        time.sleep(0.01)
+    return ready
+
+
+def test_render_thumbnail_fits_and_outlines_boxes(tmp_path):
+    ds = make_dataset(tmp_path, count=1)
+    boxes = ds.load_box_array(0)
+    thumb = render_thumbnail(ds.image_paths[0], boxes, ds.image_size(0), size=64)
+    assert thumb.size == (64, 32)
+    color = Image.new("RGB", (1, 1), class_color(1)).getpixel((0, 0))
+    assert thumb.getpixel((16, 16)) == color
+    assert thumb.getpixel((32, 16)) == (0, 0, 0)
+
+
+def test_key_depends_on_mtime_and_boxes():
+    boxes = BoxArray.from_yolo_text("0 0.5 0.5 0.2 0.2\n")
+    moved = BoxArray.from_yolo_text("0 0.6 0.5 0.2 0.2\n")
+    key = thumbnail_key("a.jpg", 1, 10, boxes)
+    assert key == thumbnail_key("a.jpg", 1, 10, boxes)
+    assert key != thumbnail_key("a.jpg", 2, 10, boxes)
+    assert key != thumbnail_key("a.jpg", 1, 10, moved)
+    assert key != thumbnail_key("a.jpg", 1, 10, boxes, size=64)
+
+
+def test_cache_round_trip_and_rescan(tmp_path):
+    cache = ThumbnailCache(str(tmp_path / "thumbs"))
+    assert cache.get("ab" * 20) is None
+    cache.put("ab" * 20, Image.new("RGB", (8, 8), (200, 0, 0)))
+    assert cache.get("ab" * 20).size == (8, 8)
+    reopened = ThumbnailCache(str(tmp_path / "thumbs"))
+    assert "ab" * 20 in reopened
+    assert reopened.cached_bytes == cache.cached_bytes > 0
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = ThumbnailCache(str(tmp_path / "thumbs"))
+    image = Image.new("RGB", (16, 16), (0, 0, 200))
+    keys = [f"{i:02d}" * 20 for i in range(4)]
+    for key in keys[:3]:
+        cache.put(key, image)
+    cache.max_bytes = cache.cached_bytes
+    cache.get(keys[0])
+    cache.put(keys[3], image)
+    assert keys[1] not in cache
+    assert not os.path.exists(cache.path(keys[1]))
+    assert all(k in cache for k in (keys[0], keys[2], keys[3]))
+    assert cache.cached_bytes <= cache.max_bytes
+
+
+def test_loader_renders_once_then_hits_disk_cache(tmp_path, monkeypatch):
+    ds = make_dataset(tmp_path)
+    cache = ThumbnailCache(str(tmp_path / "thumbs"))
+    loader = ThumbnailLoader(ds, cache, size=32)
+    try:
+        loader.request([2, 0])
+        assert wait_ready(loader, [0, 2]) == {0, 2}
+        assert loader.get(2).size == (32, 16)
+        assert loader.get(1) is None
+    finally:
+        loader.shutdown()
+    assert len(cache) == 2
+
+    def fail(*args, **kwargs):
+        raise AssertionError("should come from the cache")
+
+    monkeypatch.setattr(thumbnails, "render_thumbnail", fail)
+    loader = ThumbnailLoader(ds, cache, size=32)
+    try:
+        loader.request([0])
+        assert wait_ready(loader, [0]) == {0}
+        assert loader.get(0).size == (32, 16)
+    finally:
+        loader.shutdown()
+
+
+def test_edited_labels_change_the_thumbnail(tmp_path):
+    ds = make_dataset(tmp_path, count=1)
+    cache = ThumbnailCache(str(tmp_path / "thumbs"))
+    loader = ThumbnailLoader(ds, cache, size=32)
+    try:
+        loader.request([0])
+        wait_ready(loader, [0])
+        ds.save_labels("", background=True)
+        ds.flush_labels()
+        # Forgotten once the write is in place, not before
+        assert loader.take_changed() == [0]
+        assert loader.get(0) is None
+        loader.request([0])
+        wait_ready(loader, [0])
+        assert len(cache) == 2
+    finally:
+        loader.shutdown()
+
+
+def test_request_cancels_queued_thumbnails(tmp_path, monkeypatch):
+    ds = make_dataset(tmp_path, count=4)
+    release = threading.Event()
+    render = thumbnails.render_thumbnail
+
+    def slow(*args, **kwargs):
+        release.wait(10)
+        return render(*args, **kwargs)
+
+    monkeypatch.setattr(thumbnails, "render_thumbnail", slow)
+    loader = ThumbnailLoader(ds, ThumbnailCache(str(tmp_path / "thumbs")), size=32, workers=1)
+    try:
+        loader.request([0, 1, 2])
+        # 0 is rendering, 1 and 2 are queued and get cancelled
+        thread = threading.Thread(target=loader.request, args=([3],))
+        thread.start()
+        thread.join(5)
+        assert not thread.is_alive()
+        release.set()
+        assert wait_ready(loader, [0, 3]) == {0, 3}
+        assert loader.get(1) is None and loader.get(2) is None
+    finally:
+        release.set()
+        loader.shutdown()
+
+
+def test_unreadable_image_gets_placeholder(tmp_path):
+    ds = make_dataset(tmp_path, count=1)
+    with open(ds.image_paths[0], "wb") as f:
+        f.write(b"not an image")
+    cache = ThumbnailCache(str(tmp_path / "thumbs"))
+    loader = ThumbnailLoader(ds, cache, size=32)
+    try:
+        loader.request([0])
+        wait_ready(loader, [0])
+        assert loader.get(0).size == (32, 32)
+        assert len(cache) == 0
+    finally:
+        loader.shutdown()
+
+
+def test_visible_cells():
+    # 2 columns of 100px cells, 250px viewport scrolled to 150px
+    assert visible_cells(150, 250, 100, 2, 1000, margin_rows=0) == range(2, 8)
+    assert visible_cells(150, 250, 100, 2, 1000, margin_rows=1) == range(0, 10)
+    assert visible_cells(0, 250, 100, 2, 5, margin_rows=1) == range(0, 5)
+    assert visible_cells(99_999 * 100, 250, 100, 1, 100_000) == range(99_997, 100_000)
+    assert visible_cells(0, 0, 100, 2, 10) == range(0)
@@ -0,0 +1,66 @@
+import json
+import threading
+
+import annoq
+import tracing
+from tracing import Tracer
+
+
+def make_yaml_dataset(tmp_path):
+    (tmp_path / "images").mkdir()
+    (tmp_path / "labels").mkdir()
+    for i in range(3):
+        (tmp_path / "images" / f"img_{i}.jpg").write_bytes(b"jpg")
+        (tmp_path / "labels" / f"img_{i}.txt").write_text("0 0.5 0.5 0.2 0.2\n")
+    yaml_path = tmp_path / "data.yaml"
+    yaml_path.write_text("names: [cat]\ntrain: images\n")
+    return str(yaml_path)
+
+
+def test_spans_are_recorded_only_when_enabled():
+    tracer = Tracer()
+    with tracer.span("load"):
+        pass
+    assert tracer.summary() == {}
+    tracer.enable(memory=False)
+    for ms in (1, 2, 3, 4, 100):
+        tracer.record("load", 0.0, ms / 1000)
+    with tracer.span("save", idx=3):
+        pass
+    summary = tracer.summary()
+    assert summary["load"]["count"] == 5
+    assert summary["load"]["p50_ms"] == 3
+    assert summary["load"]["max_ms"] == 100
+    assert summary["save"]["count"] == 1
+
+
+def test_chrome_trace_has_complete_events_per_thread():
+    tracer = Tracer()
+    tracer.enable(memory=True)
+    try:
+        tracer.record("decode", 1.0, 1.5)
+        worker = threading.Thread(target=tracer.record, args=("redraw", 2.0, 2.25), name="worker")
+        worker.start()
+        worker.join()
+        assert tracer.sample_memory() is not None
+        doc = json.loads(json.dumps(tracer.chrome_trace()))
+    finally:
+        tracer.disable()
+    spans = {e["name"]: e for e in doc["traceEvents"] if e["ph"] == "X"}
+    assert spans["decode"]["dur"] == 500_000
+    assert spans["decode"]["tid"] != spans["redraw"]["tid"]
+    names = {e["args"]["name"] for e in doc["traceEvents"] if e["ph"] == "M"}
+    assert "worker" in names
+    assert any(e["ph"] == "C" for e in doc["traceEvents"])
+    assert doc["otherData"]["peak_memory_bytes"] > 0
+
+
+def test_cli_trace_flag_writes_a_chrome_trace(tmp_path, capsys):
+    yaml_path = make_yaml_dataset(tmp_path)
+    trace_path = tmp_path / "trace.json"
+    assert annoq.main(["--trace", str(trace_path), "export", "--yaml", yaml_path, "--split", "train",
+                       "--out", str(tmp_path / "out"), "--labeled"]) == 0
+    assert not tracing.TRACER.enabled
+    doc = json.loads(trace_path.read_text())
+    assert isinstance(doc["traceEvents"], list)
+    assert "summary" in doc["otherData"]
@@ -0,0 +1,108 @@
+import os
+
+import cv2
+import numpy as np
+
+import validation
+from validation import box_problems, check_image_file, check_label_file, validate_split
+from yolo_dataset import YoloDataset
+
+
+def make_dataset(tmp_path, labels):
+    img_dir = tmp_path / "images"
+    lbl_dir = tmp_path / "labels"
+    img_dir.mkdir()
+    lbl_dir.mkdir()
+    for i, text in enumerate(labels):
+        cv2.imwrite(str(img_dir / f"img_{i}.jpg"), np.full((100, 200, 3), 50 * i, dtype=np.uint8))
+        if text is not None:
+            (lbl_dir / f"img_{i}.txt").write_text(text)
+    return YoloDataset(str(img_dir), str(lbl_dir), ["a", "b"])
+
+
+def kinds(findings):
+    return sorted((f["kind"], f["index"], f["line"]) for f in findings)
+
+
+def test_truncated_and_unreadable_images(tmp_path):
+    path = tmp_path / "a.jpg"
+    cv2.imwrite(str(path), np.random.default_rng(0).integers(0, 256, (256, 256, 3), dtype=np.uint8))
+    assert check_image_file(str(path)) == []
+    data = path.read_bytes()
+    path.write_bytes(data[: len(data) // 2])
+    assert [p[0] for p in check_image_file(str(path))] == ["truncated_image"]
+    path.write_bytes(b"garbage")
+    assert [p[0] for p in check_image_file(str(path))] == ["unreadable_image"]
+
+
+def test_box_problems_degenerate_duplicate_and_overlapping():
+    coords = [
+        [0.5, 0.5, 0.2, 0.2],
+        [0.5, 0.5, 0.2, 0.2],  # exact duplicate of line 1
+        [0.5, 0.5, 0.2, 0.19],  # IoU 0.95 with line 1
+        [0.5, 0.5, 0.2, 0.2],  # other class
+        [0.3, 0.3, 0.0, 0.1],
+        [0.3, 0.3, 0.004, 0.1],  # under a pixel wide at 200 px
+    ]
+    problems = box_problems([1, 2, 3, 4, 5, 6], [0, 0, 0, 1, 0, 0], coords, image_size=(200, 100))
+    assert sorted((kind, line) for kind, line, _ in problems) == [
+        ("degenerate_box", 5),
+        ("degenerate_box", 6),
+        ("duplicate_box", 2),
+        ("overlapping_box", 3),
+    ]
+    assert box_problems([], [], np.empty((0, 4))) == []
+
+
+def test_box_problems_compares_in_blocks():
+    rng = np.random.default_rng(0)
+    n = 20_000
+    coords = np.column_stack((rng.random(n), rng.random(n), np.full(n, 0.01), np.full(n, 0.01)))
+    coords[1::2] = coords[::2]
+    class_ids = np.repeat(np.arange(n // 2) % 3, 2)
+    lines = np.arange(1, n + 1)
+    problems = box_problems(lines, class_ids, coords)
+    duplicates = sorted(line for kind, line, _ in problems if kind == "duplicate_box")
+    assert duplicates == lines[1::2].tolist()
+    # Small blocks give the same findings
+    few = coords[:200]
+    assert sorted(box_problems(lines[:200], class_ids[:200], few, block_cells=16)) == sorted(
+        box_problems(lines[:200], class_ids[:200], few)
+    )
+
+
+def test_check_label_file_reports_line_problems(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("0 0.5 0.5 0.2 0.2\nbad\n3 0.5 0.5 0.2 0.2\n0 0.5 0.5 0.2 0.2\n0 1.5 0.5 0 0.2\n")
+    found = [(kind, line) for kind, line, _ in check_label_file(str(path), 2)]
+    assert found == [
+        ("malformed_line", 2),
+        ("bad_class_id", 3),
+        ("duplicate_box", 4),
+        ("coords_out_of_range", 5),
+        ("degenerate_box", 5),
+    ]
+
+
+def test_validate_split_is_incremental(tmp_path, monkeypatch):
+    ds = make_dataset(tmp_path, ["0 0.5 0.5 0.2 0.2\n", "0 0.5 0.5 0.2 0.2\n0 0.5 0.5 0.2 0.2\n", None])
+    (tmp_path / "labels" / "orphan.txt").write_text("")
+    first = kinds(validate_split(ds))
+    assert first == [("duplicate_box", 1, 2), ("missing_label", 2, None), ("orphan_label", None, None)]
+
+    checked = []
+    original = validation._check_item
+
+    def counting(image, *args):
+        checked.append(os.path.basename(image))
+        return original(image, *args)
+
+    monkeypatch.setattr(validation, "_check_item", counting)
+    assert kinds(validate_split(ds)) == first
+    assert checked == []
+
+    label = tmp_path / "labels" / "img_1.txt"
+    label.write_text("0 0.5 0.5 0.2 0.2\n")
+    os.utime(label, ns=(1, 1))
+    assert kinds(validate_split(ds)) == [("missing_label", 2, None), ("orphan_label", None, None)]
+    assert checked == ["img_1.jpg"]
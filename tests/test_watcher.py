@@ -0,0 +1,222 @@
+import os
+import time
+
+import pytest
+from PIL import Image
+
+import manifest
+import watcher
+from watcher import DatasetWatcher
+from yolo_dataset import YoloDataset
+
+
+def make_split(tmp_path, count=6):
+    img_dir = tmp_path / "images"
+    lbl_dir = tmp_path / "labels"
+    img_dir.mkdir()
+    lbl_dir.mkdir()
+    for i in range(0, 2 * count, 2):
+        add_image(img_dir, f"img_{i:03d}.png")
+        (lbl_dir / f"img_{i:03d}.txt").write_text(f"{i % 3} 0.5 0.5 0.1 0.1\n")
+    return img_dir, lbl_dir
+
+
+def add_image(img_dir, name, size=(20, 10)):
+    Image.new("RGB", size).save(img_dir / name)
+
+
+def open_split(img_dir, lbl_dir):
+    return YoloDataset(str(img_dir), str(lbl_dir), ["a", "b", "c"])
+
+
+def image_changes(img_dir, names):
+    changes = {}
+    for name in names:
+        path = img_dir / name
+        changes[name] = (path.stat().st_size, path.stat().st_mtime_ns) if path.exists() else None
+    return changes
+
+
+def same_as_fresh(ds, img_dir, lbl_dir):
+    fresh = open_split(img_dir, lbl_dir)
+    assert ds.image_paths == fresh.image_paths
+    assert ds.label_paths == fresh.label_paths
+    for column in manifest.COLUMNS:
+        assert getattr(ds.manifest, column) == getattr(fresh.manifest, column), column
+    return fresh
+
+
+@pytest.mark.parametrize("threshold", [manifest.REBUILD_THRESHOLD, 0])
+def test_apply_changes_keeps_position_and_caches(tmp_path, monkeypatch, threshold):
+    monkeypatch.setattr(manifest, "REBUILD_THRESHOLD", threshold)
+    img_dir, lbl_dir = make_split(tmp_path)
+    ds = open_split(img_dir, lbl_dir)
+    pack = ds.label_pack()
+    ds.compute_stats()
+    ds.set_index(2)
+    assert os.path.basename(ds.current_image_path()) == "img_004.png"
+
+    add_image(img_dir, "img_001.png", (30, 40))
+    (lbl_dir / "img_001.txt").write_text("1 0.5 0.5 0.2 0.2\n1 0.1 0.1 0.1 0.1\n")
+    add_image(img_dir, "img_099.png")
+    os.remove(img_dir / "img_000.png")
+    summary = ds.apply_changes(image_changes(img_dir, ["img_001.png", "img_099.png", "img_000.png"]))
+    assert (summary["added"], summary["removed"]) == (2, 1)
+    assert os.path.basename(ds.current_image_path()) == "img_004.png"
+    assert ds.image_size(0) == (30, 40)
+
+    fresh = same_as_fresh(ds, img_dir, lbl_dir)
+    for idx in range(ds.total_images()):
+        assert pack.boxes(idx).to_yolo_text() == fresh.label_pack().boxes(idx).to_yolo_text()
+    assert ds.compute_stats() == fresh.compute_stats()
+    assert ds.class_index().images_with_class(1).tolist() == [0, 2, 5]
+
+
+def test_removing_current_image_moves_to_next(tmp_path):
+    img_dir, lbl_dir = make_split(tmp_path)
+    ds = open_split(img_dir, lbl_dir)
+    ds.set_index(5)
+    os.remove(img_dir / "img_010.png")
+    ds.apply_changes(image_changes(img_dir, ["img_010.png"]))
+    assert ds.current_index() == 4
+    ds.set_index(1)
+    os.remove(img_dir / "img_002.png")
+    ds.apply_changes(image_changes(img_dir, ["img_002.png"]))
+    assert os.path.basename(ds.current_image_path()) == "img_004.png"
+
+
+def test_external_label_changes_are_reported_and_own_saves_are_not(tmp_path):
+    img_dir, lbl_dir = make_split(tmp_path)
+    ds = open_split(img_dir, lbl_dir)
+    ds.label_pack()
+    ds.save_labels("2 0.5 0.5 0.3 0.3\n", idx=0)
+    (lbl_dir / "img_002.txt").write_text("0 0.1 0.1 0.1 0.1\n0 0.2 0.2 0.1 0.1\n")
+    os.remove(lbl_dir / "img_004.txt")
+    summary = ds.apply_changes(labels=["img_000.txt", "img_002.txt", "img_004.txt"])
+    assert summary["labels"] == ["img_002.txt", "img_004.txt"]
+    assert ds.load_box_array(1).class_ids.tolist() == [0, 0]
+    assert [ds.has_label(i) for i in range(3)] == [True, True, False]
+    assert ds.written_stamp(ds.label_path(0)) == ds.label_stamp(0)
+
+
+def test_poll_finds_added_removed_and_rewritten_files(tmp_path):
+    img_dir, lbl_dir = make_split(tmp_path)
+    ds = open_split(img_dir, lbl_dir)
+    w = DatasetWatcher(ds, use_inotify=False)
+    w.poll()
+    assert w.take_changes() == ({}, set())
+
+    add_image(img_dir, "img_003.png")
+    os.remove(img_dir / "img_006.png")
+    (lbl_dir / "img_002.txt").write_text("1 0.5 0.5 0.5 0.5\n")
+    (lbl_dir / "img_003.txt").write_text("")
+    for d in (img_dir, lbl_dir):
+        st = os.stat(d)
+        os.utime(d, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    w.poll()
+    # The new image is reported once its stat stays the same
+    w.poll()
+    images, labels = w.take_changes()
+    assert images == image_changes(img_dir, ["img_003.png", "img_006.png"])
+    assert labels == {"img_002.txt", "img_003.txt"}
+
+
+def test_poll_waits_for_new_images_to_settle(tmp_path):
+    img_dir, lbl_dir = make_split(tmp_path)
+    w = DatasetWatcher(open_split(img_dir, lbl_dir), interval=60, use_inotify=False)
+    w.poll()
+    add_image(img_dir, "img_003.png")
+    data = (img_dir / "img_003.png").read_bytes()
+    (img_dir / "img_003.png").write_bytes(data[:10])
+    w.poll()
+    assert w.take_changes() == ({}, set())
+    # Filling the file in does not move the directory mtime
+    (img_dir / "img_003.png").write_bytes(data)
+    w.poll()
+    assert w.take_changes() == ({}, set())
+    w.poll()
+    assert w.take_changes() == (image_changes(img_dir, ["img_003.png"]), set())
+    w.poll()
+    assert w.take_changes() == ({}, set())
+
+
+def test_poll_skips_unchanged_directories(tmp_path, monkeypatch):
+    img_dir, lbl_dir = make_split(tmp_path)
+    w = DatasetWatcher(open_split(img_dir, lbl_dir), use_inotify=False)
+    w.poll()
+
+    def fail(path):
+        raise AssertionError("unchanged directories should not be listed")
+
+    monkeypatch.setattr(watcher, "_list_names", fail)
+    monkeypatch.setattr(watcher, "_list_labels", fail)
+    w.poll()
+
+
+def test_poll_takes_own_label_writes_without_listing(tmp_path, monkeypatch):
+    img_dir, lbl_dir = make_split(tmp_path)
+    ds = open_split(img_dir, lbl_dir)
+    w = DatasetWatcher(ds, use_inotify=False)
+    w.poll()
+    before = os.stat(lbl_dir).st_mtime_ns
+    time.sleep(0.05)
+    ds.save_labels("1 0.5 0.5 0.2 0.2\n", idx=0)
+    ds.save_labels("1 0.5 0.5 0.2 0.2\n", idx=1, background=True)
+    ds.flush_labels()
+    assert ds.written_dir_mtime() == os.stat(lbl_dir).st_mtime_ns != before
+
+    def fail(path):
+        raise AssertionError("own writes should not list the label directory")
+
+    with monkeypatch.context() as m:
+        m.setattr(watcher, "_list_labels", fail)
+        w.poll()
+    assert w.take_changes() == ({}, set())
+
+    # Another program's write is still found, and ours are not reported again
+    (lbl_dir / "img_004.txt").write_text("0 0.5 0.5 0.5 0.5\n")
+    st = os.stat(lbl_dir)
+    os.utime(lbl_dir, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    w.poll()
+    assert w.take_changes() == ({}, {"img_004.txt"})
+
+
+def wait_for_changes(w, img_dir, expected_images, expected_labels, timeout=5):
+    # Until the expected images are reported with their final stat
+    images, labels = {}, set()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        new_images, new_labels = w.take_changes()
+        images.update(new_images)
+        labels |= new_labels
+        settled = all(images.get(n) == image_changes(img_dir, [n])[n] for n in expected_images)
+        if settled and labels >= expected_labels:
+            break
+        time.sleep(0.02)
+    return images, labels
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_watcher_thread(tmp_path, use_inotify):
+    img_dir, lbl_dir = make_split(tmp_path)
+    ds = open_split(img_dir, lbl_dir)
+    w = DatasetWatcher(ds, interval=0.05, use_inotify=use_inotify)
+    w.start()
+    try:
+        if use_inotify and w.mode != "inotify":
+            pytest.skip("inotify is not available")
+        time.sleep(0.1)
+        add_image(img_dir, "img_005.png")
+        ds.save_labels("0 0.5 0.5 0.1 0.1\n", idx=1)
+        # Polling does not report our own save unless it lists the
+        # directory before the save is recorded
+        own = {"img_002.txt"} if use_inotify else set()
+        images, labels = wait_for_changes(w, img_dir, {"img_005.png"}, own)
+    finally:
+        w.stop()
+    assert images == image_changes(img_dir, ["img_005.png"])
+    assert own <= labels <= {"img_002.txt"}
+    summary = ds.apply_changes(images, labels)
+    assert (summary["added"], summary["removed"], summary["labels"]) == (1, 0, [])
+    assert summary["rows"].tolist() == [0, 1, 2, -1, 3, 4, 5]
+    assert os.path.basename(ds.image_paths[3]) == "img_005.png"
@@ -0,0 +1,300 @@
+"""Thumbnails of a split's images with their boxes drawn on top.
+
+Thumbnails are rendered on a thread pool from a reduced-resolution decode
+(see :func:`prefetch.decode_image`) and kept in an on-disk cache shared by
+all datasets (``thumbnails/`` under the cache directory). Cache files are
+content addressed: the key is a digest of the image path, its mtime and
+size and the boxes drawn, so an edited label or a replaced image simply
+misses and stale entries age out. The cache is bounded by ``max_bytes``
+and evicts the least recently used files, using the file mtime (touched
+on every hit) as the access time so the order survives restarts.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import cache
+import storage
+from prefetch import decode_image
+from tracing import traced
+
+THUMB_SIZE = 128
+THUMB_VERSION = 1
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Decoded thumbnails kept in memory per loader
+MEMORY_ITEMS = 512
+JPEG_QUALITY = 85
+PLACEHOLDER_COLOR = (64, 64, 64)
+
+
+def thumbnail_key(path, mtime_ns, file_size, boxes, size=THUMB_SIZE):
+    """Cache key of the thumbnail of ``path`` with ``boxes`` drawn on it."""
+    digest = hashlib.sha1()
+    digest.update(f"{THUMB_VERSION}:{size}:{os.path.abspath(path)}:{mtime_ns}:{file_size}".encode("utf-8"))
+    digest.update(boxes.class_ids.astype(np.int32).tobytes())
+    for column in (boxes.xc, boxes.yc, boxes.w, boxes.h):
+        # Same key whether the boxes come from the pack or parsed text
+        digest.update(column.astype(np.float32).tobytes())
+    return digest.hexdigest()
+
+
+@traced("render_thumbnail")
+def render_thumbnail(path, boxes, image_size=(0, 0), size=THUMB_SIZE):
+    """Decode ``path`` to fit in ``size`` x ``size`` and outline ``boxes``."""
+    image, _ = decode_image(path, image_size, (size, size))
+    image.thumbnail((size, size), Image.BILINEAR)
+    draw = ImageDraw.Draw(image)
+    w, h = image.size
+    for (x1, y1, x2, y2), color in zip(boxes.to_pixel_rects(w, h).tolist(), boxes.colors()):
+        draw.rectangle((x1, y1, max(x1, x2 - 1), max(y1, y2 - 1)), outline=color)
+    return image
+
+
+def placeholder(size=THUMB_SIZE):
+    """Thumbnail shown for images that cannot be read."""
+    image = Image.new("RGB", (size, size), PLACEHOLDER_COLOR)
+    draw = ImageDraw.Draw(image)
+    draw.line((0, 0, size - 1, size - 1), fill="red")
+    draw.line((0, size - 1, size - 1, 0), fill="red")
+    return image
+
+
+class ThumbnailCache:
+    """Size-bounded directory of JPEG thumbnails; see the module docstring.
+
+    Files are spread over 256 sub-directories by the first two characters
+    of their key. The directory is scanned on first use to learn what is
+    already cached. Safe to use from several threads.
+    """
+
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root or os.path.join(cache.CACHE_ROOT, "thumbnails")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # key -> file size, least recently used first
+        self._files = None
+        self._bytes = 0
+
+    @property
+    def cached_bytes(self):
+        with self._lock:
+            self._scan()
+            return self._bytes
+
+    def __len__(self):
+        with self._lock:
+            self._scan()
+            return len(self._files)
+
+    def __contains__(self, key):
+        with self._lock:
+            self._scan()
+            return key in self._files
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key + ".jpg")
+
+    def get(self, key):
+        """Return the cached thumbnail for ``key``, or ``None``."""
+        with self._lock:
+            self._scan()
+            if key not in self._files:
+                return None
+            self._files.move_to_end(key)
+        path = self.path(key)
+        try:
+            with Image.open(path) as image:
+                image.load()
+                image = image.convert("RGB")
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._bytes -= self._files.pop(key, 0)
+            return None
+        return image
+
+    def put(self, key, image):
+        """Store ``image`` under ``key`` and evict old entries if needed."""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        image.save(tmp, "JPEG", quality=JPEG_QUALITY)
+        os.replace(tmp, path)
+        nbytes = os.path.getsize(path)
+        with self._lock:
+            self._scan()
+            self._bytes += nbytes - self._files.pop(key, 0)
+            self._files[key] = nbytes
+            evicted = []
+            while self._bytes > self.max_bytes and len(self._files) > 1:
+                old, old_bytes = self._files.popitem(last=False)
+                self._bytes -= old_bytes
+                evicted.append(old)
+        for old in evicted:
+            try:
+                os.remove(self.path(old))
+            except OSError:
+                pass
+
+    def _scan(self):
+        # Called with the lock held
+        if self._files is not None:
+            return
+        found = []
+        try:
+            subdirs = list(os.scandir(self.root))
+        except OSError:
+            subdirs = []
+        for subdir in subdirs:
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if not entry.name.endswith(".jpg"):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                found.append((st.st_mtime_ns, entry.name[:-4], st.st_size))
+        found.sort()
+        self._files = OrderedDict((key, nbytes) for _, key, nbytes in found)
+        self._bytes = sum(self._files.values())
+
+
+class ThumbnailLoader:
+    """Produce the thumbnails of a dataset's images on a thread pool.
+
+    :meth:`request` queues the images currently wanted, in priority order,
+    and cancels queued work for images no longer wanted; :meth:`take_ready`
+    returns the indices finished since the last call and :meth:`get` their
+    thumbnails. Recent thumbnails are kept in memory, others come from the
+    :class:`ThumbnailCache` or are rendered.
+    """
+
+    def __init__(self, dataset, cache, size=THUMB_SIZE, workers=2, max_items=MEMORY_ITEMS):
+        self.dataset = dataset
+        self.cache = cache
+        self.size = size
+        self.max_items = max_items
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="annoq-thumbs")
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._pending = {}
+        self._ready = deque()
+        # Bumped by clear(); results of older requests are dropped
+        self._generation = 0
+        # Images whose labels changed since take_changed()
+        self._changed = set()
+        dataset.add_label_listener(self._labels_changed)
+
+    @property
+    def busy(self):
+        with self._lock:
+            return bool(self._pending) or bool(self._ready)
+
+    def get(self, idx):
+        """Thumbnail of image ``idx`` if it is in memory, else ``None``."""
+        with self._lock:
+            image = self._memory.get(idx)
+            if image is not None:
+                self._memory.move_to_end(idx)
+            return image
+
+    def request(self, indices):
+        """Queue thumbnails for ``indices`` (first ones first), cancelling
+        queued ones not among them."""
+        wanted = set(indices)
+        with self._lock:
+            dropped = [future for idx, future in self._pending.items() if idx not in wanted]
+        # cancel() runs _forget at once, so not while holding the lock
+        for future in dropped:
+            future.cancel()
+        with self._lock:
+            for idx in indices:
+                if idx in self._memory or idx in self._pending:
+                    continue
+                future = self._executor.submit(self._load, idx, self._generation)
+                self._pending[idx] = future
+                future.add_done_callback(lambda f, idx=idx: self._forget(idx, f))
+
+    def take_ready(self):
+        """Indices whose thumbnails became available since the last call."""
+        with self._lock:
+            ready = list(self._ready)
+            self._ready.clear()
+        return ready
+
+    def invalidate(self, idx):
+        """Forget the in-memory thumbnail of ``idx``, e.g. after its labels
+        were edited; the next request checks the cache key again."""
+        with self._lock:
+            self._memory.pop(idx, None)
+
+    def take_changed(self):
+        """Indices whose labels were written or changed on disk since the
+        last call; their thumbnails have already been forgotten."""
+        with self._lock:
+            changed, self._changed = self._changed, set()
+        return sorted(changed)
+
+    def _labels_changed(self, indices):
+        # Called once the label file is in place, maybe on the writer thread
+        with self._lock:
+            for idx in indices:
+                self._memory.pop(idx, None)
+                self._changed.add(idx)
+
+    def clear(self):
+        """Forget every thumbnail and queued request, e.g. after images were
+        added to or removed from the split and indices moved."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._memory.clear()
+            self._ready.clear()
+            self._generation += 1
+        for future in pending.values():
+            future.cancel()
+
+    def shutdown(self):
+        self.dataset.remove_label_listener(self._labels_changed)
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _forget(self, idx, future):
+        with self._lock:
+            if self._pending.get(idx) is future:
+                del self._pending[idx]
+
+    def _load(self, idx, generation):
+        try:
+            path = self.dataset.image_paths[idx]
+            size, mtime_ns = storage.stat(path)
+            boxes = self.dataset.load_box_array(idx)
+            key = thumbnail_key(path, mtime_ns, size, boxes, self.size)
+            image = self.cache.get(key)
+            if image is None:
+                image = render_thumbnail(path, boxes, self.dataset.image_size(idx), self.size)
+                try:
+                    self.cache.put(key, image)
+                except OSError:
+                    pass  # a full or read-only cache only costs a re-render
+        except Exception:
+            # Unreadable images get a placeholder that is not cached on disk
+            image = placeholder(self.size)
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._memory[idx] = image
+            self._memory.move_to_end(idx)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+            self._ready.append(idx)
@@ -0,0 +1,198 @@
+"""Optional instrumentation of the viewer's hot paths.
+
+Spans are recorded around decoding, label I/O, drawing and inference when
+tracing is enabled with ``--trace`` or the ``ANNOQ_TRACE`` environment
+variable (``1`` or the path to write the trace to). Disabled, a traced call
+costs one attribute lookup.
+
+The recorded spans can be written in Chrome's trace event format, which
+``chrome://tracing`` and https://ui.perfetto.dev open directly. The most
+recent durations of each span are kept for latency percentiles, and peak
+memory is tracked with :mod:`tracemalloc`.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+ENV_VAR = "ANNOQ_TRACE"
+DEFAULT_TRACE_PATH = "annoq-trace.json"
+# Spans kept for export; older ones are dropped
+MAX_EVENTS = 200_000
+# Recent durations per span name used for percentiles
+WINDOW = 500
+
+
+class Tracer:
+    def __init__(self, max_events=MAX_EVENTS, window=WINDOW):
+        self.enabled = False
+        self.memory = False
+        self.path = None
+        self._epoch = time.perf_counter()
+        self._events = deque(maxlen=max_events)
+        self._counters = deque(maxlen=max_events)
+        self._window = window
+        self._recent = {}
+        self._threads = {}
+
+    def enable(self, path=None, memory=True):
+        """Start recording. ``path`` is where :meth:`save` writes to."""
+        self.enabled = True
+        self.path = path
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.memory = memory
+
+    def disable(self):
+        self.enabled = False
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.memory = False
+
+    def clear(self):
+        self._events.clear()
+        self._counters.clear()
+        self._recent.clear()
+
+    def record(self, name, start, end, args=None):
+        """Record a span from ``perf_counter`` times ``start`` to ``end``."""
+        thread = threading.current_thread()
+        self._threads.setdefault(thread.ident, thread.name)
+        self._events.append((name, thread.ident, start, end - start, args))
+        recent = self._recent.get(name)
+        if recent is None:
+            recent = self._recent.setdefault(name, deque(maxlen=self._window))
+        recent.append(end - start)
+
+    def span(self, name, **args):
+        """Context manager timing its body as ``name``."""
+        return _Span(self, name, args or None)
+
+    def sample_memory(self):
+        """Record a memory counter sample; returns ``(current, peak)`` bytes,
+        or ``None`` if memory is not traced."""
+        if not self.memory or not tracemalloc.is_tracing():
+            return None
+        current, peak = tracemalloc.get_traced_memory()
+        self._counters.append((time.perf_counter(), current, peak))
+        return current, peak
+
+    def percentiles(self, name, qs=(50, 95, 99)):
+        """Return the ``qs`` percentiles in seconds of recent ``name`` spans."""
+        values = sorted(self._recent.get(name, ()))
+        if not values:
+            return None
+        return tuple(values[min(len(values) - 1, int(len(values) * q / 100))] for q in qs)
+
+    def summary(self):
+        """Return ``{name: {count, p50_ms, p95_ms, p99_ms, max_ms}}`` over the
+        recent window of each span."""
+        result = {}
+        for name in sorted(self._recent):
+            values = list(self._recent[name])
+            if not values:
+                continue
+            p50, p95, p99 = self.percentiles(name)
+            result[name] = {
+                "count": len(values),
+                "p50_ms": p50 * 1e3,
+                "p95_ms": p95 * 1e3,
+                "p99_ms": p99 * 1e3,
+                "max_ms": max(values) * 1e3,
+            }
+        return result
+
+    def chrome_trace(self):
+        """Return the recorded spans as a Chrome trace event document."""
+        pid = os.getpid()
+
+        def us(t):
+            return (t - self._epoch) * 1e6
+
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in self._threads.items()
+        ]
+        for name, tid, start, duration, args in list(self._events):
+            event = {"name": name, "ph": "X", "pid": pid, "tid": tid, "ts": us(start), "dur": duration * 1e6}
+            if args:
+                event["args"] = args
+            events.append(event)
+        for t, current, peak in list(self._counters):
+            events.append({
+                "name": "memory", "ph": "C", "pid": pid, "ts": us(t),
+                "args": {"current_mb": current / 2**20, "peak_mb": peak / 2**20},
+            })
+        other = {"summary": self.summary()}
+        memory = self.sample_memory()
+        if memory is not None:
+            other["peak_memory_bytes"] = memory[1]
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": other}
+
+    def save(self, path=None):
+        """Write :meth:`chrome_trace` to ``path`` (default: the path given to
+        :meth:`enable`). Returns the path written."""
+        path = path or self.path or DEFAULT_TRACE_PATH
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+        return path
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.tracer.enabled:
+            self.tracer.record(self.name, self.start, time.perf_counter(), self.args)
+        return False
+
+
+TRACER = Tracer()
+
+
+def traced(name):
+    """Decorator recording each call of the function as a span ``name``."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                TRACER.record(name, start, time.perf_counter())
+        return wrapper
+    return decorate
+
+
+def span(name, **args):
+    return TRACER.span(name, **args)
+
+
+def enable_from_env(path=None):
+    """Enable tracing if ``path`` is given or ``$ANNOQ_TRACE`` is set.
+
+    ``ANNOQ_TRACE=1`` writes to :data:`DEFAULT_TRACE_PATH`; any other
+    non-empty value other than ``0`` is used as the trace path. Returns
+    whether tracing is enabled.
+    """
+    value = os.environ.get(ENV_VAR, "")
+    if path is None and value and value != "0":
+        path = DEFAULT_TRACE_PATH if value == "1" else value
+    if path is not None:
+        TRACER.enable(path)
+    return TRACER.enabled
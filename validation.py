@@ -0,0 +1,325 @@
+"""Whole-split checks of YOLO label files and images.
+
+Findings are plain dictionaries so they can be streamed as JSON::
+
+    {"kind": "bad_class_id", "severity": "error", "index": 12,
+     "image": ".../img.jpg", "label": ".../img.txt", "line": 3,
+     "message": "class id 7 is not in [0, 3)"}
+
+``index`` is the image index in the dataset (``None`` for label files that
+have no image) so the viewer can jump to it.
+
+Images are checked by decoding them (JPEGs at 1/8 scale), label files line
+by line and then as a whole for degenerate, duplicate and near-duplicate
+boxes. The findings of each image and its label file are cached in SQLite
+together with the size and ``mtime_ns`` of both files, so validating again
+after edits only re-checks the files that changed.
+"""
+
+import json
+import multiprocessing
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+import storage
+from cache import dataset_cache_dir
+from stats import scan_label_dir
+
+CACHE_NAME = "validation.sqlite"
+# Bump when checks change so cached results are not reused
+VALIDATION_VERSION = 2
+CHUNK_SIZE = 512
+# Below this many files to check a process pool costs more than it saves
+SERIAL_THRESHOLD = 2048
+# Boxes of one class overlapping at least this much are near duplicates
+DUPLICATE_IOU = 0.9
+# IoU values computed at once when comparing the boxes of one label file
+BLOCK_CELLS = 1 << 20
+
+KINDS = {
+    "missing_label": "warning",
+    "orphan_label": "warning",
+    "unreadable_label": "error",
+    "malformed_line": "error",
+    "bad_class_id": "error",
+    "coords_out_of_range": "error",
+    "degenerate_box": "error",
+    "duplicate_box": "warning",
+    "overlapping_box": "warning",
+    "unreadable_image": "error",
+    "truncated_image": "error",
+}
+
+
+def _finding(kind, severity, message, index=None, image=None, label=None, line=None):
+    return {
+        "kind": kind,
+        "severity": severity,
+        "index": index,
+        "image": image,
+        "label": label,
+        "line": line,
+        "message": message,
+    }
+
+
+def check_image_file(path):
+    """Return ``(kind, line, message)`` tuples for an image that cannot be
+    decoded; an empty list if it is fine."""
+    try:
+        img = Image.open(storage.open_file(path, "rb"))
+    except Exception as e:
+        return [("unreadable_image", None, str(e) or type(e).__name__)]
+    try:
+        with img:
+            if img.format == "JPEG":
+                # libjpeg decodes at 1/8 scale; truncation is still detected
+                img.draft("L", (max(1, img.width // 8), max(1, img.height // 8)))
+            img.load()
+    except Exception as e:
+        kind = "truncated_image" if "truncated" in str(e).lower() else "unreadable_image"
+        return [(kind, None, str(e) or type(e).__name__)]
+    return []
+
+
+def pairwise_iou(boxes, others):
+    """IoU matrix between two arrays of ``x1, y1, x2, y2`` box corners."""
+    a = boxes[:, None, :]
+    b = others[None, :, :]
+    iw = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    ih = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = iw * ih
+    area_a = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    area_b = (others[:, 2] - others[:, 0]) * (others[:, 3] - others[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(union > 0, inter / union, 0.0)
+
+
+def box_problems(lines, class_ids, coords, image_size=(0, 0), iou_threshold=DUPLICATE_IOU,
+                 block_cells=BLOCK_CELLS):
+    """Return ``(kind, line, message)`` tuples for degenerate boxes and for
+    boxes repeating an earlier box of the same class in one label file.
+
+    ``coords`` is an ``(n, 4)`` array of ``xc, yc, w, h``; ``image_size``
+    makes boxes narrower than a pixel degenerate too.
+    """
+    problems = []
+    if not len(lines):
+        return problems
+    lines = np.asarray(lines).tolist()
+    class_ids = np.asarray(class_ids)
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 4)
+    xc, yc, w, h = coords.T
+    width, height = image_size
+    degenerate = (w <= 0) | (h <= 0)
+    if width and height:
+        degenerate |= (w * width < 1) | (h * height < 1)
+    for i in np.flatnonzero(degenerate).tolist():
+        problems.append(("degenerate_box", lines[i], "box has no area"))
+
+    corners = np.stack((xc - w / 2, yc - h / 2, xc + w / 2, yc + h / 2), axis=1)
+    n = len(lines)
+    # First earlier box each box repeats exactly or nearly; n if none
+    first_exact = np.full(n, n)
+    first_near = np.full(n, n)
+    # Only boxes of one class are compared, in order of their left edge
+    keep = np.flatnonzero(~degenerate)
+    order = keep[np.lexsort((corners[keep, 0], class_ids[keep]))]
+    sorted_ids = class_ids[order]
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    ends = np.r_[starts[1:], len(order)]
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        if end - start < 2:
+            continue
+        members = order[start:end]
+        left = corners[members, 0]
+        block_rows = max(1, block_cells // len(members))
+        for row in range(0, len(members), block_rows):
+            rows = members[row:row + block_rows]
+            # Boxes starting right of every box in the block overlap none of them
+            stop = int(np.searchsorted(left, corners[rows, 2].max(), "left"))
+            cols = members[row:max(stop, row + len(rows))]
+            exact = (coords[rows][:, None, :] == coords[cols][None, :, :]).all(axis=2)
+            near = pairwise_iou(corners[rows], corners[cols]) >= iou_threshold
+            i, j = np.nonzero(exact | near)
+            a, b = rows[i], cols[j]
+            later, earlier, is_exact = np.maximum(a, b), np.minimum(a, b), exact[i, j]
+            other = a != b
+            np.minimum.at(first_exact, later[other & is_exact], earlier[other & is_exact])
+            np.minimum.at(first_near, later[other & ~is_exact], earlier[other & ~is_exact])
+
+    # Report each box against the first earlier box it repeats
+    for i in np.flatnonzero(first_exact < n).tolist():
+        problems.append(("duplicate_box", lines[i], f"same box as line {lines[first_exact[i]]}"))
+    for i in np.flatnonzero((first_near < n) & (first_exact == n)).tolist():
+        j = int(first_near[i])
+        iou = pairwise_iou(corners[i:i + 1], corners[j:j + 1])[0, 0]
+        problems.append(("overlapping_box", lines[i], f"IoU {iou:.2f} with line {lines[j]} of the same class"))
+    return problems
+
+
+def check_label_file(path, num_classes, image_size=(0, 0)):
+    """Return ``(kind, line, message)`` tuples for problems in one label file."""
+    problems = []
+    lines, class_ids, coords = [], [], []
+    with storage.open_file(path) as f:
+        for lineno, line in enumerate(f, 1):
+            parts = line.split()
+            if not parts:
+                continue
+            if len(parts) != 5:
+                problems.append(("malformed_line", lineno, f"expected 5 fields, got {len(parts)}"))
+                continue
+            try:
+                class_id = int(parts[0])
+                values = [float(v) for v in parts[1:]]
+            except ValueError:
+                problems.append(("malformed_line", lineno, "fields are not numbers"))
+                continue
+            if not 0 <= class_id < num_classes:
+                problems.append(
+                    ("bad_class_id", lineno, f"class id {class_id} is not in [0, {num_classes})")
+                )
+            if not all(0.0 <= v <= 1.0 for v in values):
+                problems.append(("coords_out_of_range", lineno, "coordinates outside [0, 1]"))
+            lines.append(lineno)
+            class_ids.append(class_id)
+            coords.append(values)
+    problems.extend(box_problems(lines, class_ids, coords, image_size))
+    problems.sort(key=lambda p: (p[1] or 0, p[0]))
+    return problems
+
+
+def _check_item(image, label, num_classes, image_size):
+    problems = check_image_file(image)
+    if label is not None:
+        try:
+            problems += check_label_file(label, num_classes, image_size)
+        except OSError as e:
+            problems.append(("unreadable_label", None, str(e)))
+    return problems
+
+
+def _check_chunk(items, num_classes):
+    # items: (name, image, label or None, image size); returns per-item problems
+    return [(name, _check_item(image, label, num_classes, size)) for name, image, label, size in items]
+
+
+class ValidationCache:
+    """Findings per image, keyed by the stats of the image and label file."""
+
+    def __init__(self, path, config):
+        self.path = path
+        # Results computed with other checks or class counts are stale
+        self.config = config
+        self._rows = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "name TEXT PRIMARY KEY, config TEXT, stamp TEXT, problems TEXT)"
+        )
+        return conn
+
+    def get(self, name, stamp):
+        if self._rows is None:
+            conn = self._connect()
+            try:
+                self._rows = {
+                    row[0]: (row[1], row[2], row[3])
+                    for row in conn.execute("SELECT name, config, stamp, problems FROM results")
+                }
+            finally:
+                conn.close()
+        row = self._rows.get(name)
+        if row is None or row[0] != self.config or row[1] != json.dumps(stamp):
+            return None
+        return [tuple(p) for p in json.loads(row[2])]
+
+    def put(self, results):
+        """Store ``(name, stamp, problems)`` rows."""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                    [(name, self.config, json.dumps(stamp), json.dumps(problems)) for name, stamp, problems in results],
+                )
+        finally:
+            conn.close()
+
+
+def validate_split(dataset, workers=None, chunk_size=CHUNK_SIZE, use_cache=True):
+    """Yield findings for every image and label file of ``dataset``."""
+    manifest = dataset.manifest
+    on_disk = scan_label_dir(dataset.label_dir)
+    num_classes = len(dataset.class_names)
+    cache = ValidationCache(
+        os.path.join(dataset_cache_dir(dataset.label_dir), CACHE_NAME),
+        f"{VALIDATION_VERSION}:{num_classes}:{DUPLICATE_IOU}",
+    ) if use_cache else None
+
+    image_labels = set()
+    items = []  # (idx, name, stamp, cached problems or None)
+    stale = []
+    for idx, image in enumerate(dataset.image_paths):
+        label = dataset.label_path(idx)
+        label_name = os.path.basename(label)
+        image_labels.add(label_name)
+        name = manifest.names[idx]
+        stamp = [manifest.sizes[idx], manifest.mtimes[idx], on_disk.get(label_name)]
+        problems = cache.get(name, stamp) if cache is not None else None
+        if problems is None:
+            size = (manifest.widths[idx], manifest.heights[idx])
+            stale.append((name, image, label if label_name in on_disk else None, size))
+        items.append((idx, name, stamp, problems))
+
+    for name in sorted(on_disk):
+        if name not in image_labels:
+            yield _finding(
+                "orphan_label",
+                KINDS["orphan_label"],
+                "label file has no matching image",
+                label=os.path.join(dataset.label_dir, name),
+            )
+
+    chunks = [stale[i:i + chunk_size] for i in range(0, len(stale), chunk_size)]
+    workers = workers or os.cpu_count() or 1
+    pool = None
+    if len(stale) > SERIAL_THRESHOLD and workers > 1:
+        ctx = multiprocessing.get_context("spawn")
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+        results = pool.map(_check_chunk, chunks, [num_classes] * len(chunks))
+    else:
+        results = (_check_chunk(chunk, num_classes) for chunk in chunks)
+    try:
+        checked = iter(())
+        fresh = []
+        for idx, name, stamp, problems in items:
+            if problems is None:
+                result = next(checked, None)
+                if result is None:
+                    if cache is not None and fresh:
+                        cache.put(fresh)
+                    fresh = []
+                    checked = iter(next(results))
+                    result = next(checked)
+                problems = result[1]
+                fresh.append((name, stamp, problems))
+            image = dataset.image_paths[idx]
+            label = dataset.label_path(idx)
+            if stamp[2] is None:
+                yield _finding("missing_label", KINDS["missing_label"], "image has no label file", idx, image, label)
+            for kind, line, message in problems:
+                yield _finding(kind, KINDS[kind], message, idx, image, label, line)
+        if cache is not None and fresh:
+            cache.put(fresh)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
@@ -0,0 +1,292 @@
+"""Notice images and labels changed on disk while a split is open.
+
+A :class:`DatasetWatcher` runs a background thread that collects changes
+to a split's image and label directories made by other programs (a
+capture pipeline adding images, another annotator rewriting labels). The
+Tk thread picks them up with :meth:`DatasetWatcher.take_changes` and
+applies them with :meth:`yolo_dataset.YoloDataset.apply_changes`.
+
+On Linux the directories are watched with inotify, so only the files
+named in events are looked at. Elsewhere, for datasets inside archives
+and when inotify is unavailable, the directory mtimes are polled instead:
+a changed image directory is listed without stat calls and only the new
+names are stat-ed. New images modified within the last interval are
+stat-ed again on each poll and only reported once their size and mtime
+stay the same, so a file still being written is not recorded half done.
+A changed label directory is listed with stats and compared with the
+previous listing, unless its mtime is the one the dataset saw right after
+its own last label write. Then only the files it wrote are taken over
+from :meth:`YoloDataset.written_stamps`, and changes by others in between
+are found by the next full listing. Polling cannot see an image rewritten
+in place under the same name.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+
+import storage
+from manifest import is_image_file, label_name
+
+# Seconds between directory checks when polling, and the longest an
+# inotify read blocks before checking whether to stop
+POLL_INTERVAL = 1.0
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+GONE_MASK = IN_MOVED_FROM | IN_DELETE
+READ_SIZE = 64 * 1024
+
+_EVENT = struct.Struct("iIII")
+
+
+def is_label_file(name):
+    # Temporary files of the label writer start with a dot
+    return name.endswith(".txt") and not name.startswith(".")
+
+
+def _list_names(path):
+    """Names of the files in ``path``, without a stat call per file."""
+    if storage.is_archive_path(path):
+        return set(storage.scandir(path))
+    try:
+        with os.scandir(path) as it:
+            return {entry.name for entry in it}
+    except OSError:
+        return set()
+
+
+def _list_labels(path):
+    return {name: stat for name, stat in storage.scandir(path).items() if is_label_file(name)}
+
+
+def _stat(path):
+    try:
+        return storage.stat(path)
+    except OSError:
+        return None
+
+
+class Inotify:
+    """Minimal ctypes binding of Linux inotify; raises OSError where it is
+    not available."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self._libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        """Watch directory ``path``; returns the watch descriptor."""
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask | IN_ONLYDIR)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+
+    def read(self, timeout):
+        """Return ``(wd, mask, name)`` events, waiting up to ``timeout``
+        seconds for the first one."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+        events = []
+        pos = 0
+        while pos + _EVENT.size <= len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, pos)
+            pos += _EVENT.size
+            name = data[pos:pos + length].rstrip(b"\0")
+            pos += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class DatasetWatcher:
+    """Collect changes to the image and label directories of ``dataset``;
+    see the module docstring. Call :meth:`start` and, when done,
+    :meth:`stop`.
+
+    ``mode`` is ``"inotify"`` or ``"poll"`` once started.
+    """
+
+    def __init__(self, dataset, interval=POLL_INTERVAL, use_inotify=True):
+        self.dataset = dataset
+        self.image_dir = dataset.image_dir
+        self.label_dir = dataset.label_dir
+        self.interval = interval
+        self.use_inotify = use_inotify
+        self.mode = None
+        self._lock = threading.Lock()
+        # image name -> (size, mtime_ns), or None once removed
+        self._images = {}
+        self._labels = set()
+        self._stop = threading.Event()
+        self._thread = None
+        self._inotify = None
+        self._watches = {}
+        # What the split looked like when last checked
+        manifest = dataset.manifest
+        self._image_names = set(manifest.names)
+        # New images seen while polling -> their last stat, until it settles
+        self._settling = {}
+        self._image_mtime = manifest.image_dir_mtime_ns
+        self._label_mtime = manifest.label_dir_mtime_ns
+        self._label_stats = None
+
+    def start(self):
+        if self.use_inotify and not storage.is_archive_path(self.image_dir) \
+                and not storage.is_archive_path(self.label_dir):
+            try:
+                self._inotify = Inotify()
+                for path in {self.image_dir, self.label_dir}:
+                    self._watches[self._inotify.add_watch(path)] = path
+            except OSError:
+                if self._inotify is not None:
+                    self._inotify.close()
+                self._inotify = None
+                self._watches = {}
+        self.mode = "poll" if self._inotify is None else "inotify"
+        self._thread = threading.Thread(target=self._run, name="annoq-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def take_changes(self):
+        """Return and forget ``(images, labels)`` collected so far, in the
+        form :meth:`YoloDataset.apply_changes` takes them."""
+        with self._lock:
+            images, self._images = self._images, {}
+            labels, self._labels = self._labels, set()
+        return images, labels
+
+    # --- collecting -----------------------------------------------------
+
+    def _add(self, images=(), labels=()):
+        with self._lock:
+            self._images.update(images)
+            self._labels.update(labels)
+
+    def _image(self, name):
+        stat = _stat(os.path.join(self.image_dir, name))
+        if stat is None:
+            self._image_names.discard(name)
+        else:
+            self._image_names.add(name)
+        return name, stat
+
+    def poll(self):
+        """Compare the directory mtimes with the last check and collect what
+        changed in the directories whose mtime moved."""
+        self._settle()
+        mtime = storage.dir_mtime_ns(self.image_dir)
+        if mtime != self._image_mtime:
+            self._image_mtime = mtime
+            names = {n for n in _list_names(self.image_dir) if is_image_file(n)}
+            removed = self._image_names - names
+            recent = time.time_ns() - int(self.interval * 1e9)
+            for name, stat in (self._image(n) for n in sorted(names - self._image_names)):
+                if stat is not None and stat[1] >= recent:
+                    # Maybe still being written; filling it in does not
+                    # move the directory mtime
+                    self._settling[name] = stat
+                else:
+                    self._add(images={name: stat})
+            for name in removed:
+                self._settling.pop(name, None)
+            self._add(images={n: None for n in removed})
+            self._image_names -= removed
+        mtime = storage.dir_mtime_ns(self.label_dir)
+        if mtime != self._label_mtime or self._label_stats is None:
+            self._label_mtime = mtime
+            if self._label_stats is not None and mtime == self.dataset.written_dir_mtime():
+                # Only our own saves since the last check
+                for path, stat in self.dataset.written_stamps().items():
+                    self._label_stats[os.path.basename(path)] = stat
+                return
+            found = _list_labels(self.label_dir)
+            if self._label_stats is not None:
+                old = self._label_stats
+                self._add(labels=[n for n in set(old) | set(found) if old.get(n) != found.get(n)])
+            self._label_stats = found
+
+    def _settle(self):
+        # Report new images once their stat stopped changing between polls
+        for name, stat in list(self._settling.items()):
+            now = _stat(os.path.join(self.image_dir, name))
+            if now is None or now == stat:
+                del self._settling[name]
+                if now is not None:
+                    self._add(images={name: now})
+            else:
+                self._settling[name] = now
+
+    def _rescan(self):
+        # Events were lost: compare full listings once
+        names = {n for n in _list_names(self.image_dir) if is_image_file(n)}
+        removed = self._image_names - names
+        self._add(images=[self._image(n) for n in sorted(names - self._image_names)])
+        self._add(images={n: None for n in removed})
+        self._image_names -= removed
+        self._add(labels=set(_list_labels(self.label_dir)) | {label_name(n) for n in self._image_names})
+
+    def _event(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            self._rescan()
+            return
+        if wd not in self._watches or not name:
+            return
+        path = self._watches[wd]
+        if path == self.image_dir and is_image_file(name):
+            if mask & GONE_MASK:
+                self._image_names.discard(name)
+                self._add(images={name: None})
+            else:
+                self._add(images=[self._image(name)])
+        if path == self.label_dir and is_label_file(name):
+            self._add(labels=[name])
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self._inotify is None:
+                    self.poll()
+                    self._stop.wait(self.interval)
+                    continue
+                for wd, mask, name in self._inotify.read(self.interval):
+                    self._event(wd, mask, name)
+            except OSError:
+                # e.g. a directory on a network mount went away for a moment
+                self._stop.wait(self.interval)
@@ -1,16 +1,20 @@
 import os
 import yaml
 
+import storage
+
 class YamlDatasetLoader:
-    def __init__(self, yaml_path):
+    def __init__(self, yaml_path, verbose=True):
+        # Headless callers pass verbose=False to keep stdout machine readable
+        log = print if verbose else (lambda *args: None)
         self.yaml_path = yaml_path
         self.root_dir = os.path.dirname(yaml_path)
-        print(f"file dir: {self.root_dir}")
+        log(f"file dir: {self.root_dir}")
         with open(yaml_path, 'r') as f:
             data = yaml.safe_load(f)
 
         self.class_names = data['names']
-        print(f"class names: {self.class_names}")
+        log(f"class names: {self.class_names}")
         self.datasets = {}
 
         for split in ['train', 'val', 'test']:
@@ -18,14 +22,14 @@ class YamlDatasetLoader:
                 data[split] = data[split].lstrip("/")
                 images_path = os.path.abspath(os.path.join(self.root_dir, data[split]))
                 labels_path = images_path.replace("images", "labels")
-                print(f"datasets:{split} -> {data[split]} / {images_path} / {labels_path}")
-                if os.path.isdir(images_path) and os.path.isdir(labels_path):
-                    print("Adding dataset keys")
+                log(f"datasets:{split} -> {data[split]} / {images_path} / {labels_path}")
+                if storage.isdir(images_path) and storage.isdir(labels_path):
+                    log("Adding dataset keys")
                     self.datasets[split] = {
                         "images": images_path,
                         "labels": labels_path
                     }
-        print(f"datasets: {self.datasets}")
+        log(f"datasets: {self.datasets}")
 
     def get_dataset_splits(self):
         return list(self.datasets.keys())
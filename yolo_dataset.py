@@ -1,44 +1,255 @@
 # yolo_dataset.py
 
+import bisect
 import os
-import glob
-from bounding_box import BoundingBox
+import threading
+import numpy as np
+from box_array import BoxArray
+from class_index import ClassIndex, fingerprint
+from label_pack import LabelPack, moved_rows
+from label_writer import LabelWriter, write_atomic
+from manifest import DatasetManifest, label_name
+import storage
+from stats import StatsEngine
+from tracing import traced
 
 class YoloDataset:
     def __init__(self, image_dir, label_dir, class_names):
         self.image_dir = image_dir
         self.label_dir = label_dir
-        self.image_paths = sorted(glob.glob(os.path.join(image_dir, "*")))
+        # The manifest is cached on disk and only re-listed when the image or
+        # label directory changed since the last launch.
+        self.manifest = DatasetManifest.open(image_dir, label_dir)
+        self.image_paths = self.manifest.image_paths
+        self.label_paths = self.manifest.label_paths
         self.index = 0
         self.class_names = class_names
+        self._stats = None
+        self._writer = None
+        self._pack = None
+        self._class_index = None
+        self._index_lock = threading.Lock()
+        # label path -> (size, mtime_ns) after this dataset last wrote it
+        self._written = {}
+        # Label directory mtime right after this dataset's last label write
+        self._written_dir_mtime = None
+        self._label_listeners = []
 
     def current_image_path(self):
         return self.image_paths[self.index]
 
     def current_label_path(self):
-        base = os.path.splitext(os.path.basename(self.current_image_path()))[0]
-        return os.path.join(self.label_dir, base + ".txt")
-
-    def load_labels(self):
-        boxes = []
-        path = self.current_label_path()
-        if not os.path.exists(path):
-            return boxes
-        with open(path) as f:
-            for line in f:
-                parts = line.strip().split()
-                if len(parts) != 5:
-                    continue
-                class_id = int(parts[0])
-                xc, yc, w, h = map(float, parts[1:])
-                name = self.class_names[class_id] if class_id < len(self.class_names) else str(class_id)
-                boxes.append(BoundingBox(class_id, xc, yc, w, h, name))
-        return boxes
-
-    def save_labels(self, boxes):
-        with open(self.current_label_path(), "w") as f:
-            for box in boxes:
-                f.write(box.to_yolo_format() + "\n")
+        return self.label_path(self.index)
+
+    def label_path(self, idx):
+        return self.label_paths[idx]
+
+    def has_label(self, idx):
+        return self.manifest.has_label[idx]
+
+    def image_size(self, idx):
+        """Pixel ``(width, height)`` from the manifest, ``(0, 0)`` if unknown."""
+        return self.manifest.widths[idx], self.manifest.heights[idx]
+
+    @traced("load_labels")
+    def load_labels(self, idx=None):
+        """Parse the label file of image ``idx`` (the current image by
+        default) into :class:`BoundingBox` objects. Passing an explicit index
+        does not touch ``self.index``, so this can be called from worker
+        threads."""
+        return self.load_box_array(idx).to_boxes(self.class_names)
+
+    @traced("load_box_array")
+    def load_box_array(self, idx=None):
+        """Like :meth:`load_labels` but returns a columnar :class:`BoxArray`.
+
+        Once :meth:`label_pack` has been opened this is a slice of the pack
+        rather than a file read.
+        """
+        path = self.current_label_path() if idx is None else self.label_path(idx)
+        pending = self.pending_labels(idx)
+        if pending is not None:
+            return BoxArray.from_yolo_text(pending)
+        if self._pack is not None:
+            return self._pack.boxes(self.index if idx is None else idx)
+        if not storage.exists(path):
+            return BoxArray()
+        return BoxArray.from_file(path)
+
+    @staticmethod
+    def format_labels(boxes):
+        """Return the YOLO label text for a list of boxes or a :class:`BoxArray`."""
+        if isinstance(boxes, BoxArray):
+            return boxes.to_yolo_text()
+        return "".join(box.to_yolo_format() + "\n" for box in boxes)
+
+    @traced("save_labels")
+    def save_labels(self, boxes, idx=None, background=False):
+        """Write ``boxes`` (a list of boxes, a :class:`BoxArray` or label text)
+        to the label file of image ``idx`` (the current image by default).
+
+        The file is replaced atomically. With ``background=True`` the write is
+        queued to the dataset's label writer and this returns immediately;
+        reads through this dataset see the new labels straight away.
+        """
+        if idx is None:
+            idx = self.index
+        text = boxes if isinstance(boxes, str) else self.format_labels(boxes)
+        path = self.label_path(idx)
+        self.manifest.has_label[idx] = True
+        if background:
+            self.label_writer().write(path, text)
+            return
+        write_atomic(path, text)
+        self._label_written(path)
+
+    def reload_box_array(self, idx=None):
+        """Like :meth:`load_box_array`, but re-reads a label file that may
+        have been changed by another program."""
+        if self._pack is not None:
+            self._pack.refresh(self.index if idx is None else idx)
+        return self.load_box_array(idx)
+
+    def label_writer(self):
+        """Return the split's background :class:`LabelWriter`, creating it on
+        first use."""
+        if self._writer is None:
+            self._writer = LabelWriter(on_written=self._label_written)
+        return self._writer
+
+    def pending_labels(self, idx=None):
+        """Return label text queued but not yet written for image ``idx``."""
+        if self._writer is None:
+            return None
+        return self._writer.pending(self.current_label_path() if idx is None else self.label_path(idx))
+
+    def flush_labels(self):
+        """Wait for queued label writes; return ``(path, error)`` failures."""
+        if self._writer is None:
+            return []
+        self._writer.flush()
+        return self._writer.take_errors()
+
+    def label_write_errors(self):
+        """Return and forget ``(path, error)`` failures of background writes."""
+        if self._writer is None:
+            return []
+        return self._writer.take_errors()
+
+    def label_stamp(self, idx=None):
+        """``(size, mtime_ns)`` of the label file of image ``idx`` (the
+        current image by default), ``None`` if there is none."""
+        try:
+            return storage.stat(self.current_label_path() if idx is None else self.label_path(idx))
+        except OSError:
+            return None
+
+    def written_stamp(self, path):
+        """:meth:`label_stamp` of ``path`` right after this dataset last
+        wrote it, ``None`` if it never did."""
+        return self._written.get(path)
+
+    def written_stamps(self):
+        """``{label path: written_stamp}`` of every label file written here."""
+        return dict(self._written)
+
+    def written_dir_mtime(self):
+        """mtime of the label directory right after this dataset last wrote a
+        label file, ``None`` if it never did. A directory still at this
+        mtime has only changed by those writes, unless another program
+        wrote in the same instant."""
+        return self._written_dir_mtime
+
+    def apply_changes(self, images=None, labels=()):
+        """Bring the split up to date with files changed by other programs,
+        as reported by a :class:`watcher.DatasetWatcher`.
+
+        ``images`` maps image file names to their ``(size, mtime_ns)``, or to
+        ``None`` if they were removed; ``labels`` holds the names of label
+        files that were created, rewritten or removed. The current image
+        stays current if it still exists, otherwise the one now at its
+        position is. Returns a summary with the number of images ``added``
+        and ``removed``, the ``labels`` changed by someone else and the
+        ``rows`` the images moved from (see :func:`label_pack.moved_rows`),
+        ``None`` if no image was added or removed.
+        """
+        manifest = self.manifest
+        current = manifest.names[self.index] if manifest.names else None
+        added, removed = manifest.update_images(images or {})
+        rows = None
+        if added or removed:
+            idx = manifest.index_of(current) if current is not None else None
+            if idx is None:
+                idx = bisect.bisect_left(manifest.names, current) if current is not None else 0
+            self.index = max(0, min(idx, len(manifest.names) - 1))
+            with self._index_lock:
+                if self._pack is None:
+                    rows = moved_rows(manifest.names, added, removed)
+                else:
+                    rows = self._pack.reindex(manifest.names, added, removed)
+                if self._class_index is not None:
+                    self._class_index.reindex(rows)
+                    for idx in np.flatnonzero(rows < 0).tolist():
+                        self._class_index.update(idx, self._pack.boxes(idx).class_ids)
+            if self._stats is not None:
+                self._stats.images_changed(added, removed)
+                for name in added:
+                    self._stats.refresh(os.path.join(self.label_dir, label_name(name)))
+        changed = []
+        for name in sorted(set(labels)):
+            path = os.path.join(self.label_dir, name)
+            try:
+                stamp = storage.stat(path)
+            except OSError:
+                stamp = None
+            manifest.set_label(name, stamp is not None)
+            own = self._writer is not None and self._writer.pending(path) is not None
+            if own or (stamp is not None and stamp == self._written.get(path)):
+                continue  # our own save, re-read once it is written
+            changed.append(name)
+            self._label_changed(path)
+        return {"added": len(added), "removed": len(removed), "labels": changed, "rows": rows}
+
+    def _label_written(self, path):
+        try:
+            self._written[path] = storage.stat(path)
+        except OSError:
+            self._written.pop(path, None)
+        self._written_dir_mtime = storage.dir_mtime_ns(self.label_dir)
+        self._label_changed(path)
+
+    def add_label_listener(self, callback):
+        """Call ``callback(indices)`` whenever the label file of images
+        ``indices`` was written here or changed on disk. It may be called
+        from the label writer's thread."""
+        self._label_listeners.append(callback)
+
+    def remove_label_listener(self, callback):
+        if callback in self._label_listeners:
+            self._label_listeners.remove(callback)
+
+    def _label_changed(self, path):
+        for callback in list(self._label_listeners):
+            callback(self.manifest.indices_for_label(os.path.basename(path)))
+        if self._stats is not None:
+            self._stats.refresh(path)
+        if self._pack is not None:
+            self._pack.refresh_path(path)
+            if self._class_index is not None:
+                for idx in self._pack.indices_for_label(path):
+                    self._class_index.update(idx, self._pack.boxes(idx).class_ids)
+
+    def sync(self):
+        """Wait for queued label writes and persist the label pack.
+
+        Returns ``(path, error)`` pairs of failed writes.
+        """
+        errors = self.flush_labels()
+        if self._pack is not None:
+            self._pack.save()
+            if self._class_index is not None and self._class_index.dirty:
+                self._class_index.save(fingerprint(self._pack))
+        return errors
 
     def next(self):
         if self.index < len(self.image_paths) - 1:
@@ -58,47 +269,35 @@ class YoloDataset:
     def total_images(self):
         return len(self.image_paths)
 
+    def label_pack(self, workers=None):
+        """Return the split's :class:`LabelPack`, opening (and if needed
+        building) it on first use."""
+        if self._pack is None:
+            self._pack = LabelPack.open(self.manifest, workers=workers)
+        return self._pack
+
+    def class_index(self, workers=None):
+        """Return the split's :class:`ClassIndex`, opening the label pack
+        and loading (or building) the index on first use. Safe to call from
+        a background thread."""
+        with self._index_lock:
+            if self._class_index is None:
+                self._class_index = ClassIndex.open(self.label_pack(workers))
+            return self._class_index
+
+    def stats_engine(self):
+        """Return the split's :class:`StatsEngine`, creating it on first use."""
+        if self._stats is None:
+            self._stats = StatsEngine(self)
+        return self._stats
+
     def compute_stats(self):
         """Compute basic dataset statistics.
 
         Returns a dictionary with the total number of images, a mapping of
         class names to their occurrence counts, and the number of images that
-        contain no annotations (background images).
+        contain no annotations (background images). Per-file results are
+        cached on disk, so only label files changed since the last call are
+        read again.
         """
-        class_counts = {name: 0 for name in self.class_names}
-        background_images = 0
-
-        for img_path in self.image_paths:
-            base = os.path.splitext(os.path.basename(img_path))[0]
-            label_path = os.path.join(self.label_dir, base + ".txt")
-            if not os.path.exists(label_path):
-                background_images += 1
-                continue
-
-            with open(label_path) as f:
-                lines = [line.strip() for line in f if line.strip()]
-
-            if not lines:
-                background_images += 1
-
-            for line in lines:
-                parts = line.split()
-                if len(parts) != 5:
-                    continue
-                try:
-                    class_id = int(parts[0])
-                except ValueError:
-                    continue
-                if class_id < len(self.class_names):
-                    name = self.class_names[class_id]
-                else:
-                    name = str(class_id)
-                    if name not in class_counts:
-                        class_counts[name] = 0
-                class_counts[name] += 1
-
-        return {
-            "total_images": len(self.image_paths),
-            "class_counts": class_counts,
-            "background_images": background_images,
-        }
+        return self.stats_engine().compute()